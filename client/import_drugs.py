@@ -0,0 +1,113 @@
+"""
+Bulk catalog import over the ImportDrugs client-streaming RPC.
+Reads CSV (with a header row) or NDJSON one row at a time, so the file is
+never held in memory, and streams it to the server in chunks.
+
+Usage: python import_drugs.py catalog.csv [--host localhost] [--port 8080]
+       python import_drugs.py catalog.ndjson --chunk-rows 1000
+
+Columns / keys: name, quantity, price, expiry_date, category
+"""
+import argparse
+import csv
+import grpc
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../proto'))
+import pharmacy_pb2
+import pharmacy_pb2_grpc
+
+class Progress:
+    def __init__(self, total_bytes):
+        self.total_bytes = total_bytes
+        self.bytes_read = 0
+        self.rows_sent = 0
+        self.rows_skipped = 0
+        self.start = time.time()
+
+    def report(self, final=False):
+        elapsed = time.time() - self.start
+        pct = 100 * self.bytes_read / self.total_bytes if self.total_bytes else 100
+        rate = self.rows_sent / elapsed if elapsed > 0 else 0
+        end = "\n" if final else ""
+        print(f"\r  📤 {self.rows_sent} rows sent ({pct:5.1f}%, {rate:,.0f} rows/s, "
+              f"{self.rows_skipped} unparseable)", end=end, flush=True)
+
+def read_lines(path, progress):
+    # Binary read so progress can be tracked in bytes against the file size
+    with open(path, "rb") as f:
+        for raw in f:
+            progress.bytes_read += len(raw)
+            yield raw.decode("utf-8")
+
+def read_records(path, fmt, progress):
+    """CSV rows as dicts; NDJSON lines unparsed, so a bad line only skips that row."""
+    lines = read_lines(path, progress)
+    if fmt == "csv":
+        yield from csv.DictReader(lines)
+    else:
+        for line in lines:
+            if line.strip():
+                yield line
+
+def to_request(record):
+    if isinstance(record, str):
+        record = json.loads(record)
+    # JSON null and the missing cells of a short CSV row both come back as None
+    if record["name"] is None:
+        raise ValueError("missing name")
+    return pharmacy_pb2.AddDrugRequest(
+        name=str(record["name"]),
+        quantity=int(record.get("quantity") or 0),
+        price=float(record.get("price") or 0.0),
+        expiry_date=str(record.get("expiry_date") or ""),
+        category=str(record.get("category") or ""),
+    )
+
+def chunks(path, fmt, chunk_rows, progress):
+    batch = []
+    for row, record in enumerate(read_records(path, fmt, progress), 1):
+        try:
+            batch.append(to_request(record))
+        except (KeyError, TypeError, ValueError) as e:
+            progress.rows_skipped += 1
+            print(f"\n  ⚠️  Skipping unparseable row {row}: {e}")
+            continue
+        if len(batch) >= chunk_rows:
+            progress.rows_sent += len(batch)
+            progress.report()
+            yield pharmacy_pb2.ImportDrugsChunk(drugs=batch)
+            batch = []
+    if batch:
+        progress.rows_sent += len(batch)
+        yield pharmacy_pb2.ImportDrugsChunk(drugs=batch)
+    progress.report(final=True)
+
+def import_file(path, host="localhost", port="8080", fmt=None, chunk_rows=500):
+    fmt = fmt or ("ndjson" if path.endswith((".ndjson", ".jsonl")) else "csv")
+    progress = Progress(os.path.getsize(path))
+    channel = grpc.insecure_channel(f"{host}:{port}")
+    stub = pharmacy_pb2_grpc.PharmacyServiceStub(channel)
+    print(f"📦 Importing {path} ({fmt}) to {host}:{port} in chunks of {chunk_rows} rows")
+    resp = stub.ImportDrugs(chunks(path, fmt, chunk_rows, progress))
+    channel.close()
+    icon = "✅" if resp.success else "❌"
+    print(f"  {icon} {resp.message}")
+    print(f"     received={resp.rows_received} imported={resp.rows_imported} rejected={resp.rows_rejected}")
+    for err in resp.errors:
+        print(f"     row {err.row}: {err.message}")
+    return resp
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream a drug catalog into the pharmacy service")
+    parser.add_argument("path", help="CSV (with header) or NDJSON file")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", default="8080")
+    parser.add_argument("--format", choices=("csv", "ndjson"), help="default: from the file extension")
+    parser.add_argument("--chunk-rows", type=int, default=500, help="rows per ImportDrugsChunk message")
+    args = parser.parse_args()
+    resp = import_file(args.path, args.host, args.port, args.format, args.chunk_rows)
+    sys.exit(0 if resp.success else 1)
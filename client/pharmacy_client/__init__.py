@@ -0,0 +1,24 @@
+"""
+Python client for the pharmacy gRPC API.
+PharmacyClient keeps a small pool of channels per API server, gives every
+call a deadline, retries idempotent calls on UNAVAILABLE with jittered
+backoff, hedges GetDrug reads, and can balance calls directly across the API
+servers (round robin or least loaded) instead of going through NGINX.
+
+    from pharmacy_client import PharmacyClient
+
+    with PharmacyClient(["api-server-a:50051", "api-server-b:50051"], balancing="least_loaded") as client:
+        drug = client.get_drug(42).drug
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../proto'))
+
+from .balancing import BALANCERS, Endpoint, LeastLoaded, RoundRobin
+from .client import DEFAULT_TARGETS, DEFAULT_TIMEOUT, PharmacyClient, backoff
+
+__all__ = [
+    "BALANCERS", "DEFAULT_TARGETS", "DEFAULT_TIMEOUT", "Endpoint", "LeastLoaded", "PharmacyClient",
+    "RoundRobin", "backoff",
+]
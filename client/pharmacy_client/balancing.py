@@ -0,0 +1,82 @@
+"""
+Client-side load balancing over a fixed list of API servers.
+Each Endpoint holds a few channels to one server and counts the calls it has
+in flight. A balancer picks the endpoint for every call, passing over
+servers that recently answered UNAVAILABLE while another one is available.
+"""
+import itertools
+import threading
+import time
+
+import grpc
+
+import pharmacy_pb2_grpc
+
+CHANNEL_OPTIONS = (
+    # A local subchannel pool makes each channel its own TCP connection;
+    # otherwise channels to the same target share one.
+    ("grpc.use_local_subchannel_pool", 1),
+    ("grpc.keepalive_time_ms", 30000),
+    ("grpc.keepalive_timeout_ms", 10000),
+    # PharmacyClient retries itself, across endpoints and with backoff
+    ("grpc.enable_retries", 0),
+)
+
+class Endpoint:
+    def __init__(self, target, channels=2, options=CHANNEL_OPTIONS):
+        self.target = target
+        self.channels = [grpc.insecure_channel(target, options=options) for _ in range(max(1, channels))]
+        self.stubs = [pharmacy_pb2_grpc.PharmacyServiceStub(c) for c in self.channels]
+        self.in_flight = 0
+        self.ejected_until = 0.0
+        self._next = itertools.count()
+
+    def stub(self):
+        return self.stubs[next(self._next) % len(self.stubs)]
+
+    def close(self):
+        for channel in self.channels:
+            channel.close()
+
+class Balancer:
+    """Hands out endpoints and tracks their in-flight calls; subclasses choose()."""
+
+    def __init__(self, endpoints, eject_seconds):
+        if not endpoints:
+            raise ValueError("At least one target is required")
+        self.endpoints = endpoints
+        self.eject_seconds = eject_seconds
+        self._lock = threading.Lock()
+        self._turn = 0
+
+    def acquire(self, exclude=None):
+        """The endpoint for one call, other than ``exclude`` if possible; pair with release()."""
+        with self._lock:
+            now = time.monotonic()
+            others = [e for e in self.endpoints if e is not exclude] or self.endpoints
+            endpoint = self.choose([e for e in others if e.ejected_until <= now] or others)
+            endpoint.in_flight += 1
+            return endpoint
+
+    def release(self, endpoint, code=None):
+        with self._lock:
+            endpoint.in_flight -= 1
+            if code == grpc.StatusCode.UNAVAILABLE:
+                endpoint.ejected_until = time.monotonic() + self.eject_seconds
+
+    def choose(self, candidates):
+        raise NotImplementedError
+
+class RoundRobin(Balancer):
+    def choose(self, candidates):
+        self._turn += 1
+        return candidates[self._turn % len(candidates)]
+
+class LeastLoaded(Balancer):
+    def choose(self, candidates):
+        # Start the scan at a rotating offset so ties don't always go to the first server
+        self._turn += 1
+        n = len(candidates)
+        return min((candidates[(self._turn + i) % n] for i in range(n)), key=lambda e: e.in_flight)
+
+BALANCERS = {"round_robin": RoundRobin, "least_loaded": LeastLoaded}
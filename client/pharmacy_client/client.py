@@ -0,0 +1,284 @@
+"""
+PharmacyClient: the single-drug, list and batch RPCs as methods, each with a
+deadline (``timeout`` seconds, covering every attempt). Idempotent calls are
+retried on UNAVAILABLE, on another endpoint when there is one, after a
+full-jitter exponential backoff. AddDrug, BatchAddDrugs, AdjustStock without
+an idempotency key and the streaming calls are never retried, nor is
+DeleteDrug: if the first attempt committed but its reply was lost, a retry
+would report "Drug not found" for a delete that worked. GetDrug is
+hedged: if no answer has come back after ``hedge_delay`` seconds, a second
+copy goes to another endpoint and the first good answer wins.
+
+With ``read_your_writes=True`` the client keeps the newest commit LSN its
+writes returned and sends it with every read, so a replica only serves the
+read once it has caught up (see "Read/Write Splitting" in the README).
+"""
+import collections
+import itertools
+import queue
+import random
+import threading
+import time
+
+import grpc
+
+import pharmacy_pb2
+
+from .balancing import BALANCERS, Endpoint
+
+DEFAULT_TARGETS = ("localhost:8080",)
+DEFAULT_TIMEOUT = 5.0
+STREAM_TIMEOUT = 300.0
+MAX_ATTEMPTS = 3
+BACKOFF_BASE = 0.05
+BACKOFF_MAX = 1.0
+HEDGE_DELAY = 0.05
+# How long an endpoint that answered UNAVAILABLE is passed over
+EJECT_SECONDS = 2.0
+RETRYABLE_CODES = (grpc.StatusCode.UNAVAILABLE,)
+LSN_METADATA_KEY = "x-lsn"
+MIN_LSN_METADATA_KEY = "x-min-lsn"
+
+def backoff(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX, rng=random):
+    """Seconds to sleep before retry number ``attempt`` (1 = first retry)."""
+    return rng.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+def lsn_value(text):
+    hi, _, lo = text.partition("/")
+    return (int(hi, 16) << 32) | int(lo, 16)
+
+class PharmacyClient:
+    """Thread-safe; share one instance. ``targets`` is a list or a comma-separated string."""
+
+    def __init__(self, targets=DEFAULT_TARGETS, balancing="round_robin", channels_per_target=2,
+                 timeout=DEFAULT_TIMEOUT, max_attempts=MAX_ATTEMPTS, backoff_base=BACKOFF_BASE,
+                 backoff_max=BACKOFF_MAX, hedge_delay=HEDGE_DELAY, read_your_writes=False,
+                 eject_seconds=EJECT_SECONDS):
+        if isinstance(targets, str):
+            targets = [t.strip() for t in targets.split(",") if t.strip()]
+        if balancing not in BALANCERS:
+            raise ValueError(f"Unknown balancing '{balancing}' (expected one of {', '.join(BALANCERS)})")
+        self.balancer = BALANCERS[balancing]([Endpoint(t, channels_per_target) for t in targets], eject_seconds)
+        self.timeout = timeout
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_delay = hedge_delay
+        self.read_your_writes = read_your_writes
+        self._lock = threading.Lock()
+        self._lsn = None
+        self._counts = collections.Counter()
+
+    def close(self):
+        for endpoint in self.balancer.endpoints:
+            endpoint.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def stats(self):
+        """Calls, retries, hedges sent and hedges that answered first, plus in-flight calls per target."""
+        with self._lock:
+            counts = dict(self._counts)
+        counts["in_flight"] = {e.target: e.in_flight for e in self.balancer.endpoints}
+        return counts
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    # ─── Read-your-writes ─────────────────────────────────────────────────────
+
+    def _remember_lsn(self, call):
+        lsn = dict(call.trailing_metadata() or ()).get(LSN_METADATA_KEY)
+        if not lsn:
+            return
+        with self._lock:
+            if self._lsn is None or lsn_value(lsn) > lsn_value(self._lsn):
+                self._lsn = lsn
+
+    def _read_metadata(self, metadata):
+        if not self.read_your_writes or self._lsn is None:
+            return metadata
+        return tuple(metadata or ()) + ((MIN_LSN_METADATA_KEY, self._lsn),)
+
+    # ─── Calls ────────────────────────────────────────────────────────────────
+
+    def _deadline(self, timeout):
+        return time.monotonic() + (self.timeout if timeout is None else timeout)
+
+    def _unary(self, method, request, timeout, metadata, retry=True, write=False):
+        deadline = self._deadline(timeout)
+        if not write:
+            metadata = self._read_metadata(metadata)
+        endpoint = None
+        for attempt in itertools.count(1):
+            endpoint = self.balancer.acquire(exclude=endpoint)
+            self._count("calls")
+            error = None
+            try:
+                response, call = getattr(endpoint.stub(), method).with_call(
+                    request, timeout=max(deadline - time.monotonic(), 0), metadata=metadata)
+            except grpc.RpcError as e:
+                error = e
+            finally:
+                self.balancer.release(endpoint, error.code() if error is not None else None)
+            if error is None:
+                if write and self.read_your_writes:
+                    self._remember_lsn(call)
+                return response
+            delay = backoff(attempt, self.backoff_base, self.backoff_max)
+            if (not retry or error.code() not in RETRYABLE_CODES or attempt >= self.max_attempts
+                    or time.monotonic() + delay >= deadline):
+                raise error
+            self._count("retries")
+            time.sleep(delay)
+
+    def _hedged(self, method, request, timeout, metadata):
+        if not self.hedge_delay:
+            return self._unary(method, request, timeout, metadata)
+        deadline = self._deadline(timeout)
+        metadata = self._read_metadata(metadata)
+        finished = queue.Queue()
+        calls = []
+
+        def send(exclude=None):
+            endpoint = self.balancer.acquire(exclude)
+            self._count("calls")
+            future = getattr(endpoint.stub(), method).future(
+                request, timeout=max(deadline - time.monotonic(), 0), metadata=metadata)
+            def done(f, endpoint=endpoint):
+                self.balancer.release(endpoint, f.code())
+                finished.put(f)
+            future.add_done_callback(done)
+            calls.append((endpoint, future))
+
+        send()
+        pending, hedged = 1, False
+        try:
+            while True:
+                try:
+                    future = finished.get(timeout=None if hedged else self.hedge_delay)
+                except queue.Empty:
+                    future = None
+                if future is not None:
+                    pending -= 1
+                    if future.exception() is None:
+                        if future is not calls[0][1]:
+                            self._count("hedge_wins")
+                        return future.result()
+                    if pending:
+                        continue
+                    if hedged or future.code() not in RETRYABLE_CODES:
+                        return future.result()
+                # No answer within hedge_delay, or the first copy failed
+                # retryably before the hedge was sent: send it now.
+                self._count("hedges")
+                hedged = True
+                pending += 1
+                send(exclude=calls[0][0])
+        finally:
+            for _, future in calls:
+                future.cancel()
+
+    def future(self, method, request, timeout=None, metadata=None):
+        """One balanced attempt of unary ``method`` as a grpc future (no retries or hedging)."""
+        endpoint = self.balancer.acquire()
+        self._count("calls")
+        future = getattr(endpoint.stub(), method).future(
+            request, timeout=self.timeout if timeout is None else timeout, metadata=metadata)
+        future.add_done_callback(lambda f: self.balancer.release(endpoint, f.code()))
+        return future
+
+    def call(self, method, request, timeout=None, metadata=None, retry=False):
+        """Any other unary RPC by name, e.g. call("Profile", ProfileRequest(...))."""
+        return self._unary(method, request, timeout, metadata, retry=retry, write=True)
+
+    def _stream(self, method, request, timeout, metadata):
+        endpoint = self.balancer.acquire()
+        self._count("calls")
+        code = None
+        try:
+            yield from getattr(endpoint.stub(), method)(
+                request, timeout=STREAM_TIMEOUT if timeout is None else timeout, metadata=metadata)
+        except grpc.RpcError as e:
+            code = e.code()
+            raise
+        finally:
+            self.balancer.release(endpoint, code)
+
+    # ─── RPCs ─────────────────────────────────────────────────────────────────
+
+    def add_drug(self, name, quantity, price, expiry_date="", category="", timeout=None, metadata=None):
+        request = pharmacy_pb2.AddDrugRequest(name=name, quantity=quantity, price=price,
+                                              expiry_date=expiry_date, category=category)
+        return self._unary("AddDrug", request, timeout, metadata, retry=False, write=True)
+
+    def get_drug(self, drug_id, timeout=None, metadata=None):
+        return self._hedged("GetDrug", pharmacy_pb2.GetDrugRequest(id=drug_id), timeout, metadata)
+
+    def update_stock(self, drug_id, quantity, timeout=None, metadata=None):
+        request = pharmacy_pb2.UpdateStockRequest(id=drug_id, quantity=quantity)
+        return self._unary("UpdateStock", request, timeout, metadata, write=True)
+
+    def adjust_stock(self, drug_id, delta, idempotency_key="", timeout=None, metadata=None):
+        """Retried only with an ``idempotency_key``, which makes a repeat a no-op."""
+        request = pharmacy_pb2.AdjustStockRequest(id=drug_id, delta=delta, idempotency_key=idempotency_key)
+        return self._unary("AdjustStock", request, timeout, metadata, retry=bool(idempotency_key), write=True)
+
+    def delete_drug(self, drug_id, timeout=None, metadata=None):
+        request = pharmacy_pb2.DeleteDrugRequest(id=drug_id)
+        return self._unary("DeleteDrug", request, timeout, metadata, retry=False, write=True)
+
+    def list_drugs(self, timeout=None, metadata=None, **fields):
+        return self._unary("ListDrugs", pharmacy_pb2.ListDrugsRequest(**fields), timeout, metadata)
+
+    def get_low_stock(self, threshold, timeout=None, metadata=None, **fields):
+        request = pharmacy_pb2.LowStockRequest(threshold=threshold, **fields)
+        return self._unary("GetLowStock", request, timeout, metadata)
+
+    def get_expiring_drugs(self, within_days, timeout=None, metadata=None, **fields):
+        request = pharmacy_pb2.ExpiringDrugsRequest(within_days=within_days, **fields)
+        return self._unary("GetExpiringDrugs", request, timeout, metadata)
+
+    def search_drugs(self, query, limit=0, timeout=None, metadata=None):
+        request = pharmacy_pb2.SearchDrugsRequest(query=query, limit=limit)
+        return self._unary("SearchDrugs", request, timeout, metadata)
+
+    def stream_drugs(self, timeout=None, metadata=None, **fields):
+        """Iterator of ListDrugsResponse batches; ``timeout`` bounds the whole stream."""
+        request = pharmacy_pb2.StreamDrugsRequest(**fields)
+        return self._stream("StreamDrugs", request, timeout, self._read_metadata(metadata))
+
+    def batch_add_drugs(self, drugs, timeout=None, metadata=None):
+        """``drugs``: AddDrugRequest messages or dicts of their fields."""
+        request = pharmacy_pb2.BatchAddDrugsRequest(
+            drugs=[d if isinstance(d, pharmacy_pb2.AddDrugRequest) else pharmacy_pb2.AddDrugRequest(**d)
+                   for d in drugs])
+        return self._unary("BatchAddDrugs", request, timeout, metadata, retry=False, write=True)
+
+    def batch_update_stock(self, updates, timeout=None, metadata=None):
+        """``updates``: {drug_id: quantity} or UpdateStockRequest messages."""
+        if isinstance(updates, dict):
+            updates = [pharmacy_pb2.UpdateStockRequest(id=i, quantity=q) for i, q in updates.items()]
+        request = pharmacy_pb2.BatchUpdateStockRequest(updates=updates)
+        return self._unary("BatchUpdateStock", request, timeout, metadata, write=True)
+
+    def import_drugs(self, chunks, timeout=STREAM_TIMEOUT, metadata=None):
+        """Streams ImportDrugsChunk messages from ``chunks``; not retried."""
+        endpoint = self.balancer.acquire()
+        self._count("calls")
+        code = None
+        try:
+            response, call = endpoint.stub().ImportDrugs.with_call(chunks, timeout=timeout, metadata=metadata)
+        except grpc.RpcError as e:
+            code = e.code()
+            raise
+        finally:
+            self.balancer.release(endpoint, code)
+        if self.read_your_writes:
+            self._remember_lsn(call)
+        return response
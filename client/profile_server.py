@@ -0,0 +1,55 @@
+"""
+Profile a running server without restarting it: asks the gRPC Profile RPC
+(or the monolith's POST /admin/profile) to sample its stacks for --seconds
+and writes the collapsed stacks to --out, ready for flamegraph.pl or
+https://www.speedscope.app.
+
+Usage: python profile_server.py --seconds 10 --token $ADMIN_TOKEN
+       python profile_server.py --target rest --host localhost --port 9000 --out mono.folded
+       flamegraph.pl profile.folded > profile.svg
+
+Point --port at one API server (50051, 50052) rather than NGINX, which would
+pick one for you.
+"""
+import argparse
+import grpc
+import os
+import requests
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../proto'))
+import pharmacy_pb2
+import pharmacy_pb2_grpc
+
+def profile_grpc(host, port, seconds, interval_ms, token):
+    channel = grpc.insecure_channel(f"{host}:{port}")
+    stub = pharmacy_pb2_grpc.PharmacyServiceStub(channel)
+    resp = stub.Profile(pharmacy_pb2.ProfileRequest(seconds=seconds, interval_ms=interval_ms),
+                        metadata=(("x-admin-token", token),), timeout=seconds + 30)
+    channel.close()
+    return resp.collapsed_stacks, resp.samples
+
+def profile_rest(host, port, seconds, interval_ms, token):
+    resp = requests.post(f"http://{host}:{port}/admin/profile",
+                         params={"seconds": seconds, "interval_ms": interval_ms},
+                         headers={"X-Admin-Token": token}, timeout=seconds + 30)
+    resp.raise_for_status()
+    return resp.text, int(resp.headers.get("X-Profile-Samples", 0))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch a sampling profile from a running server")
+    parser.add_argument("--target", choices=("grpc", "rest"), default="grpc")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", default=None, help="default 50051 (grpc) or 9000 (rest)")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--interval-ms", type=int, default=10)
+    parser.add_argument("--token", default=os.environ.get("ADMIN_TOKEN", ""))
+    parser.add_argument("--out", default="profile.folded")
+    args = parser.parse_args()
+    fetch = profile_grpc if args.target == "grpc" else profile_rest
+    port = args.port or ("50051" if args.target == "grpc" else "9000")
+    print(f"Profiling {args.target} {args.host}:{port} for {args.seconds:g}s...")
+    stacks, samples = fetch(args.host, port, args.seconds, args.interval_ms, args.token)
+    with open(args.out, "w") as f:
+        f.write(stacks)
+    print(f"✅ {samples} samples, {len(stacks.splitlines())} distinct stacks -> {args.out}")
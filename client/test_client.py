@@ -1,14 +1,12 @@
-import grpc
 import sys
-import os
+import uuid
 
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../proto'))
-import pharmacy_pb2
-import pharmacy_pb2_grpc
+from pharmacy_client import PharmacyClient
 
 def run(host="localhost", port="8080"):
-    channel = grpc.insecure_channel(f"{host}:{port}")
-    stub = pharmacy_pb2_grpc.PharmacyServiceStub(channel)
+    # Writes return their commit LSN and the client sends the newest one with
+    # every read, so reads see this client's own writes (read-your-writes)
+    client = PharmacyClient(f"{host}:{port}", read_your_writes=True)
 
     print("=" * 50)
     print("🏥 Pharmacy Distributed System - Test Client")
@@ -24,9 +22,7 @@ def run(host="localhost", port="8080"):
     ]
     added_ids = []
     for name, qty, price, exp, cat in drugs_to_add:
-        resp = stub.AddDrug(pharmacy_pb2.AddDrugRequest(
-            name=name, quantity=qty, price=price, expiry_date=exp, category=cat
-        ))
+        resp = client.add_drug(name, qty, price, expiry_date=exp, category=cat)
         if resp.success:
             print(f"  ✅ Added: {name} (ID: {resp.drug.id})")
             added_ids.append(resp.drug.id)
@@ -35,40 +31,56 @@ def run(host="localhost", port="8080"):
 
     # 2. Get Drug
     print(f"\n[2] Getting drug ID={added_ids[0]}...")
-    resp = stub.GetDrug(pharmacy_pb2.GetDrugRequest(id=added_ids[0]))
+    resp = client.get_drug(added_ids[0])
     if resp.success:
         d = resp.drug
         print(f"  ✅ Found: {d.name}, Qty: {d.quantity}, Price: ${d.price}")
 
     # 3. Update Stock
     print(f"\n[3] Updating stock of ID={added_ids[0]} to 999...")
-    resp = stub.UpdateStock(pharmacy_pb2.UpdateStockRequest(id=added_ids[0], quantity=999))
+    resp = client.update_stock(added_ids[0], 999)
     if resp.success:
         print(f"  ✅ Updated: {resp.drug.name} new qty = {resp.drug.quantity}")
 
-    # 4. List All Drugs
-    print("\n[4] Listing all drugs...")
-    resp = stub.ListDrugs(pharmacy_pb2.ListDrugsRequest())
+    # 4. Adjust Stock (retried with the same key, applied once)
+    print(f"\n[4] Dispensing 10 units of ID={added_ids[0]} twice with one idempotency key...")
+    key = str(uuid.uuid4())
+    for attempt in (1, 2):
+        resp = client.adjust_stock(added_ids[0], -10, idempotency_key=key)
+        print(f"  {'✅' if resp.success else '❌'} Attempt {attempt}: {resp.message}, qty = {resp.drug.quantity}")
+
+    # 5. List All Drugs
+    print("\n[5] Listing all drugs...")
+    resp = client.list_drugs()
     for d in resp.drugs:
         print(f"  📦 [{d.id}] {d.name} | Qty: {d.quantity} | ${d.price} | Exp: {d.expiry_date}")
 
-    # 5. Low Stock Alert
-    print("\n[5] Low stock alert (threshold=100)...")
-    resp = stub.GetLowStock(pharmacy_pb2.LowStockRequest(threshold=100))
+    # 6. Stream All Drugs
+    print("\n[6] Streaming all drugs (batch_size=2)...")
+    total = 0
+    for i, batch in enumerate(client.stream_drugs(batch_size=2)):
+        total += len(batch.drugs)
+        print(f"  📦 Batch {i + 1}: {', '.join(d.name for d in batch.drugs)}")
+    print(f"  ✅ Streamed {total} drugs")
+
+    # 7. Low Stock Alert
+    print("\n[7] Low stock alert (threshold=100)...")
+    resp = client.get_low_stock(100)
     if resp.drugs:
         for d in resp.drugs:
             print(f"  ⚠️  LOW STOCK: {d.name} - only {d.quantity} left!")
     else:
         print("  ✅ No low stock items")
 
-    # 6. Delete Drug
-    print(f"\n[6] Deleting drug ID={added_ids[-1]}...")
-    resp = stub.DeleteDrug(pharmacy_pb2.DeleteDrugRequest(id=added_ids[-1]))
+    # 8. Delete Drug
+    print(f"\n[8] Deleting drug ID={added_ids[-1]}...")
+    resp = client.delete_drug(added_ids[-1])
     print(f"  {'✅' if resp.success else '❌'} {resp.message}")
 
     print("\n" + "=" * 50)
     print("✅ All tests completed!")
     print("=" * 50)
+    client.close()
 
 if __name__ == "__main__":
     host = sys.argv[1] if len(sys.argv) > 1 else "localhost"
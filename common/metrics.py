@@ -0,0 +1,432 @@
+"""
+Prometheus instrumentation shared by the gRPC API servers and the REST
+monolith. Counters, gauges and histograms live in one thread-safe registry
+and are rendered in the text exposition format, either on a side HTTP port
+(start_http_server) or by an app route.
+
+Requests are tracked with begin_request()/finish_request(); the database
+cursor classes below attribute query time to the request in flight through
+a context variable, which follows both worker threads and asyncio tasks.
+Statements slower than SLOW_QUERY_MS are also logged.
+"""
+import contextvars
+import http.server
+import json
+import os
+import threading
+import time
+import urllib.request
+
+# Log statements taking at least this long (0 disables the slow-query log)
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "100"))
+SLOW_QUERY_MAX_CHARS = 500
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS = {
+    "pharmacy_requests_total": ("counter", "Requests handled, by endpoint and status code."),
+    "pharmacy_request_duration_seconds": ("histogram", "Time spent in the handler, by endpoint."),
+    "pharmacy_requests_in_flight": ("gauge", "Requests currently being handled, by endpoint."),
+    "pharmacy_request_errors_total": ("counter", "Failed requests by endpoint and kind "
+                                      "(status: error status code, exception: uncaught, app: success=false)."),
+    "pharmacy_request_db_seconds": ("histogram", "Total database time per request, by endpoint."),
+    "pharmacy_db_query_duration_seconds": ("histogram", "Time per database statement, by endpoint."),
+    "pharmacy_serialization_duration_seconds": ("histogram", "Message (de)serialization time, by endpoint."),
+    "pharmacy_db_pool_wait_seconds": ("histogram", "Time waiting for a pooled database connection."),
+    "pharmacy_db_connect_duration_seconds": ("histogram", "Time to open a new database connection."),
+    "pharmacy_group_commit_wait_seconds": ("histogram", "Time a coalesced write queued before its batch ran, by op."),
+    "pharmacy_group_commit_batches_total": ("counter", "Group-commit batches run, by op."),
+    "pharmacy_group_commit_writes_total": ("counter", "Writes applied through group commit, by op."),
+    "pharmacy_group_commit_fallbacks_total": ("counter", "Failed batches retried one write at a time, by op."),
+}
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items())) if labels else ()
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+class Registry:
+    """Thread-safe store of metric samples keyed by (name, sorted label pairs)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._collectors = []
+
+    def inc(self, name, labels=None, value=1):
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def add(self, name, labels=None, delta=1):
+        key = _key(name, labels)
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    def observe(self, name, labels, seconds):
+        key = _key(name, labels)
+        index = len(LATENCY_BUCKETS)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                index = i
+                break
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                # One slot per bucket plus +Inf, then sum and count
+                hist = self._histograms[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0, 0]
+            hist[index] += 1
+            hist[-2] += seconds
+            hist[-1] += 1
+
+    def register_collector(self, collector):
+        """``collector()`` returns [(name, type, help, labels, value), ...] at scrape time."""
+        self._collectors.append(collector)
+
+    def snapshot(self):
+        with self._lock:
+            return {"counters": dict(self._counters), "gauges": dict(self._gauges),
+                    "histograms": {k: list(v) for k, v in self._histograms.items()}}
+
+    def collect(self):
+        collected = []
+        for collector in self._collectors:
+            try:
+                collected.extend(collector())
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+        return collected
+
+    def render(self, snapshot=None, collected=None):
+        snapshot = snapshot or self.snapshot()
+        if collected is None:
+            collected = self.collect()
+        samples = {}
+        for kind in ("counters", "gauges"):
+            for (name, labels), value in snapshot[kind].items():
+                samples.setdefault(name, []).append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), hist in snapshot["histograms"].items():
+            lines = samples.setdefault(name, [])
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS + ("+Inf",), hist):
+                cumulative += n
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {hist[-2]}")
+            lines.append(f"{name}_count{_format_labels(labels)} {hist[-1]}")
+        described = dict(METRICS)
+        for name, kind, help_, labels, value in collected:
+            described.setdefault(name, (kind, help_))
+            samples.setdefault(name, []).append(f"{name}{_format_labels(sorted(labels.items()))} {value}")
+        out = []
+        for name in sorted(samples):
+            kind, help_ = described.get(name, ("untyped", ""))
+            out.append(f"# HELP {name} {help_}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(samples[name])
+        return "\n".join(out) + "\n"
+
+REGISTRY = Registry()
+
+def process_metrics():
+    samples = []
+    try:
+        with open("/proc/self/statm") as f:
+            rss_pages = int(f.read().split()[1])
+        samples.append(("process_resident_memory_bytes", "gauge", "Resident memory size in bytes.",
+                        {}, rss_pages * os.sysconf("SC_PAGE_SIZE")))
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource
+        # ru_maxrss is in kilobytes on Linux
+        samples.append(("process_max_resident_memory_bytes", "gauge", "Peak resident memory size in bytes.",
+                        {}, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024))
+    except ImportError:
+        pass
+    return samples
+
+REGISTRY.register_collector(process_metrics)
+
+# ─── Request tracking ────────────────────────────────────────────────────────
+
+class RequestStats:
+    __slots__ = ("endpoint", "start", "db_seconds")
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.start = time.perf_counter()
+        self.db_seconds = 0.0
+
+current_request = contextvars.ContextVar("current_request", default=None)
+
+def begin_request(endpoint):
+    stats = RequestStats(endpoint)
+    current_request.set(stats)
+    REGISTRY.add("pharmacy_requests_in_flight", {"endpoint": endpoint}, 1)
+    return stats
+
+def finish_request(stats, code="OK", error=None):
+    """``error`` is None, "status", "exception" or "app"."""
+    labels = {"endpoint": stats.endpoint}
+    REGISTRY.add("pharmacy_requests_in_flight", labels, -1)
+    REGISTRY.observe("pharmacy_request_duration_seconds", labels, time.perf_counter() - stats.start)
+    REGISTRY.observe("pharmacy_request_db_seconds", labels, stats.db_seconds)
+    REGISTRY.inc("pharmacy_requests_total", {"endpoint": stats.endpoint, "code": str(code)})
+    if error:
+        REGISTRY.inc("pharmacy_request_errors_total", {"endpoint": stats.endpoint, "kind": error})
+
+def record_query(seconds):
+    stats = current_request.get()
+    if stats is not None:
+        stats.db_seconds += seconds
+    endpoint = stats.endpoint if stats is not None else "background"
+    REGISTRY.observe("pharmacy_db_query_duration_seconds", {"endpoint": endpoint}, seconds)
+
+def credit_db_seconds(seconds):
+    """Counts DB time another thread spent on the current request's behalf."""
+    stats = current_request.get()
+    if stats is not None:
+        stats.db_seconds += seconds
+
+def record_serialization(endpoint, direction, seconds):
+    REGISTRY.observe("pharmacy_serialization_duration_seconds",
+                     {"endpoint": endpoint, "direction": direction}, seconds)
+
+def record_pool_wait(pool, seconds):
+    REGISTRY.observe("pharmacy_db_pool_wait_seconds", {"pool": pool}, seconds)
+
+def record_connect(seconds):
+    REGISTRY.observe("pharmacy_db_connect_duration_seconds", {}, seconds)
+
+def record_group_commit(op, waits):
+    labels = {"op": op}
+    REGISTRY.inc("pharmacy_group_commit_batches_total", labels)
+    REGISTRY.inc("pharmacy_group_commit_writes_total", labels, len(waits))
+    for seconds in waits:
+        REGISTRY.observe("pharmacy_group_commit_wait_seconds", labels, seconds)
+
+def record_group_commit_fallback(op):
+    REGISTRY.inc("pharmacy_group_commit_fallbacks_total", {"op": op})
+
+# ─── Slow-query log ──────────────────────────────────────────────────────────
+# Parameters are logged by shape only (types and lengths), never by value.
+
+def statement_text(query):
+    if isinstance(query, bytes):
+        query = query.decode(errors="replace")
+    text = " ".join(str(query).split())
+    return text if len(text) <= SLOW_QUERY_MAX_CHARS else text[:SLOW_QUERY_MAX_CHARS] + "..."
+
+def params_shape(params):
+    if params is None:
+        return "-"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{k}: {params_shape(v)}" for k, v in params.items()) + "}"
+    if isinstance(params, (list, tuple)):
+        if len(params) > 10:
+            return f"{type(params).__name__}[{len(params)}]"
+        return "(" + ", ".join(params_shape(p) if p is not None else "None" for p in params) + ")"
+    if isinstance(params, (str, bytes)):
+        return f"{type(params).__name__}[{len(params)}]"
+    return type(params).__name__
+
+def log_slow_query(query, params, rows, seconds):
+    stats = current_request.get()
+    endpoint = stats.endpoint if stats is not None else "background"
+    print(f"SLOW QUERY {seconds * 1000:.1f}ms endpoint={endpoint} rows={rows} "
+          f"params={params} sql={statement_text(query)}")
+
+def finish_query(cursor, query, params, start):
+    seconds = time.perf_counter() - start
+    record_query(seconds)
+    if SLOW_QUERY_MS and seconds * 1000 >= SLOW_QUERY_MS:
+        log_slow_query(query, params, cursor.rowcount, seconds)
+
+# ─── Database cursors ────────────────────────────────────────────────────────
+# Installed with cursor_factory=... so every statement is timed without
+# touching the handlers. Only the drivers that are installed get a class.
+
+try:
+    import psycopg2.extensions
+
+    class TimedCursor(psycopg2.extensions.cursor):
+        def execute(self, query, vars=None):
+            start = time.perf_counter()
+            try:
+                return super().execute(query, vars)
+            finally:
+                finish_query(self, query, params_shape(vars), start)
+
+        def executemany(self, query, vars_list):
+            vars_list = list(vars_list)
+            start = time.perf_counter()
+            try:
+                return super().executemany(query, vars_list)
+            finally:
+                finish_query(self, query, f"{len(vars_list)} x {params_shape(vars_list[:1])}", start)
+
+        def copy_expert(self, sql, file, size=8192):
+            start = time.perf_counter()
+            try:
+                return super().copy_expert(sql, file, size)
+            finally:
+                finish_query(self, sql, "-", start)
+
+        def fetchmany(self, size=None):
+            # Only named (server-side) cursors go back to the database here
+            if not self.name:
+                return super().fetchmany(size) if size is not None else super().fetchmany()
+            start = time.perf_counter()
+            try:
+                return super().fetchmany(size) if size is not None else super().fetchmany()
+            finally:
+                finish_query(self, f"FETCH {size or self.itersize} FROM {self.name}", "-", start)
+except ImportError:
+    TimedCursor = None
+
+try:
+    import psycopg
+
+    class AsyncTimedCursor(psycopg.AsyncCursor):
+        async def execute(self, query, params=None, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await super().execute(query, params, **kwargs)
+            finally:
+                finish_query(self, query, params_shape(params), start)
+
+    class AsyncTimedServerCursor(psycopg.AsyncServerCursor):
+        async def execute(self, query, params=None, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await super().execute(query, params, **kwargs)
+            finally:
+                finish_query(self, query, params_shape(params), start)
+
+        async def fetchmany(self, size=0):
+            start = time.perf_counter()
+            try:
+                return await super().fetchmany(size)
+            finally:
+                finish_query(self, f"FETCH {size or self.itersize} FROM {self.name}", "-", start)
+except ImportError:
+    AsyncTimedCursor = AsyncTimedServerCursor = None
+
+try:
+    from psycopg_pool import AsyncConnectionPool
+
+    class TimedConnectionPool(AsyncConnectionPool):
+        """Records how long each checkout waited for a connection."""
+
+        async def getconn(self, timeout=None):
+            start = time.perf_counter()
+            conn = await super().getconn(timeout)
+            record_pool_wait(self.name, time.perf_counter() - start)
+            return conn
+except ImportError:
+    TimedConnectionPool = None
+
+# ─── Multi-process aggregation ───────────────────────────────────────────────
+# A pre-forked server keeps one registry per worker process. Each worker serves
+# its raw samples as JSON on /metrics/snapshot; the parent fetches them at
+# scrape time and renders the sum, so Prometheus still sees one target.
+
+def snapshot_json(registry=REGISTRY):
+    snapshot = registry.snapshot()
+    data = {kind: [[name, labels, value] for (name, labels), value in samples.items()]
+            for kind, samples in snapshot.items()}
+    data["collected"] = registry.collect()
+    return json.dumps(data)
+
+def fetch_snapshot(url, timeout=2.0):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read())
+
+def merge_snapshots(parts):
+    """(snapshot, collected) for render() from {worker: snapshot_json() data}.
+
+    Counters, gauges and histograms are summed across workers. Collector
+    samples (pool state, RSS, ...) describe one process each, so they keep a
+    ``worker`` label instead.
+    """
+    merged = {"counters": {}, "gauges": {}, "histograms": {}}
+    collected = []
+    for worker, part in sorted(parts.items()):
+        for kind in ("counters", "gauges"):
+            for name, labels, value in part[kind]:
+                key = name, tuple(tuple(pair) for pair in labels)
+                merged[kind][key] = merged[kind].get(key, 0) + value
+        for name, labels, hist in part["histograms"]:
+            key = name, tuple(tuple(pair) for pair in labels)
+            total = merged["histograms"].get(key)
+            merged["histograms"][key] = [a + b for a, b in zip(total, hist)] if total else list(hist)
+        for name, kind, help_, labels, value in part["collected"]:
+            collected.append((name, kind, help_, dict(labels, worker=str(worker)), value))
+    return merged, collected
+
+def aggregate(urls, registry=REGISTRY):
+    """Text exposition summing the workers at ``urls`` ({worker: snapshot URL})
+    plus this process's own collectors. Workers that don't answer are skipped
+    and show as pharmacy_worker_up 0."""
+    parts = {}
+    up = []
+    for worker, url in urls.items():
+        try:
+            parts[worker] = fetch_snapshot(url)
+        except (OSError, ValueError) as e:
+            print(f"Metrics snapshot from worker {worker} failed: {e}")
+        up.append(("pharmacy_worker_up", "gauge", "1 if the worker answered the last metrics scrape.",
+                   {"worker": str(worker)}, int(worker in parts)))
+    snapshot, collected = merge_snapshots(parts)
+    return registry.render(snapshot, registry.collect() + up + collected)
+
+# ─── Exposition ──────────────────────────────────────────────────────────────
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/metrics":
+            self.send_body(self.render(), CONTENT_TYPE)
+        elif path == "/metrics/snapshot":
+            self.send_body(snapshot_json(self.registry), "application/json")
+        else:
+            self.send_error(404)
+
+    def render(self):
+        return self.registry.render()
+
+    def send_body(self, text, content_type):
+        body = text.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def aggregating_handler(urls):
+    """A MetricsHandler whose /metrics is aggregate(urls)."""
+    class AggregatingHandler(MetricsHandler):
+        def render(self):
+            return aggregate(urls, self.registry)
+    return AggregatingHandler
+
+def start_http_server(port, handler=MetricsHandler, host="0.0.0.0"):
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Prometheus metrics on {host}:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,76 @@
+"""
+On-demand sampling profiler for the running servers.
+Samples the Python stack of every thread at a fixed interval for a number of
+seconds and returns the result in the collapsed-stack format read by
+flamegraph.pl, speedscope and inferno: one "root;...;leaf count" line per
+distinct stack. Only one profile runs at a time per process.
+"""
+import collections
+import hmac
+import os
+import sys
+import threading
+import time
+
+# Admin calls (profiling) require this token; unset disables them
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+MAX_PROFILE_SECONDS = float(os.environ.get("MAX_PROFILE_SECONDS", "60"))
+DEFAULT_PROFILE_INTERVAL_MS = 10
+
+class ProfilerBusy(Exception):
+    pass
+
+_active = threading.Lock()
+
+def admin_allowed(token):
+    # Constant-time, so response timing doesn't reveal how much of a guess matched
+    return bool(ADMIN_TOKEN) and hmac.compare_digest((token or "").encode(), ADMIN_TOKEN.encode())
+
+def profile_params(seconds, interval_ms):
+    if not 0 < seconds <= MAX_PROFILE_SECONDS:
+        raise ValueError(f"seconds must be in (0, {MAX_PROFILE_SECONDS:g}]")
+    interval_ms = interval_ms or DEFAULT_PROFILE_INTERVAL_MS
+    if not 1 <= interval_ms <= 1000:
+        raise ValueError("interval_ms must be between 1 and 1000")
+    return seconds, interval_ms / 1000
+
+def frame_label(frame):
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def stack_key(frame, thread_name):
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    labels.append(thread_name)
+    # Collapsed stacks go root first; ';' separates frames
+    return ";".join(label.replace(";", ":") for label in reversed(labels))
+
+def sample_stacks(seconds, interval):
+    """{collapsed stack: samples} over all threads except the sampler."""
+    if not _active.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running")
+    try:
+        me = threading.get_ident()
+        counts = collections.Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != me:
+                    counts[stack_key(frame, names.get(ident, f"thread-{ident}"))] += 1
+            time.sleep(interval)
+        return counts
+    finally:
+        _active.release()
+
+def collapse(counts):
+    return "".join(f"{stack} {n}\n" for stack, n in counts.most_common())
+
+def profile(seconds, interval_ms=0):
+    """(collapsed stacks, samples taken) for a profile of ``seconds``."""
+    seconds, interval = profile_params(seconds, interval_ms)
+    counts = sample_stacks(seconds, interval)
+    return collapse(counts), sum(counts.values())
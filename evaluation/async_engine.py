@@ -0,0 +1,337 @@
+"""
+asyncio load engine for benchmark.py (--engine async).
+One process holds thousands of in-flight requests on grpc.aio channels or a
+pooled httpx.AsyncClient; --processes fans the load out over worker processes
+whose histograms are merged into one result.
+"""
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+import uuid
+
+import grpc
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../proto'))
+import pharmacy_pb2
+import pharmacy_pb2_grpc
+
+from histogram import LatencyHistogram
+from workload import EXPIRING_WITHIN_DAYS, LIST_PAGE_SIZE, LOW_STOCK_THRESHOLD, SEARCH_LIMIT, Workload
+
+REQUEST_TIMEOUT = 10
+# Open-loop results are collected for at most this long after the last send
+DRAIN_TIMEOUT = 15
+
+ADD_DRUG = {"name": "TestDrug", "quantity": 100, "price": 9.99,
+            "expiry_date": "2027-01-01", "category": "Test"}
+
+class OpStats:
+    def __init__(self):
+        self.hist = LatencyHistogram()
+        self.errors = 0
+
+    def add(self, elapsed_ns, ok):
+        if ok:
+            self.hist.record(elapsed_ns)
+        else:
+            self.errors += 1
+
+class Recorder(OpStats):
+    """Overall stats plus one OpStats per operation of a mix.
+
+    Used from a single event loop, so no locking is needed.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.sent = 0
+        self.ops = {}
+
+    def record(self, start_ns, ok, op=None):
+        elapsed = time.perf_counter_ns() - start_ns
+        self.add(elapsed, ok)
+        if op is not None:
+            self.ops.setdefault(op, OpStats()).add(elapsed, ok)
+
+async def timed(call, recorder, start_ns):
+    """``call()`` returns (op, ok); op names the operation in a mix, else None."""
+    try:
+        op, ok = await call()
+    except Exception:
+        op, ok = None, False
+    recorder.record(start_ns, ok, op)
+
+def mix_call(workload, run_op):
+    async def call():
+        op, key = workload.next()
+        try:
+            ok = await run_op(op, key)
+        except Exception:
+            ok = False
+        return op, ok
+    return call
+
+# ─── Targets ─────────────────────────────────────────────────────────────────
+
+class GrpcTarget:
+    """Round-robins calls over ``channels`` grpc.aio channels (HTTP/2 connections)."""
+
+    def __init__(self, host, channels):
+        self.channels = [grpc.aio.insecure_channel(host) for _ in range(channels)]
+        self.stubs = [pharmacy_pb2_grpc.PharmacyServiceStub(c) for c in self.channels]
+        self._next = 0
+
+    def stub(self):
+        self._next = (self._next + 1) % len(self.stubs)
+        return self.stubs[self._next]
+
+    def call(self, scenario, workload=None):
+        if workload is not None:
+            return mix_call(workload, lambda op, key: self.run_op(workload, op, key))
+        if scenario == "write":
+            request = pharmacy_pb2.AddDrugRequest(**ADD_DRUG)
+            async def call():
+                return None, (await self.stub().AddDrug(request, timeout=REQUEST_TIMEOUT)).success
+        elif scenario == "stream":
+            request = pharmacy_pb2.StreamDrugsRequest()
+            async def call():
+                async for _ in self.stub().StreamDrugs(request, timeout=REQUEST_TIMEOUT):
+                    pass
+                return None, True
+        else:
+            request = pharmacy_pb2.ListDrugsRequest()
+            async def call():
+                await self.stub().ListDrugs(request, timeout=REQUEST_TIMEOUT)
+                return None, True
+        return call
+
+    async def run_op(self, workload, op, key):
+        stub = self.stub()
+        if op == "get":
+            resp = await stub.GetDrug(pharmacy_pb2.GetDrugRequest(id=key), timeout=REQUEST_TIMEOUT)
+        elif op == "add":
+            resp = await stub.AddDrug(pharmacy_pb2.AddDrugRequest(**ADD_DRUG), timeout=REQUEST_TIMEOUT)
+            if resp.success:
+                workload.record_added(resp.drug.id)
+        elif op == "update":
+            resp = await stub.UpdateStock(pharmacy_pb2.UpdateStockRequest(
+                id=key, quantity=workload.update_quantity()), timeout=REQUEST_TIMEOUT)
+        elif op == "adjust":
+            resp = await stub.AdjustStock(pharmacy_pb2.AdjustStockRequest(
+                id=key, delta=workload.adjust_delta(), idempotency_key=uuid.uuid4().hex), timeout=REQUEST_TIMEOUT)
+        elif op == "delete":
+            resp = await stub.DeleteDrug(pharmacy_pb2.DeleteDrugRequest(id=key), timeout=REQUEST_TIMEOUT)
+        elif op == "list":
+            await stub.ListDrugs(pharmacy_pb2.ListDrugsRequest(page_size=LIST_PAGE_SIZE), timeout=REQUEST_TIMEOUT)
+            return True
+        elif op == "lowstock":
+            await stub.GetLowStock(pharmacy_pb2.LowStockRequest(
+                threshold=LOW_STOCK_THRESHOLD, page_size=LIST_PAGE_SIZE), timeout=REQUEST_TIMEOUT)
+            return True
+        elif op == "expiring":
+            await stub.GetExpiringDrugs(pharmacy_pb2.ExpiringDrugsRequest(
+                within_days=EXPIRING_WITHIN_DAYS, page_size=LIST_PAGE_SIZE), timeout=REQUEST_TIMEOUT)
+            return True
+        elif op == "search":
+            await stub.SearchDrugs(pharmacy_pb2.SearchDrugsRequest(
+                query=workload.search_query(), limit=SEARCH_LIMIT), timeout=REQUEST_TIMEOUT)
+            return True
+        else:
+            async for _ in stub.StreamDrugs(pharmacy_pb2.StreamDrugsRequest(), timeout=REQUEST_TIMEOUT):
+                pass
+            return True
+        return resp.success
+
+    async def close(self):
+        for channel in self.channels:
+            await channel.close()
+
+class RestTarget:
+    """One keep-alive httpx.AsyncClient capped at ``connections`` sockets."""
+
+    def __init__(self, base_url, connections):
+        limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+        self.client = httpx.AsyncClient(base_url=base_url, limits=limits,
+                                        timeout=httpx.Timeout(REQUEST_TIMEOUT, pool=None))
+
+    def call(self, scenario, workload=None):
+        if workload is not None:
+            if "stream" in workload.ops:
+                raise ValueError("The REST monolith has no stream operation")
+            return mix_call(workload, lambda op, key: self.run_op(workload, op, key))
+        if scenario == "write":
+            async def call():
+                return None, (await self.client.post("/drugs", json=ADD_DRUG)).status_code == 200
+        else:
+            async def call():
+                return None, (await self.client.get("/drugs")).status_code == 200
+        return call
+
+    async def run_op(self, workload, op, key):
+        client = self.client
+        if op == "get":
+            resp = await client.get(f"/drugs/{key}")
+        elif op == "add":
+            resp = await client.post("/drugs", json=ADD_DRUG)
+            if resp.status_code == 200:
+                workload.record_added(resp.json()["id"])
+        elif op == "update":
+            resp = await client.put(f"/drugs/{key}/stock", json={"quantity": workload.update_quantity()})
+        elif op == "adjust":
+            resp = await client.post(f"/drugs/{key}/stock/adjust", json={"delta": workload.adjust_delta()},
+                                     headers={"Idempotency-Key": uuid.uuid4().hex})
+        elif op == "delete":
+            resp = await client.delete(f"/drugs/{key}")
+        elif op == "list":
+            resp = await client.get("/drugs", params={"page_size": LIST_PAGE_SIZE})
+        elif op == "expiring":
+            resp = await client.get("/drugs/expiring",
+                                    params={"within_days": EXPIRING_WITHIN_DAYS, "page_size": LIST_PAGE_SIZE})
+        elif op == "search":
+            resp = await client.get("/drugs/search", params={"q": workload.search_query(), "limit": SEARCH_LIMIT})
+        else:
+            resp = await client.get("/drugs/alert/low-stock",
+                                    params={"threshold": LOW_STOCK_THRESHOLD, "page_size": LIST_PAGE_SIZE})
+        return resp.status_code == 200
+
+    async def close(self):
+        await self.client.aclose()
+
+def make_target(config):
+    if config["target"] == "grpc":
+        return GrpcTarget(config["grpc_host"], config["channels"])
+    return RestTarget(config["rest_host"], config["connections"])
+
+# ─── Load shapes ─────────────────────────────────────────────────────────────
+
+async def closed_loop(call, recorder, users, duration):
+    """``users`` virtual users, each sending its next request as soon as the last returns."""
+    deadline = time.perf_counter_ns() + int(duration * 1e9)
+
+    async def user():
+        while time.perf_counter_ns() < deadline:
+            recorder.sent += 1
+            await timed(call, recorder, time.perf_counter_ns())
+
+    await asyncio.gather(*(user() for _ in range(users)))
+
+async def open_loop(call, recorder, rate, duration):
+    """Fixed-rate schedule; latency counts from each request's intended send time."""
+    interval_ns = 1e9 / rate
+    start = time.perf_counter_ns()
+    end = start + int(duration * 1e9)
+    tasks = set()
+    while True:
+        intended = start + int(recorder.sent * interval_ns)
+        if intended >= end:
+            break
+        delay = intended - time.perf_counter_ns()
+        if delay > 0:
+            await asyncio.sleep(delay / 1e9)
+        recorder.sent += 1
+        task = asyncio.create_task(timed(call, recorder, intended))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        _, pending = await asyncio.wait(tasks, timeout=DRAIN_TIMEOUT)
+        for task in pending:
+            task.cancel()
+        recorder.errors += len(pending)
+
+def make_workload(config):
+    if not config.get("mix"):
+        return None
+    # Each worker gets its own stream of operations and keys, reproducibly
+    return Workload(config["mix"], config.get("id_ranges"), config.get("theta", 0.99),
+                    seed=config.get("seed", 0) * 1000 + config.get("worker", 0))
+
+async def run_worker_async(config):
+    workload = make_workload(config)
+    target = make_target(config)
+    recorder = Recorder()
+    call = target.call(config["scenario"], workload)
+    start = time.perf_counter_ns()
+    try:
+        if config.get("rate"):
+            await open_loop(call, recorder, config["rate"], config["duration"])
+        else:
+            await closed_loop(call, recorder, config["users"], config["duration"])
+    finally:
+        await target.close()
+    return {"hist": recorder.hist.to_dict(), "sent": recorder.sent, "errors": recorder.errors,
+            "elapsed": (time.perf_counter_ns() - start) / 1e9,
+            "ops": {op: {"hist": o.hist.to_dict(), "errors": o.errors} for op, o in recorder.ops.items()}}
+
+def run_worker(config):
+    """Process entry point: runs one share of the load on its own event loop."""
+    return asyncio.run(run_worker_async(config))
+
+def split(total, parts):
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+def summarise(hist, errors, elapsed):
+    summary = hist.summary()
+    sent = hist.count + errors
+    return {
+        "success": hist.count,
+        "errors": errors,
+        "error_rate": round(errors / sent, 4) if sent else 0.0,
+        "avg_latency_ms": summary["mean_ms"],
+        **{k: summary[k] for k in ("p50_ms", "p90_ms", "p99_ms", "p999_ms", "max_ms")},
+        "throughput_rps": round(hist.count / elapsed, 2) if elapsed > 0 else 0,
+    }
+
+def run_async_benchmark(target, scenario, duration, users=None, rate=None, processes=1,
+                        grpc_host="localhost:8080", rest_host="http://localhost:9000",
+                        channels=4, connections=1000, mix=None, id_ranges=None, theta=0.99, seed=0):
+    """Closed loop with ``users`` virtual users, or open loop at ``rate`` req/s.
+
+    Users, rate, channels and connections are split evenly across processes.
+    With ``mix`` (see workload.parse_mix) each request's operation and key
+    are drawn from the mix and the ``id_ranges`` key space, and the result
+    gets a per-operation breakdown under "ops".
+    """
+    processes = max(1, processes)
+    base = {"target": target, "scenario": scenario, "duration": duration,
+            "grpc_host": grpc_host, "rest_host": rest_host,
+            "mix": mix, "id_ranges": id_ranges, "theta": theta, "seed": seed}
+    configs = []
+    for i in range(processes):
+        config = dict(base, worker=i, channels=max(1, split(channels, processes)[i]),
+                      connections=max(1, split(connections, processes)[i]))
+        if rate:
+            config["rate"] = rate / processes
+        else:
+            config["users"] = split(users, processes)[i]
+        configs.append(config)
+    if processes == 1:
+        parts = [run_worker(configs[0])]
+    else:
+        # spawn: forked children would inherit the parent's gRPC state
+        with multiprocessing.get_context("spawn").Pool(processes) as pool:
+            parts = pool.map(run_worker, configs)
+
+    hist = LatencyHistogram()
+    ops = {}
+    for part in parts:
+        hist.merge(LatencyHistogram.from_dict(part["hist"]))
+        for op, data in part["ops"].items():
+            merged = ops.setdefault(op, OpStats())
+            merged.hist.merge(LatencyHistogram.from_dict(data["hist"]))
+            merged.errors += data["errors"]
+    sent = sum(p["sent"] for p in parts)
+    errors = sum(p["errors"] for p in parts)
+    elapsed = max(p["elapsed"] for p in parts)
+    result = {"target_rps": rate} if rate else {"users": users}
+    result.update({"processes": processes, "duration_s": duration, "sent": sent})
+    result.update(summarise(hist, errors, elapsed))
+    result["histogram"] = hist.to_dict()
+    if ops:
+        result["ops"] = {op: dict(summarise(o.hist, o.errors, elapsed), histogram=o.hist.to_dict())
+                         for op, o in sorted(ops.items())}
+    if rate:
+        result["achieved_rps"] = result["throughput_rps"]
+    return result
@@ -2,58 +2,117 @@
 Performance Benchmark Script
 Tests both gRPC microservice and REST monolith under varying loads
 Usage: python benchmark.py
+       python benchmark.py --open-loop --rate 100 500 1000 --duration 30
+       python benchmark.py --export --dataset 100k
+       python benchmark.py --payload --dataset 100k
+       python benchmark.py --cpu --rate 500 --duration 60
 """
-import grpc
+import argparse
 import requests
 import time
 import threading
-import statistics
 import sys
 import os
 import json
+import subprocess
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from histogram import LatencyHistogram
+from history import save_run
+from workload import parse_size
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../proto'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../client'))
 import pharmacy_pb2
-import pharmacy_pb2_grpc
+from google.protobuf.field_mask_pb2 import FieldMask
+from pharmacy_client import PharmacyClient
 
 GRPC_HOST = "localhost:8080"
+# --grpc-host may list several servers (a,b); calls are then balanced client-side
+GRPC_BALANCING = "round_robin"
 REST_HOST = "http://localhost:9000"
+# Direct (no nginx) endpoints used to compare the threaded and asyncio servers
+GRPC_THREADED_HOST = "localhost:50051"
+GRPC_AIO_HOST = "localhost:50052"
+# Sync (main:app) and async (async_main:app) monolith modes
+REST_SYNC_HOST = "http://localhost:9000"
+REST_ASYNC_HOST = "http://localhost:9001"
+REQUEST_TIMEOUT = 10
+# Open-loop mode: threads available for calls that have no async form
+# (REST requests and StreamDrugs); queueing for them counts as latency.
+OPEN_LOOP_MAX_WORKERS = 256
+OPEN_LOOP_DRAIN_TIMEOUT = 15
+
+ADD_DRUG = {"name": "TestDrug", "quantity": 100, "price": 9.99,
+            "expiry_date": "2027-01-01", "category": "Test"}
+
+def closed_loop_result(num_users, results, total_ns):
+    """Summarise per-request latencies (ns, None for failures) of one closed-loop run."""
+    hist = LatencyHistogram()
+    for r in results:
+        if r is not None:
+            hist.record(r)
+    summary = hist.summary()
+    total_time = total_ns / 1e9
+    return {
+        "users": num_users,
+        "success": hist.count,
+        "errors": len(results) - hist.count,
+        "avg_latency_ms": summary["mean_ms"],
+        **{k: summary[k] for k in ("p50_ms", "p90_ms", "p99_ms", "p999_ms", "max_ms")},
+        "throughput_rps": round(hist.count / total_time, 2) if total_time > 0 else 0,
+        "histogram": hist.to_dict(),
+    }
 
 # ─── gRPC Benchmark ──────────────────────────────────────────────────────────
 
-def grpc_add_drug(stub, result_list):
-    start = time.time()
+def grpc_client(host):
+    # One attempt per call and no hedging: a failed call counts as an error,
+    # as it did before the benchmark went through PharmacyClient, instead of
+    # as a slower success.
+    return PharmacyClient(host, balancing=GRPC_BALANCING, timeout=REQUEST_TIMEOUT,
+                          max_attempts=1, hedge_delay=0)
+
+def grpc_add_drug(client, result_list):
+    start = time.perf_counter_ns()
     try:
-        resp = stub.AddDrug(pharmacy_pb2.AddDrugRequest(
-            name="TestDrug", quantity=100, price=9.99,
-            expiry_date="2027-01-01", category="Test"
-        ))
-        elapsed = (time.time() - start) * 1000
+        resp = client.add_drug(**ADD_DRUG)
+        elapsed = time.perf_counter_ns() - start
         result_list.append(elapsed if resp.success else None)
     except Exception:
         result_list.append(None)
 
-def grpc_list_drugs(stub, result_list):
-    start = time.time()
+def grpc_list_drugs(client, result_list):
+    start = time.perf_counter_ns()
+    try:
+        client.list_drugs()
+        result_list.append(time.perf_counter_ns() - start)
+    except Exception:
+        result_list.append(None)
+
+def grpc_stream_drugs(client, result_list):
+    start = time.perf_counter_ns()
     try:
-        stub.ListDrugs(pharmacy_pb2.ListDrugsRequest())
-        elapsed = (time.time() - start) * 1000
-        result_list.append(elapsed)
+        for _ in client.stream_drugs(timeout=REQUEST_TIMEOUT):
+            pass
+        result_list.append(time.perf_counter_ns() - start)
     except Exception:
         result_list.append(None)
 
-def run_grpc_benchmark(num_users, scenario="write"):
-    channel = grpc.insecure_channel(GRPC_HOST)
-    stub = pharmacy_pb2_grpc.PharmacyServiceStub(channel)
+def run_grpc_benchmark(num_users, scenario="write", host=GRPC_HOST):
+    client = grpc_client(host)
     results = []
     threads = []
 
-    start_all = time.time()
+    start_all = time.perf_counter_ns()
     for _ in range(num_users):
         if scenario == "write":
-            t = threading.Thread(target=grpc_add_drug, args=(stub, results))
+            t = threading.Thread(target=grpc_add_drug, args=(client, results))
+        elif scenario == "stream":
+            t = threading.Thread(target=grpc_stream_drugs, args=(client, results))
         else:
-            t = threading.Thread(target=grpc_list_drugs, args=(stub, results))
+            t = threading.Thread(target=grpc_list_drugs, args=(client, results))
         threads.append(t)
 
     for t in threads:
@@ -61,48 +120,41 @@ def run_grpc_benchmark(num_users, scenario="write"):
     for t in threads:
         t.join()
 
-    total_time = time.time() - start_all
-    valid = [r for r in results if r is not None]
-    return {
-        "users": num_users,
-        "success": len(valid),
-        "avg_latency_ms": round(statistics.mean(valid), 2) if valid else 0,
-        "throughput_rps": round(len(valid) / total_time, 2) if total_time > 0 else 0
-    }
+    total_ns = time.perf_counter_ns() - start_all
+    client.close()
+    return closed_loop_result(num_users, results, total_ns)
 
 # ─── REST Benchmark ──────────────────────────────────────────────────────────
 
-def rest_add_drug(result_list):
-    start = time.time()
+def rest_add_drug(result_list, host):
+    start = time.perf_counter_ns()
     try:
-        resp = requests.post(f"{REST_HOST}/drugs", json={
-            "name": "TestDrug", "quantity": 100, "price": 9.99,
-            "expiry_date": "2027-01-01", "category": "Test"
-        }, timeout=10)
-        elapsed = (time.time() - start) * 1000
+        resp = requests.post(f"{host}/drugs", json=ADD_DRUG, timeout=REQUEST_TIMEOUT)
+        elapsed = time.perf_counter_ns() - start
         result_list.append(elapsed if resp.status_code == 200 else None)
     except Exception:
         result_list.append(None)
 
-def rest_list_drugs(result_list):
-    start = time.time()
+def rest_list_drugs(result_list, host):
+    start = time.perf_counter_ns()
     try:
-        resp = requests.get(f"{REST_HOST}/drugs", timeout=10)
-        elapsed = (time.time() - start) * 1000
+        resp = requests.get(f"{host}/drugs", timeout=REQUEST_TIMEOUT)
+        elapsed = time.perf_counter_ns() - start
         result_list.append(elapsed if resp.status_code == 200 else None)
     except Exception:
         result_list.append(None)
 
-def run_rest_benchmark(num_users, scenario="write"):
+def run_rest_benchmark(num_users, scenario="write", host=None):
+    host = host or REST_HOST
     results = []
     threads = []
 
-    start_all = time.time()
+    start_all = time.perf_counter_ns()
     for _ in range(num_users):
         if scenario == "write":
-            t = threading.Thread(target=rest_add_drug, args=(results,))
+            t = threading.Thread(target=rest_add_drug, args=(results, host))
         else:
-            t = threading.Thread(target=rest_list_drugs, args=(results,))
+            t = threading.Thread(target=rest_list_drugs, args=(results, host))
         threads.append(t)
 
     for t in threads:
@@ -110,33 +162,675 @@ def run_rest_benchmark(num_users, scenario="write"):
     for t in threads:
         t.join()
 
-    total_time = time.time() - start_all
-    valid = [r for r in results if r is not None]
+    total_ns = time.perf_counter_ns() - start_all
+    return closed_loop_result(num_users, results, total_ns)
+
+# ─── Open-loop load ──────────────────────────────────────────────────────────
+# Requests are issued on a fixed schedule (rate per second) regardless of how
+# fast earlier ones complete, and latency is measured from the *intended* send
+# time. A stalled server therefore shows up as queueing in the percentiles
+# instead of silently lowering the offered load (coordinated omission).
+
+class OpenLoopRecorder:
+    def __init__(self):
+        self.hist = LatencyHistogram()
+        self.errors = 0
+        self.outstanding = 0
+        self._cond = threading.Condition()
+
+    def begin(self):
+        with self._cond:
+            self.outstanding += 1
+
+    def done(self, intended_ns, ok):
+        elapsed = time.perf_counter_ns() - intended_ns
+        with self._cond:
+            if ok:
+                self.hist.record(elapsed)
+            else:
+                self.errors += 1
+            self.outstanding -= 1
+            if not self.outstanding:
+                self._cond.notify_all()
+
+    def drain(self, timeout):
+        with self._cond:
+            self._cond.wait_for(lambda: not self.outstanding, timeout)
+            return self.outstanding
+
+def grpc_future_sender(client, method, request, check=lambda resp: True):
+    def send(done):
+        def finished(fut):
+            try:
+                done(check(fut.result()))
+            except Exception:
+                done(False)
+        client.future(method, request, timeout=REQUEST_TIMEOUT).add_done_callback(finished)
+    return send
+
+def executor_sender(executor, fn):
+    def send(done):
+        def task():
+            try:
+                ok = fn()
+            except Exception:
+                ok = False
+            done(ok)
+        executor.submit(task)
+    return send
+
+def run_open_loop(send, rate, duration):
+    """Offer ``rate`` requests/s for ``duration`` seconds through ``send(done)``.
+
+    ``send`` must not block: it starts one request and arranges for
+    ``done(ok)`` to be called when it completes.
+    """
+    recorder = OpenLoopRecorder()
+    interval_ns = 1e9 / rate
+    start = time.perf_counter_ns()
+    end = start + int(duration * 1e9)
+    sent = 0
+    while True:
+        intended = start + int(sent * interval_ns)
+        if intended >= end:
+            break
+        delay = intended - time.perf_counter_ns()
+        if delay > 0:
+            time.sleep(delay / 1e9)
+        recorder.begin()
+        send(lambda ok, intended=intended: recorder.done(intended, ok))
+        sent += 1
+    send_elapsed = (time.perf_counter_ns() - start) / 1e9
+    timed_out = recorder.drain(OPEN_LOOP_DRAIN_TIMEOUT)
+    elapsed = (time.perf_counter_ns() - start) / 1e9
+    with recorder._cond:
+        summary = recorder.hist.summary()
+        errors = recorder.errors + timed_out
     return {
-        "users": num_users,
-        "success": len(valid),
-        "avg_latency_ms": round(statistics.mean(valid), 2) if valid else 0,
-        "throughput_rps": round(len(valid) / total_time, 2) if total_time > 0 else 0
+        "target_rps": rate,
+        "duration_s": duration,
+        "sent": sent,
+        "success": summary["count"],
+        "errors": errors,
+        "error_rate": round(errors / sent, 4) if sent else 0.0,
+        "sent_rps": round(sent / send_elapsed, 2) if send_elapsed > 0 else 0,
+        "achieved_rps": round(summary["count"] / elapsed, 2) if elapsed > 0 else 0,
+        **{k: v for k, v in summary.items() if k != "count"},
+        "histogram": recorder.hist.to_dict(),
+    }
+
+def rest_call(session_local, scenario):
+    session = getattr(session_local, "session", None)
+    if session is None:
+        session = session_local.session = requests.Session()
+    if scenario == "write":
+        resp = session.post(f"{REST_HOST}/drugs", json=ADD_DRUG, timeout=REQUEST_TIMEOUT)
+    else:
+        resp = session.get(f"{REST_HOST}/drugs", timeout=REQUEST_TIMEOUT)
+    return resp.status_code == 200
+
+def run_grpc_open_loop(rate, duration, scenario="write", host=GRPC_HOST):
+    client = grpc_client(host)
+    with ThreadPoolExecutor(max_workers=OPEN_LOOP_MAX_WORKERS) as executor:
+        if scenario == "write":
+            send = grpc_future_sender(client, "AddDrug", pharmacy_pb2.AddDrugRequest(**ADD_DRUG),
+                                      lambda resp: resp.success)
+        elif scenario == "stream":
+            def stream():
+                for _ in client.stream_drugs(timeout=REQUEST_TIMEOUT):
+                    pass
+                return True
+            send = executor_sender(executor, stream)
+        else:
+            send = grpc_future_sender(client, "ListDrugs", pharmacy_pb2.ListDrugsRequest())
+        result = run_open_loop(send, rate, duration)
+    client.close()
+    return result
+
+def run_rest_open_loop(rate, duration, scenario="write"):
+    session_local = threading.local()
+    with ThreadPoolExecutor(max_workers=OPEN_LOOP_MAX_WORKERS) as executor:
+        return run_open_loop(executor_sender(executor, lambda: rest_call(session_local, scenario)), rate, duration)
+
+def print_open_loop_table(title, results):
+    print(f"\n{'='*92}")
+    print(f"  {title}")
+    print(f"{'='*92}")
+    print(f"  {'Target/s':<10} {'Achieved/s':<12} {'p50 (ms)':<10} {'p90 (ms)':<10} "
+          f"{'p99 (ms)':<10} {'p99.9 (ms)':<12} {'Max (ms)':<10} {'Errors':<10}")
+    print(f"  {'-'*88}")
+    for r in results:
+        errors = f"{r['error_rate'] * 100:.2f}%"
+        print(f"  {r['target_rps']:<10} {r['achieved_rps']:<12} {r['p50_ms']:<10} {r['p90_ms']:<10} "
+              f"{r['p99_ms']:<10} {r['p999_ms']:<12} {r['max_ms']:<10} {errors:<10}")
+
+def run_load(args, target, scenario, load, dataset=None):
+    """One open-loop (load = rate) or async closed-loop (load = users) run."""
+    if args.engine == "async":
+        from async_engine import run_async_benchmark
+        return run_async_benchmark(
+            target, scenario, args.duration,
+            users=None if args.open_loop else load, rate=load if args.open_loop else None,
+            processes=args.processes, grpc_host=args.grpc_host, rest_host=args.rest_host,
+            channels=args.channels, connections=args.connections,
+            mix=args.mix, id_ranges=dataset["id_ranges"] if dataset else None,
+            theta=args.zipf, seed=args.seed,
+        )
+    if target == "grpc":
+        return run_grpc_open_loop(load, args.duration, scenario, args.grpc_host)
+    return run_rest_open_loop(load, args.duration, scenario)
+
+def print_mix_table(title, rows):
+    print(f"\n{'='*84}")
+    print(f"  {title} — per operation")
+    print(f"{'='*84}")
+    print(f"  {'Load':<10} {'Op':<10} {'Req/s':<12} {'p50 (ms)':<10} {'p99 (ms)':<10} "
+          f"{'p99.9 (ms)':<12} {'Errors':<10}")
+    print(f"  {'-'*80}")
+    for r in rows:
+        load = r.get("users") or r.get("target_rps")
+        for op, o in r.get("ops", {}).items():
+            errors = f"{o['error_rate'] * 100:.2f}%"
+            print(f"  {load:<10} {op:<10} {o['throughput_rps']:<12} {o['p50_ms']:<10} {o['p99_ms']:<10} "
+                  f"{o['p999_ms']:<12} {errors:<10}")
+
+def load_suite_main(args):
+    from workload import parse_mix
+    if args.mix:
+        args.mix = parse_mix(args.mix)
+        scenarios = ["mix"]
+    else:
+        scenarios = args.scenario or ["write", "read"]
+    loads = args.rate if args.open_loop else args.users
+    unit = "req/s" if args.open_loop else "users"
+    mode = "open loop" if args.open_loop else "closed loop"
+    results = {}
+    for target in args.target:
+        dataset = None
+        if args.dataset:
+            from seed_data import ensure_dataset
+            dataset = ensure_dataset(target, args.dataset, args.seed,
+                                     grpc_host=args.grpc_host, rest_host=args.rest_host)
+        for scenario in scenarios:
+            if target == "rest" and scenario == "stream":
+                continue
+            key = f"{target}_{scenario}"
+            results[key] = []
+            for load in loads:
+                print(f"  {key}: {load} {unit} for {args.duration}s ({args.engine} engine)...")
+                results[key].append(run_load(args, target, scenario, load, dataset))
+                time.sleep(1)
+    for key, rows in results.items():
+        target, scenario = key.split("_", 1)
+        title = f"{'gRPC Microservice' if target == 'grpc' else 'REST Monolith'} — {mode}, {scenario}"
+        if args.dataset:
+            title += f" ({args.dataset} drugs)"
+        if args.open_loop:
+            print_open_loop_table(title, rows)
+        else:
+            print_table(title, rows)
+        if scenario == "mix":
+            print_mix_table(title, rows)
+    output = args.output or ("open_loop_results.json" if args.open_loop else "async_results.json")
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n✅ Results saved to {output}")
+    save_run(results, config=vars(args), dataset_size=args.dataset, label=args.label)
+
+# ─── Full export: NDJSON stream vs list ──────────────────────────────────────
+# Downloads the whole catalog through GET /drugs/stream (plain and gzip) and
+# GET /drugs, measuring time to first byte, throughput, bytes on the wire and
+# the monolith's peak RSS (sampled from its /metrics) above the idle baseline.
+# The list runs last: Python seldom returns freed memory, so a list run first
+# would hide the stream's footprint.
+
+EXPORT_CASES = (
+    ("stream", "/drugs/stream", "identity"),
+    ("stream_gzip", "/drugs/stream", "gzip"),
+    ("list", "/drugs", "identity"),
+)
+RSS_SAMPLE_INTERVAL = 0.05
+
+def scrape_gauge(metrics_url, name):
+    try:
+        text = requests.get(metrics_url, timeout=REQUEST_TIMEOUT).text
+    except requests.RequestException:
+        return None
+    labelled = None
+    for line in text.splitlines():
+        if line.startswith(name + " "):
+            return float(line.split()[1])
+        # A pre-forked server reports per-process gauges with a worker label
+        if labelled is None and line.startswith(name + "{"):
+            labelled = float(line.rsplit(" ", 1)[1])
+    return labelled
+
+class RssSampler(threading.Thread):
+    """Polls the server's process_resident_memory_bytes and keeps the peak."""
+
+    def __init__(self, metrics_url):
+        super().__init__(daemon=True)
+        self.metrics_url = metrics_url
+        self.baseline = scrape_gauge(metrics_url, "process_resident_memory_bytes")
+        self.peak = self.baseline
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(RSS_SAMPLE_INTERVAL):
+            rss = scrape_gauge(self.metrics_url, "process_resident_memory_bytes")
+            if rss is not None and self.peak is not None:
+                self.peak = max(self.peak, rss)
+
+    def stop(self):
+        self.done.set()
+        self.join()
+        # Catch a peak that landed between the last sample and the end
+        rss = scrape_gauge(self.metrics_url, "process_resident_memory_bytes")
+        if rss is not None and self.peak is not None:
+            self.peak = max(self.peak, rss)
+
+def run_export(case, path, encoding, host):
+    sampler = RssSampler(f"{host}/metrics")
+    sampler.start()
+    start = time.perf_counter_ns()
+    first_byte = None
+    wire_bytes = 0
+    body = []
+    with requests.get(f"{host}{path}", headers={"Accept-Encoding": encoding}, stream=True, timeout=300) as resp:
+        resp.raise_for_status()
+        # Undecoded reads, so wire_bytes is what crossed the network
+        gzipped = resp.headers.get("Content-Encoding") == "gzip"
+        decoder = zlib.decompressobj(31) if gzipped else None
+        for chunk in resp.raw.stream(65536, decode_content=False):
+            if first_byte is None:
+                first_byte = time.perf_counter_ns() - start
+            wire_bytes += len(chunk)
+            body.append(decoder.decompress(chunk) if decoder else chunk)
+    content = b"".join(body)
+    rows = content.count(b"\n") if path.endswith("/stream") else len(json.loads(content))
+    total_ns = time.perf_counter_ns() - start
+    sampler.stop()
+    mb = 1024 * 1024
+    return {
+        "case": case,
+        "path": path,
+        "encoding": encoding,
+        "rows": rows,
+        "wire_bytes": wire_bytes,
+        "ttfb_ms": round((first_byte or total_ns) / 1e6, 2),
+        "total_ms": round(total_ns / 1e6, 2),
+        "rows_per_s": round(rows / (total_ns / 1e9), 1),
+        "server_rss_baseline_mb": round(sampler.baseline / mb, 1) if sampler.baseline else None,
+        "server_rss_peak_delta_mb": round((sampler.peak - sampler.baseline) / mb, 1) if sampler.baseline else None,
+    }
+
+def print_export_table(results):
+    print(f"\n{'='*100}")
+    print("  REST Monolith — full export (NDJSON stream vs list)")
+    print(f"{'='*100}")
+    print(f"  {'Case':<14} {'Rows':<10} {'Wire (MB)':<11} {'TTFB (ms)':<11} {'Total (ms)':<12} "
+          f"{'Rows/s':<12} {'Server RSS +MB':<15}")
+    print(f"  {'-'*96}")
+    for r in results:
+        print(f"  {r['case']:<14} {r['rows']:<10} {r['wire_bytes'] / 1048576:<11.2f} {r['ttfb_ms']:<11} "
+              f"{r['total_ms']:<12} {r['rows_per_s']:<12} {r['server_rss_peak_delta_mb']!s:<15}")
+
+def export_main(args):
+    if args.dataset:
+        from seed_data import ensure_dataset
+        ensure_dataset("rest", args.dataset, args.seed, rest_host=args.rest_host)
+    results = []
+    for case, path, encoding in EXPORT_CASES:
+        print(f"  Export: {case} ({path}, Accept-Encoding: {encoding})...")
+        results.append(run_export(case, path, encoding, args.rest_host))
+        time.sleep(1)
+    print_export_table(results)
+    output = args.output or "export_results.json"
+    with open(output, "w") as f:
+        json.dump({"rest_export": results}, f, indent=2)
+    print(f"\n✅ Results saved to {output}")
+    save_run({"rest_export": results}, config=vars(args), dataset_size=args.dataset, label=args.label)
+
+# ─── List payload shape ───────────────────────────────────────────────────────
+# One ListDrugs page fetched as full drugs, through a field mask, and as
+# compact drugs: bytes on the wire, call latency, and the protobuf CPU spent
+# serializing and parsing the response (the same work the server and client
+# do per call).
+
+PAYLOAD_CASES = (
+    ("full", (), False),
+    ("mask_id_quantity", ("id", "quantity"), False),
+    ("compact", (), True),
+    ("compact_id_quantity", ("id", "quantity"), True),
+)
+PAYLOAD_PAGE_SIZE = 1000
+PAYLOAD_REPEATS = 50
+
+def run_payload(case, paths, compact, host):
+    client = grpc_client(host)
+    fields = {"field_mask": FieldMask(paths=paths)} if paths else {}
+    hist = LatencyHistogram()
+    resp = None
+    for _ in range(PAYLOAD_REPEATS):
+        start = time.perf_counter_ns()
+        resp = client.list_drugs(page_size=PAYLOAD_PAGE_SIZE, compact=compact, **fields)
+        hist.record(time.perf_counter_ns() - start)
+    client.close()
+    start = time.perf_counter_ns()
+    for _ in range(PAYLOAD_REPEATS):
+        data = resp.SerializeToString()
+    serialize_ns = (time.perf_counter_ns() - start) / PAYLOAD_REPEATS
+    start = time.perf_counter_ns()
+    for _ in range(PAYLOAD_REPEATS):
+        pharmacy_pb2.ListDrugsResponse.FromString(data)
+    parse_ns = (time.perf_counter_ns() - start) / PAYLOAD_REPEATS
+    rows = len(resp.compact_drugs) if compact else len(resp.drugs)
+    return {
+        "case": case,
+        "rows": rows,
+        "bytes": len(data),
+        "bytes_per_row": round(len(data) / rows, 1) if rows else 0,
+        "p50_ms": round(hist.percentile(50) / 1e6, 2),
+        "p99_ms": round(hist.percentile(99) / 1e6, 2),
+        "serialize_us": round(serialize_ns / 1000, 1),
+        "parse_us": round(parse_ns / 1000, 1),
+    }
+
+def print_payload_table(results):
+    print(f"\n{'='*90}")
+    print(f"  gRPC ListDrugs — payload shape ({PAYLOAD_PAGE_SIZE} rows per page)")
+    print(f"{'='*90}")
+    print(f"  {'Case':<22} {'Bytes':<10} {'B/row':<8} {'p50 (ms)':<10} {'p99 (ms)':<10} "
+          f"{'Serialize (us)':<16} {'Parse (us)':<10}")
+    print(f"  {'-'*86}")
+    for r in results:
+        print(f"  {r['case']:<22} {r['bytes']:<10} {r['bytes_per_row']:<8} {r['p50_ms']:<10} {r['p99_ms']:<10} "
+              f"{r['serialize_us']:<16} {r['parse_us']:<10}")
+
+def payload_main(args):
+    if args.dataset:
+        from seed_data import ensure_dataset
+        ensure_dataset("grpc", args.dataset, args.seed, grpc_host=args.grpc_host)
+    results = []
+    for case, paths, compact in PAYLOAD_CASES:
+        print(f"  Payload: {case}...")
+        results.append(run_payload(case, paths, compact, args.grpc_host))
+    print_payload_table(results)
+    output = args.output or "payload_results.json"
+    with open(output, "w") as f:
+        json.dump({"grpc_payload": results}, f, indent=2)
+    print(f"\n✅ Results saved to {output}")
+    save_run({"grpc_payload": results}, config=vars(args), dataset_size=args.dataset, label=args.label)
+
+# ─── Prepared statements: CPU per request ────────────────────────────────────
+# Runs a mix of the single-drug calls (which is where the prepared hot
+# statements are used) at a fixed rate straight at api-server-a and at the
+# async monolith, and charges the CPU their app and database containers used
+# (cgroup cpu.stat, read through docker exec) to each request sent. Run it once
+# with PREPARED_STATEMENTS=0 and once with the default: the servers' /metrics
+# gauge tags each run, and the saving is printed once cpu_results.json has both.
+
+CPU_CASES = {
+    "grpc": {"host": GRPC_THREADED_HOST, "metrics": "http://localhost:9101/metrics",
+             "app": ("node2-api-server-a",), "db": ("node4-db-primary", "node5-db-replica")},
+    "rest": {"host": REST_ASYNC_HOST, "metrics": f"{REST_ASYNC_HOST}/metrics",
+             "app": ("monolith-rest-api-async",), "db": ("mono-db",)},
+}
+CPU_MIX = "write-heavy"
+CPU_DATASET = 10_000
+CPU_STAT_COMMAND = "cat /sys/fs/cgroup/cpu.stat 2>/dev/null || cat /sys/fs/cgroup/cpuacct/cpuacct.usage"
+
+def container_cpu_us(container):
+    out = subprocess.run(("docker", "exec", container, "sh", "-c", CPU_STAT_COMMAND),
+                         capture_output=True, text=True, check=True, timeout=REQUEST_TIMEOUT).stdout
+    for line in out.splitlines():
+        if line.startswith("usage_usec "):
+            return int(line.split()[1])
+    # cgroup v1 reports nanoseconds
+    return int(out.split()[0]) // 1000
+
+def cpu_snapshot(case):
+    return {side: sum(container_cpu_us(c) for c in case[side]) for side in ("app", "db")}
+
+def run_cpu(target, args, dataset):
+    from async_engine import run_async_benchmark
+    from workload import parse_mix
+    case = CPU_CASES[target]
+    enabled = scrape_gauge(case["metrics"], "pharmacy_prepared_statements_enabled")
+    if enabled is None:
+        raise SystemExit(f"{case['metrics']} does not report pharmacy_prepared_statements_enabled")
+    before = cpu_snapshot(case)
+    result = run_async_benchmark(
+        target, "mix", args.duration, rate=args.rate[0], grpc_host=case["host"], rest_host=case["host"],
+        mix=parse_mix(args.mix or CPU_MIX), id_ranges=dataset["id_ranges"], theta=args.zipf, seed=args.seed,
+    )
+    after = cpu_snapshot(case)
+    sent = result["sent"] or 1
+    return {
+        "prepared": bool(enabled),
+        "requests": result["sent"],
+        "achieved_rps": result["achieved_rps"],
+        "p50_ms": result["p50_ms"],
+        "p99_ms": result["p99_ms"],
+        "error_rate": result["error_rate"],
+        "app_cpu_s": round((after["app"] - before["app"]) / 1e6, 3),
+        "db_cpu_s": round((after["db"] - before["db"]) / 1e6, 3),
+        "app_cpu_us_per_req": round((after["app"] - before["app"]) / sent, 1),
+        "db_cpu_us_per_req": round((after["db"] - before["db"]) / sent, 1),
+    }
+
+def cpu_saving(runs, side):
+    off, on = runs["unprepared"][f"{side}_cpu_us_per_req"], runs["prepared"][f"{side}_cpu_us_per_req"]
+    return f"{(off - on) / off * 100:.1f}%" if off else "-"
+
+def print_cpu_table(results):
+    print(f"\n{'='*84}")
+    print("  Prepared statements — CPU per request")
+    print(f"{'='*84}")
+    print(f"  {'Target':<8} {'Statements':<12} {'Requests':<10} {'p50 (ms)':<10} {'p99 (ms)':<10} "
+          f"{'App us/req':<12} {'DB us/req':<12}")
+    print(f"  {'-'*80}")
+    for key, runs in results.items():
+        target = key.split("_", 1)[0]
+        for mode in ("unprepared", "prepared"):
+            r = runs.get(mode)
+            if r:
+                print(f"  {target:<8} {mode:<12} {r['requests']:<10} {r['p50_ms']:<10} {r['p99_ms']:<10} "
+                      f"{r['app_cpu_us_per_req']:<12} {r['db_cpu_us_per_req']:<12}")
+        if "prepared" in runs and "unprepared" in runs:
+            print(f"  {target:<8} {'saved':<12} {'':<10} {'':<10} {'':<10} "
+                  f"{cpu_saving(runs, 'app'):<12} {cpu_saving(runs, 'db'):<12}")
+
+def cpu_main(args):
+    from seed_data import ensure_dataset
+    output = args.output or "cpu_results.json"
+    try:
+        with open(output) as f:
+            results = json.load(f)
+    except (OSError, ValueError):
+        results = {}
+    run = {}
+    for target in args.target:
+        case = CPU_CASES[target]
+        dataset = ensure_dataset(target, args.dataset or CPU_DATASET, args.seed,
+                                 grpc_host=case["host"], rest_host=case["host"])
+        print(f"  CPU: {target} at {args.rate[0]} req/s for {args.duration}s...")
+        row = run_cpu(target, args, dataset)
+        mode = "prepared" if row["prepared"] else "unprepared"
+        results.setdefault(f"{target}_cpu", {})[mode] = row
+        run[f"{target}_cpu_{mode}"] = row
+        time.sleep(1)
+    print_cpu_table(results)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n✅ Results saved to {output}")
+    save_run(run, config=vars(args), dataset_size=args.dataset or CPU_DATASET, label=args.label)
+
+# ─── Batch vs Single-item ────────────────────────────────────────────────────
+# Restocking a shipment of N drugs: N sequential single-item calls vs one batch
+# call, for both inserts and stock updates.
+
+def make_restock_drugs(n):
+    return [{"name": f"BatchDrug{i}", "quantity": 100, "price": 9.99,
+             "expiry_date": "2027-01-01", "category": "Test"} for i in range(n)]
+
+def batch_result(batch_size, single_add, batch_add, single_update, batch_update):
+    return {
+        "batch_size": batch_size,
+        "single_add_ms": round(single_add * 1000, 2),
+        "batch_add_ms": round(batch_add * 1000, 2),
+        "single_update_ms": round(single_update * 1000, 2),
+        "batch_update_ms": round(batch_update * 1000, 2),
+        "add_speedup": round(single_add / batch_add, 2) if batch_add > 0 else 0,
+        "update_speedup": round(single_update / batch_update, 2) if batch_update > 0 else 0,
     }
 
+def run_grpc_batch_comparison(batch_size, host=GRPC_HOST):
+    client = grpc_client(host)
+    drugs = make_restock_drugs(batch_size)
+
+    start = time.perf_counter()
+    single_ids = [client.add_drug(**d).drug.id for d in drugs]
+    single_add = time.perf_counter() - start
+
+    start = time.perf_counter()
+    resp = client.batch_add_drugs(drugs)
+    batch_add = time.perf_counter() - start
+    batch_ids = [r.drug.id for r in resp.results if r.success]
+
+    start = time.perf_counter()
+    for drug_id in single_ids:
+        client.update_stock(drug_id, 50)
+    single_update = time.perf_counter() - start
+
+    start = time.perf_counter()
+    client.batch_update_stock({drug_id: 50 for drug_id in batch_ids})
+    batch_update = time.perf_counter() - start
+    client.close()
+    return batch_result(batch_size, single_add, batch_add, single_update, batch_update)
+
+def run_rest_batch_comparison(batch_size):
+    session = requests.Session()
+    drugs = make_restock_drugs(batch_size)
+
+    start = time.perf_counter()
+    single_ids = [session.post(f"{REST_HOST}/drugs", json=d, timeout=30).json()["id"] for d in drugs]
+    single_add = time.perf_counter() - start
+
+    start = time.perf_counter()
+    resp = session.post(f"{REST_HOST}/drugs/batch", json=drugs, timeout=30)
+    batch_add = time.perf_counter() - start
+    batch_ids = [r["drug"]["id"] for r in resp.json() if r["success"]]
+
+    start = time.perf_counter()
+    for drug_id in single_ids:
+        session.put(f"{REST_HOST}/drugs/{drug_id}/stock", json={"quantity": 50}, timeout=30)
+    single_update = time.perf_counter() - start
+
+    start = time.perf_counter()
+    session.put(f"{REST_HOST}/drugs/stock/batch",
+                json=[{"id": drug_id, "quantity": 50} for drug_id in batch_ids], timeout=30)
+    batch_update = time.perf_counter() - start
+    session.close()
+    return batch_result(batch_size, single_add, batch_add, single_update, batch_update)
+
+def print_batch_table(title, results):
+    print(f"\n{'='*78}")
+    print(f"  {title}")
+    print(f"{'='*78}")
+    print(f"  {'Items':<8} {'Add single/batch (ms)':<26} {'Update single/batch (ms)':<28} {'Speedup':<12}")
+    print(f"  {'-'*74}")
+    for r in results:
+        add = f"{r['single_add_ms']} / {r['batch_add_ms']}"
+        update = f"{r['single_update_ms']} / {r['batch_update_ms']}"
+        speedup = f"{r['add_speedup']}x / {r['update_speedup']}x"
+        print(f"  {r['batch_size']:<8} {add:<26} {update:<28} {speedup:<12}")
+
 # ─── Main ─────────────────────────────────────────────────────────────────────
 
 def print_table(title, results):
-    print(f"\n{'='*60}")
+    print(f"\n{'='*72}")
     print(f"  {title}")
-    print(f"{'='*60}")
-    print(f"  {'Users':<10} {'Avg Latency (ms)':<20} {'Throughput (req/s)':<20}")
-    print(f"  {'-'*50}")
+    print(f"{'='*72}")
+    print(f"  {'Users':<10} {'Avg Latency (ms)':<20} {'p99 (ms)':<12} {'Throughput (req/s)':<20}")
+    print(f"  {'-'*62}")
     for r in results:
-        print(f"  {r['users']:<10} {r['avg_latency_ms']:<20} {r['throughput_rps']:<20}")
+        print(f"  {r['users']:<10} {r['avg_latency_ms']:<20} {r['p99_ms']:<12} {r['throughput_rps']:<20}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the gRPC microservice and REST monolith")
+    parser.add_argument("--export", action="store_true",
+                        help="compare a full download via GET /drugs/stream and GET /drugs (REST)")
+    parser.add_argument("--payload", action="store_true",
+                        help="compare ListDrugs payloads: full, field-masked and compact (gRPC)")
+    parser.add_argument("--cpu", action="store_true",
+                        help="CPU per request (app and DB containers) for the hot single-drug calls; "
+                             "run with and without PREPARED_STATEMENTS=0 to compare")
+    parser.add_argument("--open-loop", action="store_true",
+                        help="fixed-rate, fixed-duration load instead of the closed-loop user sweep")
+    parser.add_argument("--rate", type=int, nargs="+", default=[100, 500, 1000],
+                        help="target requests/s, one run per value (open loop; --cpu uses the first)")
+    parser.add_argument("--duration", type=float, default=30, help="seconds per run (open loop)")
+    parser.add_argument("--scenario", choices=("write", "read", "stream"), action="append",
+                        help="repeatable; default: write and read (open loop)")
+    parser.add_argument("--target", choices=("grpc", "rest"), nargs="+", default=["grpc", "rest"])
+    parser.add_argument("--grpc-host", default=GRPC_HOST,
+                        help="host:port, or several comma-separated to balance across them directly, "
+                             "e.g. localhost:50051,localhost:50053 (--open-loop, --payload)")
+    parser.add_argument("--balancing", choices=("round_robin", "least_loaded"), default="round_robin",
+                        help="client-side balancing across the --grpc-host servers")
+    parser.add_argument("--rest-host", default=REST_HOST,
+                        help=f"e.g. {REST_ASYNC_HOST} for the async monolith")
+    parser.add_argument("--engine", choices=("threads", "async"), default="threads",
+                        help="async: asyncio driver (grpc.aio + httpx) for 10k+ concurrent users")
+    parser.add_argument("--users", type=int, nargs="+", default=[100, 1000, 10000],
+                        help="virtual users, one run per value (async closed loop)")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="worker processes for the async engine; histograms are merged")
+    parser.add_argument("--channels", type=int, default=8, help="gRPC channels (async engine)")
+    parser.add_argument("--connections", type=int, default=1000, help="HTTP connections (async engine)")
+    parser.add_argument("--mix", help="operation mix, e.g. get=80,adjust=15,list=5, or a preset: "
+                                          "read-heavy, write-heavy, balanced, catalog, lookup (async engine)")
+    parser.add_argument("--dataset", type=parse_size,
+                        help="seed (once) and use a deterministic dataset of this many drugs: 1k, 100k, 1m")
+    parser.add_argument("--zipf", type=float, default=0.99,
+                        help="Zipfian skew of key popularity in [0, 1); 0 = uniform")
+    parser.add_argument("--seed", type=int, default=42, help="dataset and workload seed")
+    parser.add_argument("--output", help="default: open_loop_results.json / async_results.json / "
+                                         "export_results.json / payload_results.json / cpu_results.json")
+    parser.add_argument("--label", help="tag for the saved run in runs/ (see history.py)")
+    args = parser.parse_args()
+    if args.mix and args.engine != "async":
+        print("--mix runs on the async engine; using --engine async")
+        args.engine = "async"
+    return args
 
 if __name__ == "__main__":
+    args = parse_args()
+    REST_HOST = args.rest_host
+    GRPC_BALANCING = args.balancing
+    if args.export:
+        export_main(args)
+        sys.exit(0)
+    if args.payload:
+        payload_main(args)
+        sys.exit(0)
+    if args.cpu:
+        cpu_main(args)
+        sys.exit(0)
+    if args.open_loop or args.engine == "async":
+        load_suite_main(args)
+        sys.exit(0)
+
     user_counts = [10, 50, 100, 500, 1000]
 
     print("\n🚀 Starting Benchmark...")
     print("Make sure both systems are running:")
     print("  gRPC:  localhost:8080")
-    print("  REST:  localhost:9000")
+    print(f"  REST:  {REST_HOST}")
+    print(f"  gRPC threaded (direct): {GRPC_THREADED_HOST}")
+    print(f"  gRPC asyncio (direct):  {GRPC_AIO_HOST}")
+    print(f"  REST async monolith:    {REST_ASYNC_HOST}")
     input("\nPress Enter to start...\n")
 
     # Write benchmarks
@@ -151,25 +845,75 @@ if __name__ == "__main__":
 
     # Read benchmarks
     grpc_read = []
+    grpc_stream = []
     rest_read = []
     for n in user_counts:
         print(f"  Testing {n} concurrent users (READ)...")
         grpc_read.append(run_grpc_benchmark(n, "read"))
         time.sleep(1)
+        grpc_stream.append(run_grpc_benchmark(n, "stream"))
+        time.sleep(1)
         rest_read.append(run_rest_benchmark(n, "read"))
         time.sleep(1)
 
+    # Server mode comparison: one threaded server vs one asyncio server
+    server_modes = (("threaded", GRPC_THREADED_HOST), ("aio", GRPC_AIO_HOST))
+    mode_results = {f"grpc_{mode}_{scenario}": [] for mode, _ in server_modes for scenario in ("write", "read")}
+    for scenario in ("write", "read"):
+        for n in user_counts:
+            print(f"  Testing {n} concurrent users ({scenario.upper()}, threaded vs asyncio)...")
+            for mode, host in server_modes:
+                mode_results[f"grpc_{mode}_{scenario}"].append(run_grpc_benchmark(n, scenario, host))
+                time.sleep(1)
+
+    # Monolith mode comparison: sync (connection per request) vs async (pooled, multi-worker)
+    rest_modes = (("sync", REST_SYNC_HOST), ("async", REST_ASYNC_HOST))
+    for mode, _ in rest_modes:
+        for scenario in ("write", "read"):
+            mode_results[f"rest_{mode}_{scenario}"] = []
+    for scenario in ("write", "read"):
+        for n in user_counts:
+            print(f"  Testing {n} concurrent users ({scenario.upper()}, REST sync vs async)...")
+            for mode, host in rest_modes:
+                mode_results[f"rest_{mode}_{scenario}"].append(run_rest_benchmark(n, scenario, host))
+                time.sleep(1)
+
+    # Batch vs single-item restock
+    grpc_batch = []
+    rest_batch = []
+    for n in (10, 100, 500):
+        print(f"  Restocking {n} drugs (single-item vs batch)...")
+        grpc_batch.append(run_grpc_batch_comparison(n))
+        time.sleep(1)
+        rest_batch.append(run_rest_batch_comparison(n))
+        time.sleep(1)
+
     print_table("gRPC Microservice — Write (Add Drug)", grpc_write)
     print_table("REST Monolith — Write (Add Drug)", rest_write)
     print_table("gRPC Microservice — Read (List Drugs)", grpc_read)
+    print_table("gRPC Microservice — Read (Stream Drugs)", grpc_stream)
     print_table("REST Monolith — Read (List Drugs)", rest_read)
+    print_table("gRPC Threaded Server — Write (Add Drug)", mode_results["grpc_threaded_write"])
+    print_table("gRPC Asyncio Server — Write (Add Drug)", mode_results["grpc_aio_write"])
+    print_table("gRPC Threaded Server — Read (List Drugs)", mode_results["grpc_threaded_read"])
+    print_table("gRPC Asyncio Server — Read (List Drugs)", mode_results["grpc_aio_read"])
+    print_table("REST Sync Monolith — Write (Add Drug)", mode_results["rest_sync_write"])
+    print_table("REST Async Monolith — Write (Add Drug)", mode_results["rest_async_write"])
+    print_table("REST Sync Monolith — Read (List Drugs)", mode_results["rest_sync_read"])
+    print_table("REST Async Monolith — Read (List Drugs)", mode_results["rest_async_read"])
+    print_batch_table("gRPC Microservice — Restock (single-item vs batch)", grpc_batch)
+    print_batch_table("REST Monolith — Restock (single-item vs batch)", rest_batch)
 
     # Save results
     all_results = {
         "grpc_write": grpc_write, "rest_write": rest_write,
-        "grpc_read": grpc_read, "rest_read": rest_read
+        "grpc_read": grpc_read, "rest_read": rest_read,
+        "grpc_stream": grpc_stream,
+        "grpc_batch": grpc_batch, "rest_batch": rest_batch,
+        **mode_results
     }
     with open("results.json", "w") as f:
         json.dump(all_results, f, indent=2)
     print("\n✅ Results saved to results.json")
+    save_run(all_results, config=vars(args), label=args.label)
     print("Run: python plot_results.py to generate graphs")
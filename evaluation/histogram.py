@@ -0,0 +1,102 @@
+"""
+Log-linear latency histogram in the style of HdrHistogram.
+Values are recorded in nanoseconds into buckets whose width grows with the
+value, so the relative error stays below 1/1024 (~0.1%) from 1ns to hours
+while memory stays proportional to the number of distinct buckets hit.
+Histograms can be merged and round-tripped through JSON.
+"""
+
+SUB_BUCKET_BITS = 11
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+SUB_BUCKET_HALF = SUB_BUCKET_COUNT >> 1
+SUMMARY_PERCENTILES = ((50, "p50"), (90, "p90"), (99, "p99"), (99.9, "p999"))
+
+def bucket_index(value):
+    if value < SUB_BUCKET_COUNT:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return (shift << (SUB_BUCKET_BITS - 1)) + (value >> shift)
+
+def bucket_range(index):
+    """(lowest, highest) value that maps to bucket ``index``."""
+    if index < SUB_BUCKET_COUNT:
+        return index, index
+    shift = index // SUB_BUCKET_HALF - 1
+    sub = index - shift * SUB_BUCKET_HALF
+    return sub << shift, ((sub + 1) << shift) - 1
+
+class LatencyHistogram:
+    """Not thread-safe: callers recording from several threads hold a lock."""
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, value_ns):
+        value_ns = max(int(value_ns), 0)
+        index = bucket_index(value_ns)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value_ns
+        self.min = value_ns if self.min is None else min(self.min, value_ns)
+        self.max = max(self.max, value_ns)
+
+    def merge(self, other):
+        for index, n in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + n
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def percentile(self, q):
+        """Highest value equivalent to the q-th percentile, in nanoseconds."""
+        if not self.count:
+            return 0
+        rank = max(1, -(-self.count * q // 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(bucket_range(index)[1], self.max)
+        return self.max
+
+    def cdf(self):
+        """[(latency_ms, fraction of requests at or below it), ...] per bucket."""
+        points = []
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            points.append((min(bucket_range(index)[1], self.max) / 1e6, seen / self.count))
+        return points
+
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def summary(self):
+        """Latency summary in milliseconds."""
+        result = {"count": self.count, "mean_ms": round(self.mean() / 1e6, 3),
+                  "min_ms": round((self.min or 0) / 1e6, 3)}
+        for q, key in SUMMARY_PERCENTILES:
+            result[f"{key}_ms"] = round(self.percentile(q) / 1e6, 3)
+        result["max_ms"] = round(self.max / 1e6, 3)
+        return result
+
+    def to_dict(self):
+        return {"counts": sorted(self.counts.items()), "count": self.count,
+                "total": self.total, "min": self.min, "max": self.max}
+
+    @classmethod
+    def from_dict(cls, data):
+        hist = cls()
+        hist.counts = {int(i): n for i, n in data["counts"]}
+        hist.count = data["count"]
+        hist.total = data["total"]
+        hist.min = data["min"]
+        hist.max = data["max"]
+        return hist
@@ -0,0 +1,179 @@
+"""
+Benchmark run history and regression checks.
+Every benchmark.py run is saved to runs/<timestamp>_<sha>.json together with
+its metadata (git sha, command line config, dataset size). One run can be
+marked as the baseline; compare flags throughput drops and p99 increases
+beyond a tolerance and exits non-zero, so it can gate a change.
+
+Usage: python history.py list
+       python history.py baseline latest
+       python history.py compare [--run latest] [--baseline baseline] [--throughput-tol 0.05] [--p99-tol 0.10]
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+
+EVAL_DIR = os.path.dirname(os.path.abspath(__file__))
+RUNS_DIR = os.environ.get("BENCHMARK_RUNS_DIR", os.path.join(EVAL_DIR, "runs"))
+BASELINE_PATH = os.path.join(RUNS_DIR, "baseline.json")
+# Row fields identifying the load level of a result, in lookup order
+LOAD_KEYS = ("users", "target_rps", "batch_size")
+
+def git(*args):
+    try:
+        return subprocess.run(("git",) + args, cwd=EVAL_DIR, capture_output=True, text=True,
+                              timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+def run_metadata(config=None, dataset_size=None, label=None):
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_sha": git("rev-parse", "HEAD") or None,
+        "git_branch": git("rev-parse", "--abbrev-ref", "HEAD") or None,
+        # Uncommitted changes to the servers make the sha alone misleading
+        "git_dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "config": config or {},
+        "dataset_size": dataset_size,
+        "label": label,
+    }
+
+def save_run(results, config=None, dataset_size=None, label=None):
+    meta = run_metadata(config, dataset_size, label)
+    os.makedirs(RUNS_DIR, exist_ok=True)
+    name = time.strftime("%Y%m%d-%H%M%S") + f"_{(meta['git_sha'] or 'nogit')[:8]}"
+    if label:
+        name += f"_{label}"
+    path = os.path.join(RUNS_DIR, f"{name}.json")
+    with open(path, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+    print(f"📁 Run saved to {os.path.relpath(path)}")
+    return path
+
+def run_paths():
+    return sorted(p for p in glob.glob(os.path.join(RUNS_DIR, "*.json")) if p != BASELINE_PATH)
+
+def resolve_run(ref):
+    """A path, 'latest', 'baseline', or a (unique) prefix of a run name."""
+    if os.path.exists(ref):
+        return ref
+    if ref == "baseline":
+        if not os.path.exists(BASELINE_PATH):
+            raise SystemExit("No baseline set; run: python history.py baseline <run>")
+        return BASELINE_PATH
+    paths = run_paths()
+    if ref == "latest":
+        if not paths:
+            raise SystemExit(f"No runs saved in {RUNS_DIR}")
+        return paths[-1]
+    matches = [p for p in paths if os.path.basename(p).startswith(ref)]
+    if len(matches) != 1:
+        raise SystemExit(f"'{ref}' matches {len(matches)} runs")
+    return matches[0]
+
+def load_run(ref):
+    with open(resolve_run(ref)) as f:
+        data = json.load(f)
+    # Bare results.json files from before run history have no metadata
+    if "results" not in data:
+        data = {"meta": {}, "results": data}
+    return data
+
+def load_level(row):
+    for key in LOAD_KEYS:
+        if row.get(key) is not None:
+            return f"{key}={row[key]}"
+    return None
+
+def compare_runs(baseline, current, throughput_tol=0.05, p99_tol=0.10):
+    """One finding per (series, load level) present in both runs.
+
+    A finding is a regression if throughput fell by more than throughput_tol
+    or p99 rose by more than p99_tol (both relative to the baseline).
+    """
+    findings = []
+    for series, base_rows in baseline["results"].items():
+        cur_rows = current["results"].get(series)
+        if not isinstance(base_rows, list) or not isinstance(cur_rows, list):
+            continue
+        cur_by_load = {load_level(r): r for r in cur_rows if load_level(r)}
+        for base in base_rows:
+            level = load_level(base)
+            cur = cur_by_load.get(level)
+            if cur is None:
+                continue
+            checks = []
+            if base.get("throughput_rps") and "throughput_rps" in cur:
+                change = cur["throughput_rps"] / base["throughput_rps"] - 1
+                checks.append(("throughput_rps", base["throughput_rps"], cur["throughput_rps"], change,
+                               change < -throughput_tol, change > throughput_tol))
+            if base.get("p99_ms") and "p99_ms" in cur:
+                change = cur["p99_ms"] / base["p99_ms"] - 1
+                checks.append(("p99_ms", base["p99_ms"], cur["p99_ms"], change,
+                               change > p99_tol, change < -p99_tol))
+            for metric, before, after, change, worse, better in checks:
+                status = "regression" if worse else "improvement" if better else "ok"
+                findings.append({"series": series, "load": level, "metric": metric, "baseline": before,
+                                 "current": after, "change": round(change, 4), "status": status})
+    return findings
+
+def print_findings(findings):
+    icons = {"regression": "❌", "improvement": "✅", "ok": "  "}
+    print(f"  {'Series':<22} {'Load':<16} {'Metric':<16} {'Baseline':<12} {'Current':<12} {'Change':<10}")
+    print(f"  {'-'*90}")
+    for f in findings:
+        print(f"{icons[f['status']]}{f['series']:<22} {f['load']:<16} {f['metric']:<16} "
+              f"{f['baseline']:<12g} {f['current']:<12g} {f['change'] * 100:+.1f}%")
+
+def describe(path):
+    meta = load_run(path)["meta"]
+    sha = (meta.get("git_sha") or "?")[:8] + ("+dirty" if meta.get("git_dirty") else "")
+    dataset = meta.get("dataset_size") or "-"
+    return f"{os.path.basename(path):<40} {sha:<16} dataset={dataset:<9} {meta.get('label') or ''}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark run history")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="list saved runs")
+    base = sub.add_parser("baseline", help="mark a run as the baseline")
+    base.add_argument("run", nargs="?", default="latest")
+    cmp_ = sub.add_parser("compare", help="compare a run against the baseline; exit 1 on regression")
+    cmp_.add_argument("--run", default="latest")
+    cmp_.add_argument("--baseline", default="baseline")
+    cmp_.add_argument("--throughput-tol", type=float, default=0.05, help="allowed relative throughput drop")
+    cmp_.add_argument("--p99-tol", type=float, default=0.10, help="allowed relative p99 increase")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for path in run_paths():
+            print(describe(path))
+        if os.path.exists(BASELINE_PATH):
+            print(f"\nbaseline: {describe(BASELINE_PATH)}")
+    elif args.command == "baseline":
+        path = resolve_run(args.run)
+        shutil.copyfile(path, BASELINE_PATH)
+        print(f"✅ Baseline set to {os.path.basename(path)}")
+    else:
+        baseline = load_run(args.baseline)
+        current = load_run(args.run)
+        findings = compare_runs(baseline, current, args.throughput_tol, args.p99_tol)
+        if not findings:
+            raise SystemExit("Nothing to compare: the runs share no series and load levels")
+        print(f"\nBaseline {(baseline['meta'].get('git_sha') or '?')[:8]} vs "
+              f"current {(current['meta'].get('git_sha') or '?')[:8]} "
+              f"(throughput -{args.throughput_tol:.0%}, p99 +{args.p99_tol:.0%} allowed)\n")
+        print_findings(findings)
+        regressions = [f for f in findings if f["status"] == "regression"]
+        print(f"\n{len(regressions)} regression(s) in {len(findings)} checks")
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,112 @@
 """
-Plot benchmark results from results.json
+Plot benchmark results from results.json or a saved run
 Usage: python plot_results.py
+       python plot_results.py latest            # or a run name / path (see history.py)
+       python plot_results.py latest --compare baseline
 """
-import json
+import argparse
+import math
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
 
-with open("results.json") as f:
-    data = json.load(f)
+from histogram import LatencyHistogram
+from history import LOAD_KEYS, load_run
+
+parser = argparse.ArgumentParser(description="Plot benchmark results")
+parser.add_argument("run", nargs="?", default="results.json", help="results file, run name, 'latest' or 'baseline'")
+parser.add_argument("--compare", help="second run to overlay on the percentile and CDF charts")
+parser.add_argument("--no-show", action="store_true", help="only write the PNG files")
+args = parser.parse_args()
+
+data = load_run(args.run)["results"]
+other = load_run(args.compare)["results"] if args.compare else None
 
 def extract(results, key):
     return [r[key] for r in results]
 
+def load_key(rows):
+    for key in LOAD_KEYS[:2]:
+        if rows and rows[0].get(key) is not None:
+            return key
+    return None
+
+def percentile_series(results):
+    """Series with per-load latency percentiles (users or target rate on the x axis)."""
+    return {name: rows for name, rows in results.items()
+            if isinstance(rows, list) and rows and load_key(rows) and "p99_ms" in rows[0]}
+
+def grid(n):
+    cols = min(3, n)
+    return math.ceil(n / cols), cols
+
+def plot_percentiles(series, compare, path):
+    rows_, cols = grid(len(series))
+    fig, axes = plt.subplots(rows_, cols, figsize=(6 * cols, 4.5 * rows_), squeeze=False)
+    fig.suptitle("Latency percentiles vs load", fontsize=14, fontweight='bold')
+    fig.subplots_adjust(hspace=0.45, wspace=0.3)
+    styles = (("p50_ms", "p50", "o"), ("p90_ms", "p90", "s"), ("p99_ms", "p99", "^"), ("p999_ms", "p99.9", "D"))
+    for ax, (name, rows) in zip(axes.flat, series.items()):
+        key = load_key(rows)
+        loads = extract(rows, key)
+        for metric, label, marker in styles:
+            line, = ax.plot(loads, extract(rows, metric), marker=marker, label=label, linewidth=2)
+            base = (compare or {}).get(name)
+            if base and load_key(base) == key:
+                ax.plot(extract(base, key), extract(base, metric), marker=marker, linestyle=':',
+                        color=line.get_color(), alpha=0.6, label=f"{label} ({args.compare})")
+        ax.set_title(name)
+        ax.set_xlabel("Concurrent Users" if key == "users" else "Target rate (req/s)")
+        ax.set_ylabel("Latency (ms)")
+        ax.set_xscale("log")
+        ax.set_yscale("log")
+        ax.legend(fontsize=8)
+        ax.grid(True, alpha=0.3, which="both")
+    for ax in list(axes.flat)[len(series):]:
+        ax.axis("off")
+    fig.savefig(path, dpi=150, bbox_inches='tight')
+    print(f"✅ Graph saved to {path}")
+
+def plot_cdfs(series, compare, path):
+    series = {name: rows for name, rows in series.items() if "histogram" in rows[0]}
+    if not series:
+        return
+    rows_, cols = grid(len(series))
+    fig, axes = plt.subplots(rows_, cols, figsize=(6 * cols, 4.5 * rows_), squeeze=False)
+    fig.suptitle("Latency CDF per load level", fontsize=14, fontweight='bold')
+    fig.subplots_adjust(hspace=0.45, wspace=0.3)
+    for ax, (name, rows) in zip(axes.flat, series.items()):
+        key = load_key(rows)
+        runs = [(rows, "-", "")]
+        if compare and compare.get(name) and "histogram" in compare[name][0]:
+            runs.append((compare[name], ":", f" ({args.compare})"))
+        for run_rows, style, suffix in runs:
+            for r in run_rows:
+                hist = LatencyHistogram.from_dict(r["histogram"])
+                if not hist.count:
+                    continue
+                xs, ys = zip(*hist.cdf())
+                ax.plot(xs, ys, linestyle=style, linewidth=1.5, label=f"{r[key]}{suffix}")
+        ax.set_title(name)
+        ax.set_xlabel("Latency (ms)")
+        ax.set_ylabel("Fraction of requests")
+        ax.set_xscale("log")
+        ax.legend(title="Users" if key == "users" else "Rate", fontsize=8)
+        ax.grid(True, alpha=0.3, which="both")
+    for ax in list(axes.flat)[len(series):]:
+        ax.axis("off")
+    fig.savefig(path, dpi=150, bbox_inches='tight')
+    print(f"✅ Graph saved to {path}")
+
+series = percentile_series(data)
+if series:
+    plot_percentiles(series, other, "latency_percentiles.png")
+    plot_cdfs(series, other, "latency_cdf.png")
+
+if not all(k in data for k in ("grpc_write", "rest_write", "grpc_read", "rest_read")):
+    if not args.no_show:
+        plt.show()
+    raise SystemExit(0)
+
 users = extract(data["grpc_write"], "users")
 
 fig = plt.figure(figsize=(14, 10))
@@ -43,6 +138,8 @@ ax2.grid(True, alpha=0.3)
 ax3 = fig.add_subplot(gs[1, 0])
 ax3.plot(users, extract(data["grpc_read"], "avg_latency_ms"), 'b-o', label='gRPC Microservice', linewidth=2)
 ax3.plot(users, extract(data["rest_read"], "avg_latency_ms"), 'r-s', label='REST Monolith', linewidth=2)
+if "grpc_stream" in data:
+    ax3.plot(users, extract(data["grpc_stream"], "avg_latency_ms"), 'c--D', label='gRPC StreamDrugs', linewidth=2)
 ax3.set_title("Read Latency (List Drugs)")
 ax3.set_xlabel("Concurrent Users")
 ax3.set_ylabel("Avg Latency (ms)")
@@ -53,6 +150,8 @@ ax3.grid(True, alpha=0.3)
 ax4 = fig.add_subplot(gs[1, 1])
 ax4.plot(users, extract(data["grpc_read"], "throughput_rps"), 'b-o', label='gRPC Microservice', linewidth=2)
 ax4.plot(users, extract(data["rest_read"], "throughput_rps"), 'r-s', label='REST Monolith', linewidth=2)
+if "grpc_stream" in data:
+    ax4.plot(users, extract(data["grpc_stream"], "throughput_rps"), 'c--D', label='gRPC StreamDrugs', linewidth=2)
 ax4.set_title("Read Throughput (List Drugs)")
 ax4.set_xlabel("Concurrent Users")
 ax4.set_ylabel("Throughput (req/s)")
@@ -61,4 +160,40 @@ ax4.grid(True, alpha=0.3)
 
 plt.savefig("performance_comparison.png", dpi=150, bbox_inches='tight')
 print("✅ Graph saved to performance_comparison.png")
-plt.show()
+
+def plot_mode_comparison(series, modes, title, filename):
+    """series = 'grpc' or 'rest'; modes = [(mode, label, style), ...]."""
+    fig2, axes = plt.subplots(2, 2, figsize=(14, 10))
+    fig2.suptitle(title, fontsize=14, fontweight='bold')
+    fig2.subplots_adjust(hspace=0.4, wspace=0.35)
+    mode_users = extract(data[f"{series}_{modes[0][0]}_write"], "users")
+    panels = [
+        (axes[0][0], "write", "avg_latency_ms", "Write Latency (Add Drug)", "Avg Latency (ms)"),
+        (axes[0][1], "write", "throughput_rps", "Write Throughput (Add Drug)", "Throughput (req/s)"),
+        (axes[1][0], "read", "avg_latency_ms", "Read Latency (List Drugs)", "Avg Latency (ms)"),
+        (axes[1][1], "read", "throughput_rps", "Read Throughput (List Drugs)", "Throughput (req/s)"),
+    ]
+    for ax, scenario, key, panel_title, ylabel in panels:
+        for mode, label, style in modes:
+            ax.plot(mode_users, extract(data[f"{series}_{mode}_{scenario}"], key), style, label=label, linewidth=2)
+        ax.set_title(panel_title)
+        ax.set_xlabel("Concurrent Users")
+        ax.set_ylabel(ylabel)
+        ax.legend()
+        ax.grid(True, alpha=0.3)
+    fig2.savefig(filename, dpi=150, bbox_inches='tight')
+    print(f"✅ Graph saved to {filename}")
+
+# Server mode comparisons (only present in newer results.json files)
+if "grpc_aio_write" in data:
+    plot_mode_comparison("grpc", [("threaded", "Threaded", 'b-o'), ("aio", "asyncio", 'g-^')],
+                         "gRPC Server Mode Comparison\nThreaded (ThreadPoolExecutor) vs asyncio (grpc.aio)",
+                         "server_mode_comparison.png")
+if "rest_async_write" in data:
+    plot_mode_comparison("rest", [("sync", "Sync (connection per request)", 'r-s'),
+                                  ("async", "Async (pool, workers)", 'm-^')],
+                         "REST Monolith Mode Comparison\nsync def + psycopg2 vs async def + pool + workers",
+                         "rest_mode_comparison.png")
+
+if not args.no_show:
+    plt.show()
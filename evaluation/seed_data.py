@@ -0,0 +1,96 @@
+"""
+Deterministic dataset seeder for the benchmark.
+Loads the same N drugs (for a given --seed) through BatchAddDrugs or the
+monolith's POST /drugs/batch, and records the ids it got in
+datasets/<target>_<size>_seed<seed>.json for benchmark.py --dataset.
+
+Usage: python seed_data.py --size 100k --target grpc
+       python seed_data.py --size 1m --target rest --batch 1000
+"""
+import argparse
+import grpc
+import os
+import requests
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../proto'))
+import pharmacy_pb2
+import pharmacy_pb2_grpc
+
+from workload import dataset_rows, ids_to_ranges, load_manifest, parse_size, save_manifest
+
+GRPC_HOST = "localhost:8080"
+REST_HOST = "http://localhost:9000"
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def seed_grpc(rows, batch_size, host):
+    channel = grpc.insecure_channel(host)
+    stub = pharmacy_pb2_grpc.PharmacyServiceStub(channel)
+    for batch in batches(rows, batch_size):
+        resp = stub.BatchAddDrugs(pharmacy_pb2.BatchAddDrugsRequest(
+            drugs=[pharmacy_pb2.AddDrugRequest(**d) for d in batch]
+        ), timeout=120)
+        if not resp.success:
+            raise RuntimeError(f"BatchAddDrugs failed: {resp.message}")
+        yield [r.drug.id for r in resp.results]
+    channel.close()
+
+def seed_rest(rows, batch_size, host):
+    session = requests.Session()
+    for batch in batches(rows, batch_size):
+        resp = session.post(f"{host}/drugs/batch", json=batch, timeout=120)
+        resp.raise_for_status()
+        results = resp.json()
+        failed = [r["error"] for r in results if not r["success"]]
+        if failed:
+            raise RuntimeError(f"POST /drugs/batch failed: {failed[0]}")
+        yield [r["drug"]["id"] for r in results]
+    session.close()
+
+def seed_dataset(target, size, seed=42, batch_size=1000, grpc_host=GRPC_HOST, rest_host=REST_HOST):
+    rows = dataset_rows(size, seed)
+    if target == "grpc":
+        chunks = seed_grpc(rows, batch_size, grpc_host)
+    else:
+        chunks = seed_rest(rows, batch_size, rest_host)
+    ids = []
+    start = time.perf_counter()
+    for chunk in chunks:
+        ids.extend(chunk)
+        rate = len(ids) / (time.perf_counter() - start)
+        print(f"\r  🌱 {target}: {len(ids)}/{size} drugs ({rate:,.0f} rows/s)", end="", flush=True)
+    print()
+    return save_manifest(target, size, seed, ids_to_ranges(ids))
+
+def ensure_dataset(target, size, seed=42, **kwargs):
+    """The manifest for this dataset, seeding it first if it doesn't exist yet."""
+    manifest = load_manifest(target, size, seed)
+    if manifest is None:
+        print(f"Seeding {size} drugs into {target} (seed={seed})...")
+        manifest = seed_dataset(target, size, seed, **kwargs)
+    return manifest
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-load a deterministic drug dataset")
+    parser.add_argument("--size", default="1k", help="number of drugs: 1k, 100k, 1m, ...")
+    parser.add_argument("--target", choices=("grpc", "rest"), nargs="+", default=["grpc", "rest"])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch", type=int, default=1000, help="rows per batch call (<= MAX_BATCH_SIZE)")
+    parser.add_argument("--grpc-host", default=GRPC_HOST)
+    parser.add_argument("--rest-host", default=REST_HOST)
+    args = parser.parse_args()
+    size = parse_size(args.size)
+    for target in args.target:
+        manifest = seed_dataset(target, size, args.seed, args.batch, args.grpc_host, args.rest_host)
+        print(f"  ✅ {target}: ids {manifest['id_ranges'][0][0]}..{manifest['id_ranges'][-1][1]} "
+              f"({len(manifest['id_ranges'])} ranges)")
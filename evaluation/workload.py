@@ -0,0 +1,212 @@
+"""
+Operation mixes, key popularity and datasets for the benchmark.
+A mix like "get=80,adjust=15,list=5" (or a preset name from MIXES) picks
+each request's operation; keys come from a seeded dataset and are drawn
+with Zipfian skew so a few hot drugs take most of the traffic.
+"""
+import json
+import os
+import random
+
+OPERATIONS = ("get", "add", "update", "adjust", "delete", "list", "lowstock", "stream", "search", "expiring")
+MIXES = {
+    "read-heavy": "get=80,adjust=15,list=5",
+    "write-heavy": "get=30,add=20,update=20,adjust=25,delete=5",
+    "balanced": "get=50,add=10,update=10,adjust=15,delete=5,list=5,lowstock=5",
+    "catalog": "get=60,list=25,lowstock=15",
+    "lookup": "search=60,get=40",
+}
+# list/lowstock read one page, as a UI would
+LIST_PAGE_SIZE = 50
+LOW_STOCK_THRESHOLD = 20
+EXPIRING_WITHIN_DAYS = 30
+# search asks for a short result list, as an autocomplete box would
+SEARCH_LIMIT = 10
+DATASET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "datasets")
+
+def parse_mix(spec):
+    """'get=80,list=20' or a MIXES preset -> [(op, weight), ...]"""
+    spec = MIXES.get(spec, spec)
+    mix = []
+    for part in spec.split(","):
+        op, _, weight = part.partition("=")
+        op = op.strip()
+        if op not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{op}' in mix (expected one of {', '.join(OPERATIONS)})")
+        try:
+            weight = float(weight)
+        except ValueError:
+            raise ValueError(f"Mix entry '{part}' must look like op=weight")
+        if weight > 0:
+            mix.append((op, weight))
+    if not mix:
+        raise ValueError("Mix has no operations with a positive weight")
+    return mix
+
+def parse_size(text):
+    """'1k' / '100k' / '1m' / '5000' -> int"""
+    text = str(text).strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+class ZipfianGenerator:
+    """Ranks 0..n-1 with P(rank) proportional to 1/(rank+1)**theta.
+
+    Constant-time sampling after an O(n) setup, as in YCSB (Gray et al.,
+    "Quickly generating billion-record synthetic databases"). theta=0 is uniform.
+    """
+
+    def __init__(self, n, theta, rng):
+        if not 0 <= theta < 1:
+            raise ValueError("theta must be in [0, 1)")
+        self.n = n
+        self.theta = theta
+        self.rng = rng
+        if theta:
+            self.zetan = sum(1 / (i ** theta) for i in range(1, n + 1))
+            zeta2 = 1 + 0.5 ** theta
+            self.alpha = 1 / (1 - theta)
+            self.eta = (1 - (2 / n) ** (1 - theta)) / (1 - zeta2 / self.zetan)
+            self.half_pow_theta = 0.5 ** theta
+
+    def next(self):
+        if not self.theta or self.n < 2:
+            return self.rng.randrange(self.n)
+        u = self.rng.random()
+        uz = u * self.zetan
+        if uz < 1:
+            return 0
+        if uz < 1 + self.half_pow_theta:
+            return 1
+        return min(self.n - 1, int(self.n * (self.eta * u - self.eta + 1) ** self.alpha))
+
+class KeySpace:
+    """Maps Zipfian ranks onto dataset ids.
+
+    Ranks are scattered with a multiplicative permutation so the hot keys are
+    spread over the table instead of all sitting on its first pages.
+    """
+
+    def __init__(self, id_ranges, theta, rng):
+        self.id_ranges = [tuple(r) for r in id_ranges]
+        self.size = sum(hi - lo + 1 for lo, hi in self.id_ranges)
+        if not self.size:
+            raise ValueError("Dataset has no ids")
+        self.zipf = ZipfianGenerator(self.size, theta, rng)
+        self.multiplier = 2654435761 % self.size or 1
+        while _gcd(self.multiplier, self.size) != 1:
+            self.multiplier += 1
+
+    def id_at(self, index):
+        for lo, hi in self.id_ranges:
+            span = hi - lo + 1
+            if index < span:
+                return lo + index
+            index -= span
+        raise IndexError(index)
+
+    def next(self):
+        return self.id_at(self.zipf.next() * self.multiplier % self.size)
+
+def _gcd(a, b):
+    while b:
+        a, b = b, a % b
+    return a
+
+class Workload:
+    """Yields (operation, drug_id) pairs; drug_id is None for add/list/lowstock/stream/search/expiring.
+
+    Deletes only remove drugs this workload added itself, so the seeded key
+    space stays intact; with nothing to delete an add is issued instead.
+    """
+
+    def __init__(self, mix, id_ranges, theta=0.99, seed=0):
+        self.rng = random.Random(seed)
+        self.ops = [op for op, _ in mix]
+        self.cum_weights = []
+        total = 0
+        for _, weight in mix:
+            total += weight
+            self.cum_weights.append(total)
+        self.keys = KeySpace(id_ranges, theta, self.rng) if id_ranges else None
+        self.added = []
+        self._adjust_sign = 1
+
+    def next(self):
+        op = self.rng.choices(self.ops, cum_weights=self.cum_weights)[0]
+        if op == "delete":
+            if not self.added:
+                return "add", None
+            return op, self.added.pop()
+        if op in ("get", "update", "adjust"):
+            if self.keys is None:
+                raise ValueError(f"Operation '{op}' needs a dataset (--dataset)")
+            return op, self.keys.next()
+        return op, None
+
+    def adjust_delta(self):
+        # Alternating +1/-1 keeps seeded quantities (and "Insufficient stock") stable
+        self._adjust_sign = -self._adjust_sign
+        return self._adjust_sign
+
+    def update_quantity(self):
+        return self.rng.randrange(0, 1000)
+
+    def search_query(self):
+        # Half are name prefixes, half whole names with one letter dropped
+        name = self.rng.choice(DRUG_NAMES)
+        if self.rng.random() < 0.5:
+            return name[:self.rng.randint(3, 6)]
+        i = self.rng.randrange(1, len(name) - 1)
+        return name[:i] + name[i + 1:]
+
+    def record_added(self, drug_id):
+        self.added.append(drug_id)
+
+# ─── Datasets ────────────────────────────────────────────────────────────────
+
+DRUG_NAMES = ("Amoxicillin", "Paracetamol", "Ibuprofen", "Metformin", "Atorvastatin", "Omeprazole",
+              "Lisinopril", "Amlodipine", "Cetirizine", "Azithromycin", "Losartan", "Salbutamol",
+              "Prednisolone", "Sertraline", "Levothyroxine", "Ciprofloxacin", "Diclofenac", "Insulin")
+STRENGTHS = ("5mg", "10mg", "20mg", "50mg", "100mg", "250mg", "500mg", "1g")
+CATEGORIES = ("Antibiotic", "Pain Relief", "Diabetes", "Cardiology", "Gastro", "Allergy",
+              "Respiratory", "Endocrine", "Mental Health", "Dermatology", "Vitamins", "Vaccines")
+
+def dataset_rows(size, seed=42):
+    """The same ``size`` drug dicts for the same seed, every time."""
+    rng = random.Random(seed)
+    for i in range(size):
+        expiry = f"{rng.randint(2025, 2029)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        yield {
+            "name": f"{rng.choice(DRUG_NAMES)} {rng.choice(STRENGTHS)} #{i}",
+            "quantity": rng.randrange(0, 1000),
+            "price": round(rng.uniform(0.5, 200), 2),
+            "expiry_date": expiry,
+            "category": rng.choice(CATEGORIES),
+        }
+
+def manifest_path(target, size, seed=42):
+    return os.path.join(DATASET_DIR, f"{target}_{size}_seed{seed}.json")
+
+def load_manifest(target, size, seed=42):
+    path = manifest_path(target, size, seed)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def save_manifest(target, size, seed, id_ranges):
+    os.makedirs(DATASET_DIR, exist_ok=True)
+    manifest = {"target": target, "size": size, "seed": seed, "id_ranges": id_ranges}
+    with open(manifest_path(target, size, seed), "w") as f:
+        json.dump(manifest, f)
+    return manifest
+
+def ids_to_ranges(ids):
+    ranges = []
+    for drug_id in sorted(ids):
+        if ranges and drug_id == ranges[-1][1] + 1:
+            ranges[-1][1] = drug_id
+        else:
+            ranges.append([drug_id, drug_id])
+    return ranges
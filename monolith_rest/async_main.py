@@ -0,0 +1,316 @@
+"""
+Async mode of the REST monolith: the same endpoints as main.py declared as
+`async def` on a psycopg 3 AsyncConnectionPool opened in the app lifespan,
+rendered with orjson. Run several worker processes with uvicorn's --workers
+(or WEB_CONCURRENCY); each worker has its own pool of DB_POOL_MIN..DB_POOL_MAX.
+
+    uvicorn async_main:app --workers 4
+"""
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import List, Optional
+import asyncio
+import os
+
+import orjson
+
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+from psycopg_pool import AsyncConnectionPool
+
+from main import (
+    DB_HOST, DB_NAME, DB_USER, DB_PASS, MAX_PAGE_SIZE, MAX_EXPIRING_DAYS,
+    SQL_ADD_DRUG, SQL_GET_DRUG, SQL_UPDATE_STOCK, SQL_DELETE_DRUG, SQL_DRUG_EXISTS,
+    SQL_ALLOCATE_IDS, SQL_LOCK_DRUGS, SQL_BATCH_INSERT, SQL_BATCH_UPDATE,
+    SQL_CLAIM_ADJUSTMENT, SQL_GET_ADJUSTMENT, SQL_ADJUST_STOCK, SQL_RECORD_ADJUSTMENT,
+    SQL_PURGE_ADJUSTMENTS, IDEMPOTENCY_KEY_TTL_HOURS, IDEMPOTENCY_PURGE_INTERVAL,
+    SQL_SNAPSHOT, SQL_TABLE_VERSION, page_cache, request_key, page_etag, etag_matches,
+    not_modified, cached_response,
+    STREAM_BATCH_SIZE, STREAM_MAX_BATCH_SIZE, StreamEncoder, accepts_gzip, stream_query, stream_response,
+    SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT, MAX_SEARCH_QUERY_LENGTH, SQL_SEARCH_DRUGS, search_params, search_hit,
+    DrugCreate, StockUpdate, StockAdjust, StockUpdateItem, TimedRender, TimedRoute,
+    check_batch_size, init_db, list_filters, low_stock_filters, expiring_filters, expiring_key,
+    page_query, page_result, row_to_dict, validate_new_drug, expiry_param, metrics, profiler,
+)
+
+DB_PORT = os.environ.get("DB_PORT", "5432")
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", "5"))
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", "20"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "5"))
+# Run the hot statements as server-side prepared statements ("0" sends plain SQL)
+PREPARED_STATEMENTS = os.environ.get("PREPARED_STATEMENTS", "1") != "0"
+
+class TimedORJSONResponse(TimedRender, ORJSONResponse):
+    pass
+
+async def configure_connection(conn):
+    conn.server_cursor_factory = metrics.AsyncTimedServerCursor
+    # The hot statements pass prepare=PREPARED_STATEMENTS; with it off, psycopg
+    # doesn't prepare anything on its own either.
+    if not PREPARED_STATEMENTS:
+        conn.prepare_threshold = None
+
+def make_pool():
+    return metrics.TimedConnectionPool(
+        f"host={DB_HOST} port={DB_PORT} dbname={DB_NAME} user={DB_USER} password={DB_PASS}",
+        min_size=DB_POOL_MIN, max_size=DB_POOL_MAX, timeout=DB_POOL_TIMEOUT,
+        check=AsyncConnectionPool.check_connection,
+        kwargs={"cursor_factory": metrics.AsyncTimedCursor}, configure=configure_connection,
+        name="mono", open=False,
+    )
+
+pool = make_pool()
+
+async def purge_idempotency_keys():
+    while True:
+        await asyncio.sleep(IDEMPOTENCY_PURGE_INTERVAL)
+        try:
+            async with pool.connection() as conn:
+                cur = await conn.execute(SQL_PURGE_ADJUSTMENTS, (IDEMPOTENCY_KEY_TTL_HOURS,))
+                if cur.rowcount:
+                    print(f"Purged {cur.rowcount} expired idempotency keys")
+        except Exception as e:
+            print(f"Idempotency key purge failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app):
+    await asyncio.to_thread(init_db)
+    await pool.open(wait=True)
+    purger = asyncio.create_task(purge_idempotency_keys()) if IDEMPOTENCY_PURGE_INTERVAL > 0 else None
+    metrics.REGISTRY.register_collector(lambda: [
+        ("pharmacy_db_pool", "gauge", "Connection pool state (from pool stats).",
+         {"pool": pool.name, "stat": stat}, value) for stat, value in pool.get_stats().items()
+    ] + [("pharmacy_prepared_statements_enabled", "gauge",
+          "1 if the hot statements run as server-side prepared statements.", {}, int(PREPARED_STATEMENTS))])
+    print(f"Async monolith pool ready (pid={os.getpid()}, min={DB_POOL_MIN}, max={DB_POOL_MAX})")
+    try:
+        yield
+    finally:
+        if purger is not None:
+            purger.cancel()
+        await pool.close()
+
+app = FastAPI(title="Pharmacy Monolith REST API (async)", lifespan=lifespan,
+              default_response_class=TimedORJSONResponse)
+app.router.route_class = TimedRoute
+
+def values_list(template, rows):
+    """VALUES list and flat parameters for psycopg 3, which has no execute_values."""
+    return ", ".join([template] * len(rows)), [v for row in rows for v in row]
+
+async def fetch_page(request, if_none_match, clauses, params, order_by, page_size, key, scope=""):
+    """Same conditional GET flow as main.fetch_page."""
+    sql, params = page_query(clauses, params, order_by, page_size)
+    cache_key = request_key(request) + scope
+    async with pool.connection() as conn:
+        await conn.execute(SQL_SNAPSHOT)
+        cur = await conn.execute(SQL_TABLE_VERSION)
+        version = (await cur.fetchone())[0]
+        etag = page_etag(version, cache_key)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        entry = page_cache.get(cache_key, version)
+        if entry is None:
+            cur = await conn.execute(sql, params)
+            drugs, headers = page_result(await cur.fetchall(), page_size, key)
+            entry = page_cache.put(cache_key, version, TimedORJSONResponse(drugs).body, headers)
+    return cached_response(entry, etag)
+
+@app.post("/drugs")
+async def add_drug(drug: DrugCreate):
+    error = validate_new_drug(drug)
+    if error:
+        raise HTTPException(status_code=422, detail=error)
+    async with pool.connection() as conn:
+        cur = await conn.execute(
+            SQL_ADD_DRUG, (drug.name, drug.quantity, drug.price, expiry_param(drug.expiry_date), drug.category),
+            prepare=PREPARED_STATEMENTS,
+        )
+        drug_id = (await cur.fetchone())[0]
+    return {"id": drug_id, **drug.dict()}
+
+@app.post("/drugs/batch")
+async def add_drugs_batch(drugs: List[DrugCreate]):
+    """Insert many drugs in one transaction; result i is the outcome of item i."""
+    check_batch_size(len(drugs))
+    results = [None] * len(drugs)
+    valid = []
+    for i, drug in enumerate(drugs):
+        error = validate_new_drug(drug)
+        if error:
+            results[i] = {"success": False, "error": error}
+        else:
+            valid.append(i)
+    if valid:
+        async with pool.connection() as conn:
+            cur = await conn.execute(SQL_ALLOCATE_IDS, (len(valid),))
+            ids = [r[0] for r in await cur.fetchall()]
+            rows = [(drug_id, drugs[i].name, drugs[i].quantity, drugs[i].price, expiry_param(drugs[i].expiry_date),
+                     drugs[i].category) for drug_id, i in zip(ids, valid)]
+            values, params = values_list("(%s,%s,%s,%s,%s,%s)", rows)
+            await conn.execute(SQL_BATCH_INSERT % values, params)
+        for drug_id, i in zip(ids, valid):
+            results[i] = {"success": True, "drug": {"id": drug_id, **drugs[i].dict()}}
+    return results
+
+@app.get("/drugs/stream")
+async def stream_drugs(batch_size: int = Query(STREAM_BATCH_SIZE, ge=1, le=STREAM_MAX_BATCH_SIZE),
+                       category: Optional[str] = None,
+                       expiry_from: Optional[date] = None,
+                       expiry_to: Optional[date] = None,
+                       accept_encoding: Optional[str] = Header(None)):
+    """Same contract as main.stream_drugs."""
+    sql, params = stream_query(category, expiry_from, expiry_to)
+    gzip = accepts_gzip(accept_encoding)
+    encoder = StreamEncoder(gzip)
+
+    async def chunks():
+        # The pooled connection is held until the last row is sent
+        async with pool.connection() as conn:
+            async with conn.cursor(name="stream_drugs") as cur:
+                await cur.execute(sql, params)
+                while True:
+                    rows = await cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield encoder.encode(b"".join(orjson.dumps(row_to_dict(r)) + b"\n" for r in rows))
+        yield encoder.finish()
+    return stream_response(chunks(), gzip)
+
+@app.get("/drugs/search")
+async def search_drugs(q: str = Query(..., max_length=MAX_SEARCH_QUERY_LENGTH),
+                       limit: int = Query(SEARCH_DEFAULT_LIMIT, ge=1, le=SEARCH_MAX_LIMIT)):
+    """Same contract as main.search_drugs."""
+    params = search_params(q, limit)
+    async with pool.connection() as conn:
+        cur = await conn.execute(SQL_SEARCH_DRUGS, params)
+        rows = await cur.fetchall()
+    return [search_hit(r) for r in rows]
+
+@app.get("/drugs/expiring")
+async def expiring_drugs(request: Request,
+                         within_days: int = Query(30, ge=0, le=MAX_EXPIRING_DAYS),
+                         include_expired: bool = False,
+                         page_size: int = Query(0, ge=0, le=MAX_PAGE_SIZE),
+                         page_token: Optional[str] = None,
+                         category: Optional[str] = None,
+                         if_none_match: Optional[str] = Header(None)):
+    """Same contract as main.expiring_drugs."""
+    today = date.today()
+    clauses, params = expiring_filters(within_days, include_expired, page_token, category, today)
+    return await fetch_page(request, if_none_match, clauses, params, "expiry_date, id", page_size, expiring_key,
+                            scope=f"#{today}")
+
+@app.put("/drugs/stock/batch")
+async def update_stock_batch(updates: List[StockUpdateItem]):
+    """Set many quantities in one transaction; the last update for an id wins."""
+    check_batch_size(len(updates))
+    quantities = {u.id: u.quantity for u in updates}
+    by_id = {}
+    if quantities:
+        async with pool.connection() as conn:
+            # Lock in id order so concurrent batches can't deadlock
+            await conn.execute(SQL_LOCK_DRUGS, (list(quantities),))
+            values, params = values_list("(%s::int,%s::int)", list(quantities.items()))
+            cur = await conn.execute(SQL_BATCH_UPDATE % values, params)
+            by_id = {r[0]: r for r in await cur.fetchall()}
+    return [{"success": True, "drug": row_to_dict(by_id[u.id])} if u.id in by_id
+            else {"success": False, "error": "Drug not found"} for u in updates]
+
+@app.get("/drugs/{drug_id}")
+async def get_drug(drug_id: int):
+    async with pool.connection() as conn:
+        cur = await conn.execute(SQL_GET_DRUG, (drug_id,), prepare=PREPARED_STATEMENTS)
+        row = await cur.fetchone()
+    if not row:
+        raise HTTPException(status_code=404, detail="Drug not found")
+    return row_to_dict(row)
+
+@app.put("/drugs/{drug_id}/stock")
+async def update_stock(drug_id: int, update: StockUpdate):
+    async with pool.connection() as conn:
+        cur = await conn.execute(SQL_UPDATE_STOCK, (update.quantity, drug_id), prepare=PREPARED_STATEMENTS)
+        row = await cur.fetchone()
+    if not row:
+        raise HTTPException(status_code=404, detail="Drug not found")
+    return row_to_dict(row)
+
+@app.post("/drugs/{drug_id}/stock/adjust")
+async def adjust_stock(drug_id: int, adjust: StockAdjust, response: Response,
+                       idempotency_key: Optional[str] = Header(None, max_length=128)):
+    """Same contract as main.adjust_stock."""
+    # An HTTPException leaving the block rolls the transaction back
+    async with pool.connection() as conn:
+        if idempotency_key:
+            cur = await conn.execute(SQL_CLAIM_ADJUSTMENT, (idempotency_key, drug_id, adjust.delta))
+            if await cur.fetchone() is None:
+                cur = await conn.execute(SQL_GET_ADJUSTMENT, (idempotency_key,))
+                if await cur.fetchone() != (drug_id, adjust.delta):
+                    raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different adjustment")
+                cur = await conn.execute(SQL_GET_DRUG, (drug_id,), prepare=PREPARED_STATEMENTS)
+                row = await cur.fetchone()
+                if not row:
+                    raise HTTPException(status_code=404, detail="Drug not found")
+                response.headers["Idempotent-Replayed"] = "true"
+                return row_to_dict(row)
+        cur = await conn.execute(SQL_ADJUST_STOCK, (adjust.delta, drug_id, adjust.delta), prepare=PREPARED_STATEMENTS)
+        row = await cur.fetchone()
+        if not row:
+            cur = await conn.execute(SQL_DRUG_EXISTS, (drug_id,), prepare=PREPARED_STATEMENTS)
+            if await cur.fetchone() is None:
+                raise HTTPException(status_code=404, detail="Drug not found")
+            raise HTTPException(status_code=409, detail="Insufficient stock")
+        if idempotency_key:
+            await conn.execute(SQL_RECORD_ADJUSTMENT, (row[2], idempotency_key))
+    return row_to_dict(row)
+
+@app.delete("/drugs/{drug_id}")
+async def delete_drug(drug_id: int):
+    async with pool.connection() as conn:
+        cur = await conn.execute(SQL_DELETE_DRUG, (drug_id,), prepare=PREPARED_STATEMENTS)
+        row = await cur.fetchone()
+    if not row:
+        raise HTTPException(status_code=404, detail="Drug not found")
+    return {"success": True, "message": f"Drug {drug_id} deleted"}
+
+@app.get("/drugs")
+async def list_drugs(request: Request,
+                     page_size: int = Query(0, ge=0, le=MAX_PAGE_SIZE),
+                     page_token: Optional[str] = None,
+                     category: Optional[str] = None,
+                     expiry_from: Optional[date] = None,
+                     expiry_to: Optional[date] = None,
+                     if_none_match: Optional[str] = Header(None)):
+    clauses, params = list_filters(page_token, category, expiry_from, expiry_to)
+    return await fetch_page(request, if_none_match, clauses, params, "id", page_size, lambda r: (r[0],))
+
+@app.get("/drugs/alert/low-stock")
+async def low_stock(request: Request,
+                    threshold: int = 100,
+                    page_size: int = Query(0, ge=0, le=MAX_PAGE_SIZE),
+                    page_token: Optional[str] = None,
+                    category: Optional[str] = None,
+                    expiry_from: Optional[date] = None,
+                    expiry_to: Optional[date] = None,
+                    if_none_match: Optional[str] = Header(None)):
+    clauses, params = low_stock_filters(threshold, page_token, category, expiry_from, expiry_to)
+    return await fetch_page(request, if_none_match, clauses, params, "quantity, id", page_size,
+                            lambda r: (r[2], r[0]))
+
+@app.post("/admin/profile", response_class=PlainTextResponse, include_in_schema=False)
+async def admin_profile(seconds: float = 10, interval_ms: int = 0,
+                        x_admin_token: Optional[str] = Header(None)):
+    if not profiler.admin_allowed(x_admin_token or ""):
+        raise HTTPException(status_code=403, detail="Profiling requires a valid X-Admin-Token")
+    try:
+        # Sampling from a worker thread sees the event loop's stacks too
+        stacks, samples = await asyncio.to_thread(profiler.profile, seconds, interval_ms)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except profiler.ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(stacks, headers={"X-Profile-Samples": str(samples)})
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
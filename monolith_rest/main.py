@@ -1,19 +1,169 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.routing import APIRoute
 from pydantic import BaseModel
 from typing import Optional, List
+from collections import OrderedDict
+from datetime import date, timedelta
+from urllib.parse import urlencode
+import base64
+import binascii
+import hashlib
+import json
 import psycopg2
+import psycopg2.extras
 import os
+import sys
+import threading
 import time
+import zlib
 
-app = FastAPI(title="Pharmacy Monolith REST API")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../common'))
+import metrics
+import profiler
+
+# ─── Metrics ─────────────────────────────────────────────────────────────────
+# Same series as the gRPC servers' interceptors, labelled "METHOD /path".
+
+class TimedRoute(APIRoute):
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        endpoint = f"{','.join(sorted(self.methods))} {self.path}"
+
+        async def timed_handler(request):
+            stats = metrics.begin_request(endpoint)
+            try:
+                response = await handler(request)
+            except HTTPException as e:
+                metrics.finish_request(stats, e.status_code, "status")
+                raise
+            except RequestValidationError:
+                metrics.finish_request(stats, 422, "status")
+                raise
+            except Exception:
+                metrics.finish_request(stats, 500, "exception")
+                raise
+            code = response.status_code
+            metrics.finish_request(stats, code, "status" if code >= 400 else None)
+            return response
+        return timed_handler
+
+class TimedRender:
+    """Mixin timing a response class's render() as serialization."""
+
+    def render(self, content):
+        start = time.perf_counter()
+        try:
+            return super().render(content)
+        finally:
+            stats = metrics.current_request.get()
+            if stats is not None:
+                metrics.record_serialization(stats.endpoint, "serialize", time.perf_counter() - start)
+
+class TimedJSONResponse(TimedRender, JSONResponse):
+    pass
+
+app = FastAPI(title="Pharmacy Monolith REST API", default_response_class=TimedJSONResponse)
+app.router.route_class = TimedRoute
 
 DB_HOST = os.environ.get("DB_HOST", "db-mono")
 DB_NAME = os.environ.get("DB_NAME", "pharmacy")
 DB_USER = os.environ.get("DB_USER", "postgres")
 DB_PASS = os.environ.get("DB_PASS", "postgres")
+MAX_PAGE_SIZE = int(os.environ.get("MAX_PAGE_SIZE", "1000"))
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "1000"))
+IDEMPOTENCY_KEY_TTL_HOURS = float(os.environ.get("IDEMPOTENCY_KEY_TTL_HOURS", "24"))
+IDEMPOTENCY_PURGE_INTERVAL = float(os.environ.get("IDEMPOTENCY_PURGE_INTERVAL", "3600"))
+# Rendered list/low-stock pages kept per worker for conditional GETs
+PAGE_CACHE_SIZE = int(os.environ.get("PAGE_CACHE_SIZE", "256"))
+# Larger bodies (e.g. unpaged full-table lists) are rendered every time
+PAGE_CACHE_MAX_BYTES = int(os.environ.get("PAGE_CACHE_MAX_BYTES", str(1 << 20)))
+# drugs_version is spread over this many rows so writers don't queue on one
+VERSION_SHARDS = 16
+# GET /drugs/stream: rows per server-side cursor FETCH (and per chunk sent)
+STREAM_BATCH_SIZE = int(os.environ.get("STREAM_BATCH_SIZE", "500"))
+STREAM_MAX_BATCH_SIZE = int(os.environ.get("STREAM_MAX_BATCH_SIZE", "5000"))
+# GET /drugs/search
+SEARCH_DEFAULT_LIMIT = int(os.environ.get("SEARCH_DEFAULT_LIMIT", "20"))
+SEARCH_MAX_LIMIT = int(os.environ.get("SEARCH_MAX_LIMIT", "100"))
+MAX_SEARCH_QUERY_LENGTH = 100
+# GET /drugs/expiring looks at most this far ahead (keeps the cutoff a valid date)
+MAX_EXPIRING_DAYS = 36500
+DRUG_COLUMNS = "id, name, quantity, price, expiry_date, category"
+
+# Shared with async_main.py
+SQL_ADD_DRUG = "INSERT INTO drugs (name, quantity, price, expiry_date, category) VALUES (%s,%s,%s,%s,%s) RETURNING id"
+SQL_GET_DRUG = f"SELECT {DRUG_COLUMNS} FROM drugs WHERE id=%s"
+SQL_UPDATE_STOCK = f"UPDATE drugs SET quantity=%s WHERE id=%s RETURNING {DRUG_COLUMNS}"
+SQL_DELETE_DRUG = "DELETE FROM drugs WHERE id=%s RETURNING id"
+SQL_DRUG_EXISTS = "SELECT 1 FROM drugs WHERE id=%s"
+SQL_ALLOCATE_IDS = "SELECT nextval(pg_get_serial_sequence('drugs', 'id')) FROM generate_series(1, %s)"
+SQL_LOCK_DRUGS = "SELECT id FROM drugs WHERE id = ANY(%s) ORDER BY id FOR UPDATE"
+SQL_BATCH_INSERT = "INSERT INTO drugs (id, name, quantity, price, expiry_date, category) VALUES %s"
+SQL_BATCH_UPDATE = ("UPDATE drugs AS d SET quantity = v.quantity FROM (VALUES %s) AS v(id, quantity) "
+                    "WHERE d.id = v.id RETURNING d.id, d.name, d.quantity, d.price, d.expiry_date, d.category")
+SQL_CLAIM_ADJUSTMENT = ("INSERT INTO stock_adjustments (idempotency_key, drug_id, delta) VALUES (%s,%s,%s) "
+                        "ON CONFLICT DO NOTHING RETURNING idempotency_key")
+SQL_GET_ADJUSTMENT = "SELECT drug_id, delta FROM stock_adjustments WHERE idempotency_key=%s"
+SQL_ADJUST_STOCK = (f"UPDATE drugs SET quantity = quantity + %s WHERE id=%s AND quantity + %s >= 0 "
+                    f"RETURNING {DRUG_COLUMNS}")
+SQL_RECORD_ADJUSTMENT = "UPDATE stock_adjustments SET quantity=%s WHERE idempotency_key=%s"
+SQL_PURGE_ADJUSTMENTS = "DELETE FROM stock_adjustments WHERE created_at < now() - %s * interval '1 hour'"
+# Same as the gRPC servers: prefix hits off the (lower(name) COLLATE "C")
+# btree, typo-tolerant hits off the trigram GiST index, both bounded by LIMIT.
+SQL_SEARCH_DRUGS = f"""
+    WITH prefix AS (
+        SELECT {DRUG_COLUMNS}, true AS is_prefix FROM drugs
+        WHERE lower(name) COLLATE "C" LIKE %s
+        ORDER BY lower(name) COLLATE "C", id
+        LIMIT %s
+    ), fuzzy AS (
+        SELECT {DRUG_COLUMNS}, false AS is_prefix FROM drugs
+        WHERE lower(name) %% %s
+        ORDER BY lower(name) <-> %s
+        LIMIT %s
+    ), hits AS (
+        SELECT * FROM prefix
+        UNION ALL
+        SELECT * FROM fuzzy WHERE id NOT IN (SELECT id FROM prefix)
+    )
+    SELECT {DRUG_COLUMNS}, is_prefix, similarity(lower(name), %s) AS score FROM hits
+    ORDER BY is_prefix DESC, score DESC, name, id
+    LIMIT %s
+"""
+# Same in-place VARCHAR -> DATE conversion as the gRPC servers run
+SQL_MIGRATE_EXPIRY_DATE = """
+    DO $$
+    BEGIN
+        IF (SELECT data_type FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = 'drugs'
+              AND column_name = 'expiry_date') <> 'date' THEN
+            CREATE OR REPLACE FUNCTION pg_temp.to_expiry_date(value text) RETURNS date AS $f$
+            BEGIN
+                RETURN NULLIF(trim(value), '')::date;
+            EXCEPTION WHEN others THEN
+                RETURN NULL;
+            END
+            $f$ LANGUAGE plpgsql;
+            ALTER TABLE drugs ALTER COLUMN expiry_date TYPE DATE USING pg_temp.to_expiry_date(expiry_date);
+        END IF;
+    END
+    $$
+"""
+# The version and the page are read in one snapshot, so a cached body always
+# matches the version it is stored under.
+SQL_SNAPSHOT = "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY"
+SQL_TABLE_VERSION = "SELECT sum(version) FROM drugs_version"
 
+# One connection per request, so there is nothing to gain from preparing
+# statements here; async_main.py prepares the hot ones on its pooled connections.
 def get_conn():
-    return psycopg2.connect(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASS)
+    start = time.perf_counter()
+    conn = psycopg2.connect(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASS,
+                            cursor_factory=metrics.TimedCursor)
+    metrics.record_connect(time.perf_counter() - start)
+    return conn
 
 def init_db():
     for i in range(10):
@@ -26,10 +176,50 @@ def init_db():
                     name VARCHAR(255) NOT NULL,
                     quantity INTEGER NOT NULL DEFAULT 0,
                     price FLOAT NOT NULL DEFAULT 0.0,
-                    expiry_date VARCHAR(50),
+                    expiry_date DATE,
                     category VARCHAR(100)
                 )
             """)
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_drugs_quantity_id ON drugs (quantity, id)")
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_drugs_category_id ON drugs (category, id)")
+            cur.execute(SQL_MIGRATE_EXPIRY_DATE)
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_drugs_expiry_date_id ON drugs (expiry_date, id)")
+            cur.execute("DROP INDEX IF EXISTS idx_drugs_expiry_date")
+            cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cur.execute('CREATE INDEX IF NOT EXISTS idx_drugs_name_prefix ON drugs ((lower(name) COLLATE "C"), id)')
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_drugs_name_trgm ON drugs USING gist (lower(name) gist_trgm_ops)")
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS stock_adjustments (
+                    idempotency_key VARCHAR(128) PRIMARY KEY,
+                    drug_id INTEGER NOT NULL,
+                    delta INTEGER NOT NULL,
+                    quantity INTEGER,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+            """)
+            cur.execute(SQL_PURGE_ADJUSTMENTS, (IDEMPOTENCY_KEY_TTL_HOURS,))
+            # Every statement that writes drugs bumps one shard; the sum is the table version
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS drugs_version (
+                    shard INTEGER PRIMARY KEY,
+                    version BIGINT NOT NULL DEFAULT 0
+                )
+            """)
+            cur.execute("INSERT INTO drugs_version (shard) SELECT generate_series(0, %s) ON CONFLICT DO NOTHING",
+                        (VERSION_SHARDS - 1,))
+            cur.execute(f"""
+                CREATE OR REPLACE FUNCTION bump_drugs_version() RETURNS trigger AS $$
+                BEGIN
+                    UPDATE drugs_version SET version = version + 1 WHERE shard = pg_backend_pid() % {VERSION_SHARDS};
+                    RETURN NULL;
+                END
+                $$ LANGUAGE plpgsql
+            """)
+            cur.execute("""
+                CREATE OR REPLACE TRIGGER drugs_version_bump
+                AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON drugs
+                FOR EACH STATEMENT EXECUTE FUNCTION bump_drugs_version()
+            """)
             conn.commit()
             cur.close()
             conn.close()
@@ -39,6 +229,195 @@ def init_db():
             print(f"Attempt {i+1}: {e}")
             time.sleep(3)
 
+EPOCH = date(1970, 1, 1)
+
+def row_to_dict(r):
+    return {"id": r[0], "name": r[1], "quantity": r[2], "price": r[3],
+            "expiry_date": r[4].isoformat() if r[4] else None, "category": r[5]}
+
+def expiry_param(value):
+    """expiry_date as stored: '' (no date) is NULL."""
+    return value or None
+
+# ─── Keyset pagination ────────────────────────────────────────────────────────
+# Same scheme as the gRPC servers: an opaque token holding the sort key of the
+# last row served, returned to the caller in the X-Next-Page-Token header.
+
+def encode_page_token(*key):
+    return base64.urlsafe_b64encode(",".join(str(k) for k in key).encode()).decode()
+
+def decode_page_token(token, size):
+    try:
+        key = [int(k) for k in base64.urlsafe_b64decode(token.encode()).decode().split(",")]
+    except (ValueError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid page_token")
+    if len(key) != size:
+        raise HTTPException(status_code=400, detail="Invalid page_token")
+    return key
+
+def page_key_date(days):
+    try:
+        return EPOCH + timedelta(days=days)
+    except OverflowError:
+        raise HTTPException(status_code=400, detail="Invalid page_token")
+
+def drug_filters(category, expiry_from, expiry_to):
+    clauses, params = [], []
+    if category:
+        clauses.append("category = %s")
+        params.append(category)
+    if expiry_from:
+        clauses.append("expiry_date >= %s")
+        params.append(expiry_from.isoformat())
+    if expiry_to:
+        clauses.append("expiry_date <= %s")
+        params.append(expiry_to.isoformat())
+    return clauses, params
+
+def page_query(clauses, params, order_by, page_size):
+    sql = f"SELECT {DRUG_COLUMNS} FROM drugs"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += f" ORDER BY {order_by}"
+    if page_size:
+        sql += " LIMIT %s"
+        params.append(page_size + 1)
+    return sql, params
+
+def page_result(rows, page_size, key):
+    """(drugs, extra response headers) for one page of rows."""
+    headers = {}
+    if page_size and len(rows) > page_size:
+        rows = rows[:page_size]
+        headers["X-Next-Page-Token"] = encode_page_token(*key(rows[-1]))
+    return [row_to_dict(r) for r in rows], headers
+
+def like_prefix(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+def search_params(q, limit):
+    query = q.strip().lower()
+    if not query:
+        raise HTTPException(status_code=400, detail="q must not be blank")
+    return (like_prefix(query), limit, query, query, limit, query, limit)
+
+def search_hit(row):
+    return {**row_to_dict(row), "prefix": row[6], "score": row[7]}
+
+def expiring_filters(within_days, include_expired, page_token, category, today):
+    clauses = ["expiry_date <= %s"]
+    params = [today + timedelta(days=within_days)]
+    if not include_expired:
+        clauses.append("expiry_date >= %s")
+        params.append(today)
+    if category:
+        clauses.append("category = %s")
+        params.append(category)
+    if page_token:
+        # Token dates are days since the epoch, as in the gRPC servers
+        last_days, last_id = decode_page_token(page_token, 2)
+        clauses.append("(expiry_date, id) > (%s, %s)")
+        params.extend([page_key_date(last_days), last_id])
+    return clauses, params
+
+def expiring_key(r):
+    return (r[4] - EPOCH).days, r[0]
+
+def list_filters(page_token, category, expiry_from, expiry_to):
+    clauses, params = drug_filters(category, expiry_from, expiry_to)
+    if page_token:
+        (last_id,) = decode_page_token(page_token, 1)
+        clauses.append("id > %s")
+        params.append(last_id)
+    return clauses, params
+
+def low_stock_filters(threshold, page_token, category, expiry_from, expiry_to):
+    clauses, params = drug_filters(category, expiry_from, expiry_to)
+    clauses.insert(0, "quantity <= %s")
+    params.insert(0, threshold)
+    if page_token:
+        last_quantity, last_id = decode_page_token(page_token, 2)
+        clauses.append("(quantity, id) > (%s, %s)")
+        params.extend([last_quantity, last_id])
+    return clauses, params
+
+# ─── Conditional GET ─────────────────────────────────────────────────────────
+# List pages carry an ETag derived from the drugs table version and the query.
+# A matching If-None-Match gets a 304 after reading only the version, and a
+# page already rendered at the current version is served from PageCache.
+
+class PageCache:
+    """LRU of request key -> (version, rendered body, headers)."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, version, body, headers):
+        entry = (version, body, headers)
+        if self.max_entries <= 0 or len(body) > PAGE_CACHE_MAX_BYTES:
+            return entry
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+page_cache = PageCache(PAGE_CACHE_SIZE)
+
+def request_key(request):
+    return request.url.path + "?" + urlencode(sorted(request.query_params.multi_items()))
+
+def page_etag(version, key):
+    return f'"{version}-{hashlib.sha1(key.encode()).hexdigest()[:16]}"'
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    # If-None-Match uses weak comparison
+    return "*" in tags or etag in (t[2:] if t.startswith("W/") else t for t in tags)
+
+def not_modified(etag):
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+def cached_response(entry, etag):
+    _, body, headers = entry
+    return Response(content=body, media_type="application/json",
+                    headers={**headers, "ETag": etag, "Cache-Control": "no-cache"})
+
+def fetch_page(request, if_none_match, clauses, params, order_by, page_size, key, scope=""):
+    """scope: anything besides the URL the page depends on (e.g. today's date)."""
+    sql, params = page_query(clauses, params, order_by, page_size)
+    cache_key = request_key(request) + scope
+    conn = get_conn()
+    try:
+        cur = conn.cursor()
+        cur.execute(SQL_SNAPSHOT)
+        cur.execute(SQL_TABLE_VERSION)
+        version = cur.fetchone()[0]
+        etag = page_etag(version, cache_key)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        entry = page_cache.get(cache_key, version)
+        if entry is None:
+            cur.execute(sql, params)
+            drugs, headers = page_result(cur.fetchall(), page_size, key)
+            entry = page_cache.put(cache_key, version, TimedJSONResponse(drugs).body, headers)
+        return cached_response(entry, etag)
+    finally:
+        conn.close()
+
 class DrugCreate(BaseModel):
     name: str
     quantity: int
@@ -49,51 +428,280 @@ class DrugCreate(BaseModel):
 class StockUpdate(BaseModel):
     quantity: int
 
+class StockAdjust(BaseModel):
+    delta: int
+
+class StockUpdateItem(BaseModel):
+    id: int
+    quantity: int
+
+def validate_new_drug(drug):
+    # Mirrors the column limits so one bad item can't abort the whole batch
+    if len(drug.name) > 255:
+        return "name is longer than 255 characters"
+    if drug.expiry_date:
+        try:
+            date.fromisoformat(drug.expiry_date)
+        except ValueError:
+            return "expiry_date must be YYYY-MM-DD"
+        # fromisoformat also takes forms like 20261231 and 2026-W52-4
+        if len(drug.expiry_date) != 10 or drug.expiry_date[4] != "-":
+            return "expiry_date must be YYYY-MM-DD"
+    if len(drug.category) > 100:
+        return "category is longer than 100 characters"
+    return None
+
+# ─── NDJSON export ───────────────────────────────────────────────────────────
+# GET /drugs/stream reads through a server-side cursor and sends one chunk per
+# FETCH, so memory is bounded by the batch size and the first rows go out
+# before the query has finished.
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+def accepts_gzip(accept_encoding):
+    for coding in (accept_encoding or "").split(","):
+        name, _, params = coding.strip().partition(";")
+        if name.strip().lower() == "gzip":
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+class StreamEncoder:
+    """Optionally gzips a stream of chunks; each chunk is flushed whole."""
+
+    def __init__(self, gzip):
+        self._zip = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+
+    def encode(self, chunk):
+        if self._zip is None:
+            return chunk
+        return self._zip.compress(chunk) + self._zip.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._zip.flush() if self._zip is not None else b""
+
+def stream_query(category, expiry_from, expiry_to):
+    clauses, params = drug_filters(category, expiry_from, expiry_to)
+    sql, params = page_query(clauses, params, "id", 0)
+    return sql, params
+
+def stream_response(chunks, gzip):
+    headers = {"Vary": "Accept-Encoding"}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(chunks, media_type=NDJSON_MEDIA_TYPE, headers=headers)
+
+def ndjson_chunk(rows):
+    return "".join(json.dumps(row_to_dict(r)) + "\n" for r in rows).encode()
+
+def check_batch_size(size):
+    if size > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch of {size} items exceeds MAX_BATCH_SIZE={MAX_BATCH_SIZE}")
+
+def purge_idempotency_keys():
+    # init_db purges at startup; this keeps a long-running app from growing the table
+    while True:
+        time.sleep(IDEMPOTENCY_PURGE_INTERVAL)
+        try:
+            conn = get_conn()
+            cur = conn.cursor()
+            cur.execute(SQL_PURGE_ADJUSTMENTS, (IDEMPOTENCY_KEY_TTL_HOURS,))
+            if cur.rowcount:
+                print(f"Purged {cur.rowcount} expired idempotency keys")
+            conn.commit()
+            cur.close(); conn.close()
+        except Exception as e:
+            print(f"Idempotency key purge failed: {e}")
+
 @app.on_event("startup")
 def startup():
     init_db()
+    if IDEMPOTENCY_PURGE_INTERVAL > 0:
+        threading.Thread(target=purge_idempotency_keys, daemon=True).start()
 
 @app.post("/drugs")
 def add_drug(drug: DrugCreate):
+    error = validate_new_drug(drug)
+    if error:
+        raise HTTPException(status_code=422, detail=error)
     conn = get_conn()
     cur = conn.cursor()
     cur.execute(
-        "INSERT INTO drugs (name, quantity, price, expiry_date, category) VALUES (%s,%s,%s,%s,%s) RETURNING id",
-        (drug.name, drug.quantity, drug.price, drug.expiry_date, drug.category)
+        SQL_ADD_DRUG,
+        (drug.name, drug.quantity, drug.price, expiry_param(drug.expiry_date), drug.category)
     )
     drug_id = cur.fetchone()[0]
     conn.commit()
     cur.close(); conn.close()
     return {"id": drug_id, **drug.dict()}
 
+@app.post("/drugs/batch")
+def add_drugs_batch(drugs: List[DrugCreate]):
+    """Insert many drugs in one transaction; result i is the outcome of item i."""
+    check_batch_size(len(drugs))
+    results = [None] * len(drugs)
+    valid = []
+    for i, drug in enumerate(drugs):
+        error = validate_new_drug(drug)
+        if error:
+            results[i] = {"success": False, "error": error}
+        else:
+            valid.append(i)
+    if valid:
+        conn = get_conn()
+        cur = conn.cursor()
+        # Reserve ids first so results map back to items regardless of RETURNING order
+        cur.execute(SQL_ALLOCATE_IDS, (len(valid),))
+        ids = [r[0] for r in cur.fetchall()]
+        rows = [(drug_id, drugs[i].name, drugs[i].quantity, drugs[i].price, expiry_param(drugs[i].expiry_date),
+                 drugs[i].category)
+                for drug_id, i in zip(ids, valid)]
+        psycopg2.extras.execute_values(cur, SQL_BATCH_INSERT, rows, page_size=len(rows))
+        conn.commit()
+        cur.close(); conn.close()
+        for drug_id, i in zip(ids, valid):
+            results[i] = {"success": True, "drug": {"id": drug_id, **drugs[i].dict()}}
+    return results
+
+@app.get("/drugs/stream")
+def stream_drugs(batch_size: int = Query(STREAM_BATCH_SIZE, ge=1, le=STREAM_MAX_BATCH_SIZE),
+                 category: Optional[str] = None,
+                 expiry_from: Optional[date] = None,
+                 expiry_to: Optional[date] = None,
+                 accept_encoding: Optional[str] = Header(None)):
+    """Every matching drug as NDJSON, gzip-encoded if the client accepts it."""
+    sql, params = stream_query(category, expiry_from, expiry_to)
+    gzip = accepts_gzip(accept_encoding)
+    encoder = StreamEncoder(gzip)
+
+    def chunks():
+        conn = get_conn()
+        try:
+            cur = conn.cursor(name="stream_drugs")
+            cur.execute(sql, params)
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield encoder.encode(ndjson_chunk(rows))
+            yield encoder.finish()
+        finally:
+            # Also reached when the client disconnects mid-stream
+            conn.close()
+    return stream_response(chunks(), gzip)
+
+@app.get("/drugs/search")
+def search_drugs(q: str = Query(..., max_length=MAX_SEARCH_QUERY_LENGTH),
+                 limit: int = Query(SEARCH_DEFAULT_LIMIT, ge=1, le=SEARCH_MAX_LIMIT)):
+    """Drugs whose name starts with q, then names close to q, best first."""
+    params = search_params(q, limit)
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(SQL_SEARCH_DRUGS, params)
+    rows = cur.fetchall()
+    cur.close(); conn.close()
+    return [search_hit(r) for r in rows]
+
+@app.get("/drugs/expiring")
+def expiring_drugs(request: Request,
+                   within_days: int = Query(30, ge=0, le=MAX_EXPIRING_DAYS),
+                   include_expired: bool = False,
+                   page_size: int = Query(0, ge=0, le=MAX_PAGE_SIZE),
+                   page_token: Optional[str] = None,
+                   category: Optional[str] = None,
+                   if_none_match: Optional[str] = Header(None)):
+    """Drugs expiring within within_days of today, soonest first."""
+    today = date.today()
+    clauses, params = expiring_filters(within_days, include_expired, page_token, category, today)
+    return fetch_page(request, if_none_match, clauses, params, "expiry_date, id", page_size, expiring_key,
+                      scope=f"#{today}")
+
+@app.put("/drugs/stock/batch")
+def update_stock_batch(updates: List[StockUpdateItem]):
+    """Set many quantities in one transaction; the last update for an id wins."""
+    check_batch_size(len(updates))
+    quantities = {u.id: u.quantity for u in updates}
+    by_id = {}
+    if quantities:
+        conn = get_conn()
+        cur = conn.cursor()
+        # Lock in id order so concurrent batches can't deadlock
+        cur.execute(SQL_LOCK_DRUGS, (list(quantities),))
+        rows = psycopg2.extras.execute_values(
+            cur, SQL_BATCH_UPDATE, list(quantities.items()),
+            template="(%s::int,%s::int)", page_size=len(quantities), fetch=True
+        )
+        conn.commit()
+        cur.close(); conn.close()
+        by_id = {r[0]: r for r in rows}
+    return [{"success": True, "drug": row_to_dict(by_id[u.id])} if u.id in by_id
+            else {"success": False, "error": "Drug not found"} for u in updates]
+
 @app.get("/drugs/{drug_id}")
 def get_drug(drug_id: int):
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute("SELECT id, name, quantity, price, expiry_date, category FROM drugs WHERE id=%s", (drug_id,))
+    cur.execute(SQL_GET_DRUG, (drug_id,))
     row = cur.fetchone()
     cur.close(); conn.close()
     if not row:
         raise HTTPException(status_code=404, detail="Drug not found")
-    return {"id": row[0], "name": row[1], "quantity": row[2], "price": row[3], "expiry_date": row[4], "category": row[5]}
+    return row_to_dict(row)
 
 @app.put("/drugs/{drug_id}/stock")
 def update_stock(drug_id: int, update: StockUpdate):
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute("UPDATE drugs SET quantity=%s WHERE id=%s RETURNING id, name, quantity, price, expiry_date, category", (update.quantity, drug_id))
+    cur.execute(SQL_UPDATE_STOCK, (update.quantity, drug_id))
     row = cur.fetchone()
     conn.commit()
     cur.close(); conn.close()
     if not row:
         raise HTTPException(status_code=404, detail="Drug not found")
-    return {"id": row[0], "name": row[1], "quantity": row[2], "price": row[3], "expiry_date": row[4], "category": row[5]}
+    return row_to_dict(row)
+
+@app.post("/drugs/{drug_id}/stock/adjust")
+def adjust_stock(drug_id: int, adjust: StockAdjust, response: Response,
+                 idempotency_key: Optional[str] = Header(None, max_length=128)):
+    """Add delta (may be negative) atomically; 409 if stock would go below zero.
+
+    Retrying with the same Idempotency-Key header returns the current row
+    without applying the delta again.
+    """
+    conn = get_conn()
+    cur = conn.cursor()
+    try:
+        if idempotency_key:
+            cur.execute(SQL_CLAIM_ADJUSTMENT, (idempotency_key, drug_id, adjust.delta))
+            if cur.fetchone() is None:
+                cur.execute(SQL_GET_ADJUSTMENT, (idempotency_key,))
+                if cur.fetchone() != (drug_id, adjust.delta):
+                    raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different adjustment")
+                cur.execute(SQL_GET_DRUG, (drug_id,))
+                row = cur.fetchone()
+                if not row:
+                    raise HTTPException(status_code=404, detail="Drug not found")
+                response.headers["Idempotent-Replayed"] = "true"
+                return row_to_dict(row)
+        cur.execute(SQL_ADJUST_STOCK, (adjust.delta, drug_id, adjust.delta))
+        row = cur.fetchone()
+        if not row:
+            conn.rollback()
+            cur.execute(SQL_DRUG_EXISTS, (drug_id,))
+            if cur.fetchone() is None:
+                raise HTTPException(status_code=404, detail="Drug not found")
+            raise HTTPException(status_code=409, detail="Insufficient stock")
+        if idempotency_key:
+            cur.execute(SQL_RECORD_ADJUSTMENT, (row[2], idempotency_key))
+        conn.commit()
+        return row_to_dict(row)
+    finally:
+        cur.close(); conn.close()
 
 @app.delete("/drugs/{drug_id}")
 def delete_drug(drug_id: int):
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute("DELETE FROM drugs WHERE id=%s RETURNING id", (drug_id,))
+    cur.execute(SQL_DELETE_DRUG, (drug_id,))
     row = cur.fetchone()
     conn.commit()
     cur.close(); conn.close()
@@ -102,19 +710,43 @@ def delete_drug(drug_id: int):
     return {"success": True, "message": f"Drug {drug_id} deleted"}
 
 @app.get("/drugs")
-def list_drugs():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT id, name, quantity, price, expiry_date, category FROM drugs ORDER BY id")
-    rows = cur.fetchall()
-    cur.close(); conn.close()
-    return [{"id": r[0], "name": r[1], "quantity": r[2], "price": r[3], "expiry_date": r[4], "category": r[5]} for r in rows]
+def list_drugs(request: Request,
+               page_size: int = Query(0, ge=0, le=MAX_PAGE_SIZE),
+               page_token: Optional[str] = None,
+               category: Optional[str] = None,
+               expiry_from: Optional[date] = None,
+               expiry_to: Optional[date] = None,
+               if_none_match: Optional[str] = Header(None)):
+    clauses, params = list_filters(page_token, category, expiry_from, expiry_to)
+    return fetch_page(request, if_none_match, clauses, params, "id", page_size, lambda r: (r[0],))
 
 @app.get("/drugs/alert/low-stock")
-def low_stock(threshold: int = 100):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT id, name, quantity, price, expiry_date, category FROM drugs WHERE quantity <= %s ORDER BY quantity", (threshold,))
-    rows = cur.fetchall()
-    cur.close(); conn.close()
-    return [{"id": r[0], "name": r[1], "quantity": r[2], "price": r[3], "expiry_date": r[4], "category": r[5]} for r in rows]
+def low_stock(request: Request,
+              threshold: int = 100,
+              page_size: int = Query(0, ge=0, le=MAX_PAGE_SIZE),
+              page_token: Optional[str] = None,
+              category: Optional[str] = None,
+              expiry_from: Optional[date] = None,
+              expiry_to: Optional[date] = None,
+              if_none_match: Optional[str] = Header(None)):
+    clauses, params = low_stock_filters(threshold, page_token, category, expiry_from, expiry_to)
+    return fetch_page(request, if_none_match, clauses, params, "quantity, id", page_size,
+                      lambda r: (r[2], r[0]))
+
+@app.post("/admin/profile", response_class=PlainTextResponse, include_in_schema=False)
+def admin_profile(seconds: float = 10, interval_ms: int = 0,
+                  x_admin_token: Optional[str] = Header(None)):
+    # Sync handler: it sleeps in a threadpool thread while sampling the others
+    if not profiler.admin_allowed(x_admin_token or ""):
+        raise HTTPException(status_code=403, detail="Profiling requires a valid X-Admin-Token")
+    try:
+        stacks, samples = profiler.profile(seconds, interval_ms)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except profiler.ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(stacks, headers={"X-Profile-Samples": str(samples)})
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
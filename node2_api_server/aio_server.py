@@ -0,0 +1,470 @@
+"""
+asyncio gRPC server (grpc.aio) backed by psycopg 3's async connection pool.
+Selected with SERVER_MODE=aio; implements the same PharmacyService contract
+as the threaded PharmacyServicer in server.py and reuses its SQL.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+import csv
+import io
+import os
+
+import grpc
+import psycopg
+from psycopg_pool import AsyncConnectionPool
+
+from server import (
+    DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASS, POOL_STATS_INTERVAL, METRICS_PORT, state_metrics,
+    PREPARED_STATEMENTS,
+    DB_REPLICA_HOST, DB_REPLICA_PORT, REPLICA_MAX_LAG_MS, REPLICA_CHECK_INTERVAL,
+    LSN_METADATA_KEY, SQL_CURRENT_LSN, SQL_REPLAYED_LSN, SQL_REPLICA_STATUS, ReplicaState,
+    request_min_lsn, format_lsn,
+    DRUG_CACHE_SIZE, DRUG_CACHE_TTL, DRUG_INVALIDATION_CHANNEL, SQL_NOTIFY_INVALIDATION,
+    DrugCache, cache_quarantine, invalidation_payloads, parse_invalidation,
+    SQL_ADD_DRUG, SQL_GET_DRUG, SQL_UPDATE_STOCK, SQL_DELETE_DRUG,
+    build_list_drugs_query, build_low_stock_query, build_expiring_query, page_response,
+    CategoryIds, request_projection, stream_drugs_sql, SQL_SEARCH_DRUGS, search_params, search_response,
+    SQL_ALLOCATE_IDS, SQL_LOCK_DRUGS, build_batch_insert, build_batch_update, check_batch_size,
+    prepare_batch_add, finish_batch_add, batch_update_quantities, finish_batch_update,
+    SQL_COPY_DRUGS, ImportTally,
+    SQL_ADJUST_STOCK, SQL_ADJUST_STOCK_RECORDED, SQL_CLAIM_ADJUSTMENT, SQL_GET_ADJUSTMENT,
+    SQL_DRUG_EXISTS, SQL_PURGE_ADJUSTMENTS, IDEMPOTENCY_KEY_TTL_HOURS, IDEMPOTENCY_PURGE_INTERVAL,
+    adjust_stock_params, replayed_adjustment, rejected_adjustment, profile_error, run_profile,
+    init_db, new_drug, row_to_drug, validate_new_drug, expiry_param, stream_batch_size, pharmacy_pb2, pharmacy_pb2_grpc,
+)
+# server puts common/ on sys.path
+import metrics
+import profiler
+from interceptors import AsyncMetricsInterceptor
+
+AIO_POOL_MIN = int(os.environ.get("AIO_POOL_MIN", "5"))
+AIO_POOL_MAX = int(os.environ.get("AIO_POOL_MAX", "50"))
+AIO_POOL_TIMEOUT = float(os.environ.get("AIO_POOL_TIMEOUT", "5"))
+AIO_MAX_CONCURRENT_RPCS = int(os.environ.get("AIO_MAX_CONCURRENT_RPCS", "0")) or None
+
+def make_conninfo(host=DB_HOST, port=DB_PORT):
+    return f"host={host} port={port} dbname={DB_NAME} user={DB_USER} password={DB_PASS}"
+
+async def configure_connection(conn):
+    conn.server_cursor_factory = metrics.AsyncTimedServerCursor
+    # psycopg 3 keeps its own per-connection cache of prepared statements; the
+    # hot ones ask for prepare=PREPARED_STATEMENTS, and with it off nothing is
+    # prepared automatically either.
+    if not PREPARED_STATEMENTS:
+        conn.prepare_threshold = None
+
+def make_pool(host=DB_HOST, port=DB_PORT, min_size=AIO_POOL_MIN, name="primary"):
+    return metrics.TimedConnectionPool(
+        make_conninfo(host, port), min_size=min_size, max_size=AIO_POOL_MAX,
+        timeout=AIO_POOL_TIMEOUT, check=AsyncConnectionPool.check_connection,
+        kwargs={"cursor_factory": metrics.AsyncTimedCursor}, configure=configure_connection,
+        name=name, open=False,
+    )
+
+class AsyncPharmacyServicer(pharmacy_pb2_grpc.PharmacyServiceServicer):
+
+    def __init__(self, pool, replica_pool=None, replica_state=None, cache=None):
+        self.pool = pool
+        self.replica_pool = replica_pool
+        self.replica_state = replica_state
+        self.cache = cache
+
+    async def _invalidate(self, conn, drug_ids):
+        # Publishes inside the caller's transaction; local drop happens after commit
+        for payload in invalidation_payloads(drug_ids):
+            await conn.execute(SQL_NOTIFY_INVALIDATION, (payload,))
+
+    @asynccontextmanager
+    async def _read_connection(self, context):
+        state = self.replica_state
+        conn = None
+        if state is not None and state.routable():
+            min_lsn = request_min_lsn(context)
+            try:
+                conn = await self.replica_pool.getconn()
+                if not state.caught_up(min_lsn):
+                    # The monitor's view may be up to a second old; ask directly.
+                    cur = await conn.execute(SQL_REPLAYED_LSN, (format_lsn(min_lsn),))
+                    replayed = (await cur.fetchone())[0]
+                    await conn.rollback()
+                    if not replayed:
+                        await self.replica_pool.putconn(conn)
+                        conn = None
+            except psycopg.Error as e:
+                # psycopg_pool reconnects in the background, so a dead replica
+                # shows up here as a PoolTimeout rather than a connect error.
+                # Either way, read from the primary until the monitor sees
+                # the replica healthy again.
+                print(f"Replica checkout failed, routing reads to primary: {e}")
+                if conn is not None:
+                    await self.replica_pool.putconn(conn)
+                    conn = None
+                state.mark_down()
+        if state is not None:
+            state.record("replica" if conn is not None else "primary")
+        if conn is None:
+            async with self.pool.connection() as conn:
+                yield conn
+            return
+        # Same transaction handling as pool.connection(): commit, or roll back on error
+        try:
+            async with conn:
+                yield conn
+        finally:
+            await self.replica_pool.putconn(conn)
+
+    async def _send_lsn_token(self, context, conn):
+        if self.replica_state is None:
+            return
+        try:
+            cur = await conn.execute(SQL_CURRENT_LSN)
+            context.set_trailing_metadata(((LSN_METADATA_KEY, (await cur.fetchone())[0]),))
+        except Exception as e:
+            print(f"Could not read commit LSN: {e}")
+
+    async def AddDrug(self, request, context):
+        error = validate_new_drug(request)
+        if error:
+            return pharmacy_pb2.DrugResponse(success=False, message=error)
+        try:
+            async with self.pool.connection() as conn:
+                cur = await conn.execute(
+                    SQL_ADD_DRUG,
+                    (request.name, request.quantity, request.price, expiry_param(request.expiry_date), request.category),
+                    prepare=PREPARED_STATEMENTS,
+                )
+                drug_id = (await cur.fetchone())[0]
+                await conn.commit()
+                await self._send_lsn_token(context, conn)
+            return pharmacy_pb2.DrugResponse(success=True, message="Drug added", drug=new_drug(drug_id, request))
+        except Exception as e:
+            return pharmacy_pb2.DrugResponse(success=False, message=str(e))
+
+    async def GetDrug(self, request, context):
+        try:
+            token = None
+            if self.cache is not None:
+                drug = self.cache.get(request.id) if not request_min_lsn(context) else None
+                if drug is not None:
+                    return pharmacy_pb2.DrugResponse(success=True, message="Found", drug=drug)
+                token = self.cache.begin()
+            async with self._read_connection(context) as conn:
+                cur = await conn.execute(SQL_GET_DRUG, (request.id,), prepare=PREPARED_STATEMENTS)
+                row = await cur.fetchone()
+            if not row:
+                return pharmacy_pb2.DrugResponse(success=False, message="Drug not found")
+            drug = row_to_drug(row)
+            if self.cache is not None:
+                self.cache.put(request.id, drug, token)
+            return pharmacy_pb2.DrugResponse(success=True, message="Found", drug=drug)
+        except Exception as e:
+            return pharmacy_pb2.DrugResponse(success=False, message=str(e))
+
+    async def UpdateStock(self, request, context):
+        try:
+            async with self.pool.connection() as conn:
+                cur = await conn.execute(SQL_UPDATE_STOCK, (request.quantity, request.id), prepare=PREPARED_STATEMENTS)
+                row = await cur.fetchone()
+                if row:
+                    await self._invalidate(conn, [request.id])
+                await conn.commit()
+                if self.cache is not None:
+                    self.cache.invalidate([request.id])
+                await self._send_lsn_token(context, conn)
+            if not row:
+                return pharmacy_pb2.DrugResponse(success=False, message="Drug not found")
+            return pharmacy_pb2.DrugResponse(success=True, message="Stock updated", drug=row_to_drug(row))
+        except Exception as e:
+            return pharmacy_pb2.DrugResponse(success=False, message=str(e))
+
+    async def AdjustStock(self, request, context):
+        try:
+            params = adjust_stock_params(request)
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        try:
+            async with self.pool.connection() as conn:
+                if request.idempotency_key:
+                    cur = await conn.execute(SQL_CLAIM_ADJUSTMENT, (request.idempotency_key, request.id, request.delta))
+                    if await cur.fetchone() is None:
+                        cur = await conn.execute(SQL_GET_ADJUSTMENT, (request.idempotency_key,))
+                        adjustment = await cur.fetchone()
+                        cur = await conn.execute(SQL_GET_DRUG, (request.id,), prepare=PREPARED_STATEMENTS)
+                        row = await cur.fetchone()
+                        await conn.rollback()
+                        return replayed_adjustment(request, adjustment, row)
+                    cur = await conn.execute(SQL_ADJUST_STOCK_RECORDED, params)
+                else:
+                    cur = await conn.execute(SQL_ADJUST_STOCK, params, prepare=PREPARED_STATEMENTS)
+                row = await cur.fetchone()
+                if not row:
+                    await conn.rollback()
+                    cur = await conn.execute(SQL_DRUG_EXISTS, (request.id,), prepare=PREPARED_STATEMENTS)
+                    exists = await cur.fetchone() is not None
+                    await conn.rollback()
+                    return rejected_adjustment(exists)
+                await self._invalidate(conn, [request.id])
+                await conn.commit()
+                if self.cache is not None:
+                    self.cache.invalidate([request.id])
+                await self._send_lsn_token(context, conn)
+            return pharmacy_pb2.DrugResponse(success=True, message="Stock adjusted", drug=row_to_drug(row))
+        except Exception as e:
+            return pharmacy_pb2.DrugResponse(success=False, message=str(e))
+
+    async def DeleteDrug(self, request, context):
+        try:
+            async with self.pool.connection() as conn:
+                cur = await conn.execute(SQL_DELETE_DRUG, (request.id,), prepare=PREPARED_STATEMENTS)
+                row = await cur.fetchone()
+                if row:
+                    await self._invalidate(conn, [request.id])
+                await conn.commit()
+                if self.cache is not None:
+                    self.cache.invalidate([request.id])
+                await self._send_lsn_token(context, conn)
+            if not row:
+                return pharmacy_pb2.DeleteResponse(success=False, message="Drug not found")
+            return pharmacy_pb2.DeleteResponse(success=True, message=f"Drug {request.id} deleted")
+        except Exception as e:
+            return pharmacy_pb2.DeleteResponse(success=False, message=str(e))
+
+    async def BatchAddDrugs(self, request, context):
+        try:
+            check_batch_size(len(request.drugs))
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        results, valid = prepare_batch_add(request)
+        if not valid:
+            return finish_batch_add(request, results, valid)
+        try:
+            async with self.pool.connection() as conn:
+                cur = await conn.execute(SQL_ALLOCATE_IDS, (len(valid),))
+                ids = [r[0] for r in await cur.fetchall()]
+                sql, params = build_batch_insert(ids, [request.drugs[i] for i in valid])
+                await conn.execute(sql, params)
+                await conn.commit()
+                await self._send_lsn_token(context, conn)
+            return finish_batch_add(request, results, valid, ids=ids)
+        except Exception as e:
+            return finish_batch_add(request, results, valid, error=str(e))
+
+    async def BatchUpdateStock(self, request, context):
+        try:
+            check_batch_size(len(request.updates))
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        quantities = batch_update_quantities(request)
+        if not quantities:
+            return finish_batch_update(request)
+        try:
+            async with self.pool.connection() as conn:
+                await conn.execute(SQL_LOCK_DRUGS, (list(quantities),))
+                sql, params = build_batch_update(quantities)
+                cur = await conn.execute(sql, params)
+                rows = await cur.fetchall()
+                updated = [r[0] for r in rows]
+                await self._invalidate(conn, updated)
+                await conn.commit()
+                if self.cache is not None:
+                    self.cache.invalidate(updated)
+                await self._send_lsn_token(context, conn)
+            return finish_batch_update(request, rows=rows)
+        except Exception as e:
+            return finish_batch_update(request, error=str(e))
+
+    async def _copy_chunk(self, conn, rows):
+        cur = conn.cursor()
+        async with cur.copy(SQL_COPY_DRUGS) as copy:
+            buf = io.StringIO()
+            csv.writer(buf, lineterminator="\n").writerows(rows)
+            await copy.write(buf.getvalue())
+
+    async def ImportDrugs(self, request_iterator, context):
+        tally = ImportTally()
+        try:
+            async with self.pool.connection() as conn:
+                async for chunk in request_iterator:
+                    for item in chunk.drugs:
+                        if tally.add(item):
+                            rows = tally.take()
+                            await self._copy_chunk(conn, rows)
+                            tally.imported += len(rows)
+                            print(f"ImportDrugs: {tally.imported} rows copied, {tally.rejected} rejected")
+                rows = tally.take()
+                if rows:
+                    await self._copy_chunk(conn, rows)
+                    tally.imported += len(rows)
+                await conn.commit()
+                await self._send_lsn_token(context, conn)
+            print(f"ImportDrugs: committed {tally.imported} rows")
+            return tally.response()
+        except Exception as e:
+            return tally.response(error=str(e))
+
+    async def _page(self, query, context):
+        try:
+            async with self._read_connection(context) as conn:
+                cur = await conn.execute(query.sql, query.params)
+                rows = await cur.fetchall()
+            return page_response(rows, query)
+        except Exception as e:
+            return pharmacy_pb2.ListDrugsResponse(drugs=[])
+
+    async def ListDrugs(self, request, context):
+        try:
+            query = build_list_drugs_query(request)
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        return await self._page(query, context)
+
+    async def StreamDrugs(self, request, context):
+        batch_size = stream_batch_size(request.batch_size)
+        try:
+            projection = request_projection(request)
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        categories = CategoryIds()
+        try:
+            async with self._read_connection(context) as conn:
+                async with conn.cursor(name="stream_drugs") as cur:
+                    await cur.execute(stream_drugs_sql(projection))
+                    while True:
+                        rows = await cur.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        yield projection.response(rows, categories)
+        except Exception as e:
+            await context.abort(grpc.StatusCode.INTERNAL, str(e))
+
+    async def GetLowStock(self, request, context):
+        try:
+            query = build_low_stock_query(request)
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        return await self._page(query, context)
+
+    async def GetExpiringDrugs(self, request, context):
+        try:
+            query = build_expiring_query(request)
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        return await self._page(query, context)
+
+    async def SearchDrugs(self, request, context):
+        try:
+            params = search_params(request.query, request.limit)
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        try:
+            async with self._read_connection(context) as conn:
+                cur = await conn.execute(SQL_SEARCH_DRUGS, params)
+                rows = await cur.fetchall()
+            return search_response(rows)
+        except Exception as e:
+            await context.abort(grpc.StatusCode.INTERNAL, str(e))
+
+    async def Profile(self, request, context):
+        error = profile_error(request, context)
+        if error:
+            await context.abort(*error)
+        try:
+            # Sampling from a worker thread sees the event loop's stacks too
+            return await asyncio.to_thread(run_profile, request)
+        except profiler.ProfilerBusy as e:
+            await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, str(e))
+
+async def report_pool_stats(pool, replica_pool, replica_state, cache):
+    while True:
+        await asyncio.sleep(POOL_STATS_INTERVAL)
+        print(f"Async DB pool stats: {pool.get_stats()}")
+        if replica_state is not None:
+            print(f"Async replica pool stats: {replica_pool.get_stats()} routing: {replica_state.stats()}")
+        if cache is not None:
+            print(f"GetDrug cache stats: {cache.stats()}")
+
+async def purge_idempotency_keys(pool):
+    while True:
+        await asyncio.sleep(IDEMPOTENCY_PURGE_INTERVAL)
+        try:
+            async with pool.connection() as conn:
+                cur = await conn.execute(SQL_PURGE_ADJUSTMENTS, (IDEMPOTENCY_KEY_TTL_HOURS,))
+                if cur.rowcount:
+                    print(f"Purged {cur.rowcount} expired idempotency keys")
+        except Exception as e:
+            print(f"Idempotency key purge failed: {e}")
+
+async def monitor_replica(replica_pool, replica_state):
+    while True:
+        try:
+            async with replica_pool.connection() as conn:
+                cur = await conn.execute(SQL_REPLICA_STATUS)
+                replica_state.update(await cur.fetchone())
+        except Exception as e:
+            if replica_state.healthy:
+                print(f"Replica unavailable, routing reads to primary: {e}")
+            replica_state.mark_down()
+        await asyncio.sleep(REPLICA_CHECK_INTERVAL)
+
+async def listen_for_invalidations(cache):
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(make_conninfo(), autocommit=True) as conn:
+                await conn.execute(f"LISTEN {DRUG_INVALIDATION_CHANNEL}")
+                cache.clear()
+                print(f"Listening for cache invalidations on '{DRUG_INVALIDATION_CHANNEL}'")
+                async for notify in conn.notifies():
+                    cache.invalidate(parse_invalidation(notify.payload))
+        except Exception as e:
+            print(f"Invalidation listener error, clearing cache: {e}")
+            cache.clear()
+            await asyncio.sleep(1)
+
+async def serve():
+    pool = make_pool()
+    await pool.open(wait=True)
+    print(f"Async DB pool ready (min={AIO_POOL_MIN}, max={AIO_POOL_MAX}, timeout={AIO_POOL_TIMEOUT}s)")
+    replica_pool = replica_state = None
+    background = []
+    if DB_REPLICA_HOST:
+        replica_pool = make_pool(DB_REPLICA_HOST, DB_REPLICA_PORT, min_size=0, name="replica")
+        await replica_pool.open()
+        replica_state = ReplicaState(REPLICA_MAX_LAG_MS)
+        background.append(asyncio.create_task(monitor_replica(replica_pool, replica_state)))
+        print(f"Async read replica pool ready ({DB_REPLICA_HOST}, max lag {REPLICA_MAX_LAG_MS}ms)")
+    cache = None
+    if DRUG_CACHE_SIZE > 0:
+        cache = DrugCache(DRUG_CACHE_SIZE, DRUG_CACHE_TTL, cache_quarantine())
+        background.append(asyncio.create_task(listen_for_invalidations(cache)))
+        print(f"GetDrug cache enabled (max={DRUG_CACHE_SIZE}, ttl={DRUG_CACHE_TTL}s)")
+    if IDEMPOTENCY_PURGE_INTERVAL > 0:
+        background.append(asyncio.create_task(purge_idempotency_keys(pool)))
+    if POOL_STATS_INTERVAL > 0:
+        background.append(asyncio.create_task(report_pool_stats(pool, replica_pool, replica_state, cache)))
+    if METRICS_PORT:
+        pools = [p for p in (pool, replica_pool) if p is not None]
+        metrics.REGISTRY.register_collector(
+            lambda: state_metrics({p.name: p.get_stats() for p in pools}, replica_state, cache))
+        metrics.start_http_server(METRICS_PORT)
+    server = grpc.aio.server(interceptors=[AsyncMetricsInterceptor()],
+                             maximum_concurrent_rpcs=AIO_MAX_CONCURRENT_RPCS)
+    pharmacy_pb2_grpc.add_PharmacyServiceServicer_to_server(
+        AsyncPharmacyServicer(pool, replica_pool, replica_state, cache), server)
+    server.add_insecure_port('[::]:50051')
+    await server.start()
+    print("gRPC (asyncio) server started on port 50051")
+    try:
+        await server.wait_for_termination()
+    finally:
+        for task in background:
+            task.cancel()
+        await pool.close()
+        if replica_pool is not None:
+            await replica_pool.close()
+
+def main():
+    init_db()
+    asyncio.run(serve())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+gRPC server interceptors feeding the shared metrics registry: per-method
+latency, in-flight count, status codes, errors (including handlers that
+return success=false instead of failing) and message (de)serialization time.
+MetricsInterceptor is for grpc.server, AsyncMetricsInterceptor for grpc.aio.
+"""
+import time
+
+import grpc
+
+import metrics
+
+def endpoint_name(handler_call_details):
+    return handler_call_details.method.rsplit("/", 1)[-1]
+
+def timed_serializer(fn, endpoint, direction):
+    if fn is None:
+        return None
+    def wrapper(data):
+        start = time.perf_counter()
+        try:
+            return fn(data)
+        finally:
+            metrics.record_serialization(endpoint, direction, time.perf_counter() - start)
+    return wrapper
+
+def status_name(context, failed):
+    code = context.code()
+    if code is None:
+        return "UNKNOWN" if failed else "OK"
+    return code.name if isinstance(code, grpc.StatusCode) else str(code)
+
+def app_failed(response):
+    # The servicers report most failures as success=False with status OK
+    return getattr(response, "success", True) is False
+
+def finish(stats, context, failed, response=None):
+    code = status_name(context, failed)
+    if failed:
+        error = "status" if code not in ("OK", "UNKNOWN") else "exception"
+    elif code != "OK":
+        error = "status"
+    elif app_failed(response):
+        error = "app"
+    else:
+        error = None
+    metrics.finish_request(stats, code, error)
+
+def with_serializers(handler, endpoint):
+    return handler._replace(
+        request_deserializer=timed_serializer(handler.request_deserializer, endpoint, "deserialize"),
+        response_serializer=timed_serializer(handler.response_serializer, endpoint, "serialize"),
+    )
+
+class MetricsInterceptor(grpc.ServerInterceptor):
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None:
+            return None
+        endpoint = endpoint_name(handler_call_details)
+        handler = with_serializers(handler, endpoint)
+        if handler.unary_unary:
+            return handler._replace(unary_unary=self._unary(handler.unary_unary, endpoint))
+        if handler.stream_unary:
+            return handler._replace(stream_unary=self._unary(handler.stream_unary, endpoint))
+        if handler.unary_stream:
+            return handler._replace(unary_stream=self._stream(handler.unary_stream, endpoint))
+        return handler._replace(stream_stream=self._stream(handler.stream_stream, endpoint))
+
+    @staticmethod
+    def _unary(behavior, endpoint):
+        def wrapper(request, context):
+            stats = metrics.begin_request(endpoint)
+            try:
+                response = behavior(request, context)
+            except BaseException:
+                finish(stats, context, True)
+                raise
+            finish(stats, context, False, response)
+            return response
+        return wrapper
+
+    @staticmethod
+    def _stream(behavior, endpoint):
+        def wrapper(request, context):
+            stats = metrics.begin_request(endpoint)
+            failed = True
+            try:
+                yield from behavior(request, context)
+                failed = False
+            finally:
+                # Also reached via GeneratorExit when the client cancels
+                finish(stats, context, failed)
+        return wrapper
+
+class AsyncMetricsInterceptor(grpc.aio.ServerInterceptor):
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if handler is None:
+            return None
+        endpoint = endpoint_name(handler_call_details)
+        handler = with_serializers(handler, endpoint)
+        if handler.unary_unary:
+            return handler._replace(unary_unary=self._unary(handler.unary_unary, endpoint))
+        if handler.stream_unary:
+            return handler._replace(stream_unary=self._unary(handler.stream_unary, endpoint))
+        if handler.unary_stream:
+            return handler._replace(unary_stream=self._stream(handler.unary_stream, endpoint))
+        return handler._replace(stream_stream=self._stream(handler.stream_stream, endpoint))
+
+    @staticmethod
+    def _unary(behavior, endpoint):
+        async def wrapper(request, context):
+            stats = metrics.begin_request(endpoint)
+            try:
+                response = await behavior(request, context)
+            except BaseException:
+                finish(stats, context, True)
+                raise
+            finish(stats, context, False, response)
+            return response
+        return wrapper
+
+    @staticmethod
+    def _stream(behavior, endpoint):
+        async def wrapper(request, context):
+            stats = metrics.begin_request(endpoint)
+            failed = True
+            try:
+                async for response in behavior(request, context):
+                    yield response
+                failed = False
+            finally:
+                finish(stats, context, failed)
+        return wrapper
@@ -1,14 +1,32 @@
 import grpc
+from collections import OrderedDict, namedtuple
 from concurrent import futures
+from contextlib import contextmanager
+from datetime import date, timedelta
+import base64
+import binascii
+import csv
+import io
+import multiprocessing
+import queue
+import re
+import threading
 import time
 import os
 import psycopg2
-import psycopg2.pool
+import psycopg2.errors
+import psycopg2.extensions
+import select
+import signal
 import sys
 
 sys.path.insert(0, '/app/proto')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../common'))
 import pharmacy_pb2
 import pharmacy_pb2_grpc
+import metrics
+import profiler
+from interceptors import MetricsInterceptor
 
 DB_HOST = os.environ.get("DB_HOST", "db-primary")
 DB_PORT = os.environ.get("DB_PORT", "5432")
@@ -16,27 +34,1167 @@ DB_NAME = os.environ.get("DB_NAME", "pharmacy")
 DB_USER = os.environ.get("DB_USER", "postgres")
 DB_PASS = os.environ.get("DB_PASS", "postgres")
 
+# The pool is sized against the gRPC executor so every worker thread can hold
+# a connection at once; extra callers wait up to DB_POOL_TIMEOUT seconds.
+MAX_WORKERS = int(os.environ.get("MAX_WORKERS", "50"))
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", "5"))
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", str(MAX_WORKERS)))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "5"))
+DB_POOL_CHECK_IDLE = float(os.environ.get("DB_POOL_CHECK_IDLE", "30"))
+POOL_STATS_INTERVAL = float(os.environ.get("POOL_STATS_INTERVAL", "60"))
+# PREPARE the hot statements once per pooled connection ("0" sends plain SQL)
+PREPARED_STATEMENTS = os.environ.get("PREPARED_STATEMENTS", "1") != "0"
+# Prometheus /metrics side port (0 disables it)
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9100"))
+# Pre-fork: run SERVER_WORKERS gRPC processes sharing port 50051 (0 = one per
+# CPU, 1 = a single process). MAX_WORKERS and DB_POOL_* are node-wide totals.
+SERVER_WORKERS = int(os.environ.get("SERVER_WORKERS", "1"))
+# Seconds in-flight calls get to finish after SIGTERM/SIGINT
+SHUTDOWN_GRACE = float(os.environ.get("SHUTDOWN_GRACE", "5"))
+
+# Read/write splitting: reads go to DB_REPLICA_HOST (if set) while the
+# replica is streaming and within REPLICA_MAX_LAG_MS of the primary.
+DB_REPLICA_HOST = os.environ.get("DB_REPLICA_HOST", "")
+DB_REPLICA_PORT = os.environ.get("DB_REPLICA_PORT", DB_PORT)
+REPLICA_MAX_LAG_MS = float(os.environ.get("REPLICA_MAX_LAG_MS", "500"))
+REPLICA_CHECK_INTERVAL = float(os.environ.get("REPLICA_CHECK_INTERVAL", "1"))
+# Writes return the commit LSN in trailing metadata; a client that sends it
+# back as x-min-lsn is only served by a replica that has replayed it.
+LSN_METADATA_KEY = "x-lsn"
+MIN_LSN_METADATA_KEY = "x-min-lsn"
+# Admin RPCs (Profile) must carry ADMIN_TOKEN in this metadata key
+ADMIN_TOKEN_METADATA_KEY = "x-admin-token"
+
+# In-process GetDrug cache (DRUG_CACHE_SIZE=0 disables it). Writers publish
+# invalidations on DRUG_INVALIDATION_CHANNEL so every API server drops them.
+DRUG_CACHE_SIZE = int(os.environ.get("DRUG_CACHE_SIZE", "10000"))
+DRUG_CACHE_TTL = float(os.environ.get("DRUG_CACHE_TTL", "30"))
+DRUG_INVALIDATION_CHANNEL = "drug_invalidate"
+SERVER_MODE = os.environ.get("SERVER_MODE", "threaded")
+STREAM_BATCH_SIZE = int(os.environ.get("STREAM_BATCH_SIZE", "500"))
+STREAM_MAX_BATCH_SIZE = int(os.environ.get("STREAM_MAX_BATCH_SIZE", "5000"))
+MAX_PAGE_SIZE = int(os.environ.get("MAX_PAGE_SIZE", "1000"))
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "1000"))
+IMPORT_COPY_ROWS = int(os.environ.get("IMPORT_COPY_ROWS", "5000"))
+IMPORT_MAX_ERRORS = int(os.environ.get("IMPORT_MAX_ERRORS", "100"))
+# Group commit: AddDrug/UpdateStock calls arriving within GROUP_COMMIT_WINDOW_MS
+# of each other share one statement and one COMMIT (0 disables it)
+GROUP_COMMIT_WINDOW_MS = float(os.environ.get("GROUP_COMMIT_WINDOW_MS", "0"))
+GROUP_COMMIT_MAX_BATCH = int(os.environ.get("GROUP_COMMIT_MAX_BATCH", "64"))
+# AdjustStock remembers idempotency keys this long so retries are no-ops
+IDEMPOTENCY_KEY_TTL_HOURS = float(os.environ.get("IDEMPOTENCY_KEY_TTL_HOURS", "24"))
+IDEMPOTENCY_PURGE_INTERVAL = float(os.environ.get("IDEMPOTENCY_PURGE_INTERVAL", "3600"))
+MAX_IDEMPOTENCY_KEY_LENGTH = 128
+SEARCH_DEFAULT_LIMIT = int(os.environ.get("SEARCH_DEFAULT_LIMIT", "20"))
+SEARCH_MAX_LIMIT = int(os.environ.get("SEARCH_MAX_LIMIT", "100"))
+MAX_SEARCH_QUERY_LENGTH = 100
+# GetExpiringDrugs looks at most this far ahead (keeps the cutoff a valid date)
+MAX_EXPIRING_DAYS = 36500
+
+# SQL shared by the threaded servicer and the asyncio one in aio_server.py.
+DRUG_COLUMNS = "id, name, quantity, price, expiry_date, category"
+SQL_ADD_DRUG = "INSERT INTO drugs (name, quantity, price, expiry_date, category) VALUES (%s,%s,%s,%s,%s) RETURNING id"
+SQL_GET_DRUG = f"SELECT {DRUG_COLUMNS} FROM drugs WHERE id=%s"
+SQL_UPDATE_STOCK = f"UPDATE drugs SET quantity=%s WHERE id=%s RETURNING {DRUG_COLUMNS}"
+SQL_DELETE_DRUG = "DELETE FROM drugs WHERE id=%s RETURNING id"
+SQL_DRUG_EXISTS = "SELECT 1 FROM drugs WHERE id=%s"
+# Prefix hits are read from the (lower(name) COLLATE "C") btree in name order,
+# typo-tolerant hits from the trigram GiST index nearest first. Both stop at
+# the limit, so the cost doesn't grow with the catalog. Prefix hits rank first.
+SQL_SEARCH_DRUGS = f"""
+    WITH prefix AS (
+        SELECT {DRUG_COLUMNS}, true AS is_prefix FROM drugs
+        WHERE lower(name) COLLATE "C" LIKE %s
+        ORDER BY lower(name) COLLATE "C", id
+        LIMIT %s
+    ), fuzzy AS (
+        SELECT {DRUG_COLUMNS}, false AS is_prefix FROM drugs
+        WHERE lower(name) %% %s
+        ORDER BY lower(name) <-> %s
+        LIMIT %s
+    ), hits AS (
+        SELECT * FROM prefix
+        UNION ALL
+        SELECT * FROM fuzzy WHERE id NOT IN (SELECT id FROM prefix)
+    )
+    SELECT {DRUG_COLUMNS}, is_prefix, similarity(lower(name), %s) AS score FROM hits
+    ORDER BY is_prefix DESC, score DESC, name, id
+    LIMIT %s
+"""
+# The guard in the WHERE clause makes check-and-decrement a single atomic step
+SQL_ADJUST_STOCK = f"UPDATE drugs SET quantity = quantity + %s WHERE id=%s AND quantity + %s >= 0 RETURNING {DRUG_COLUMNS}"
+# Claiming the key first serialises retries: a concurrent duplicate blocks on
+# the primary key until this transaction commits or rolls back.
+SQL_CLAIM_ADJUSTMENT = ("INSERT INTO stock_adjustments (idempotency_key, drug_id, delta) VALUES (%s,%s,%s) "
+                        "ON CONFLICT DO NOTHING RETURNING idempotency_key")
+SQL_GET_ADJUSTMENT = "SELECT drug_id, delta, quantity FROM stock_adjustments WHERE idempotency_key=%s"
+SQL_ADJUST_STOCK_RECORDED = f"""
+    WITH adjusted AS ({SQL_ADJUST_STOCK}),
+         recorded AS (UPDATE stock_adjustments AS a SET quantity = adjusted.quantity
+                      FROM adjusted WHERE a.idempotency_key = %s)
+    SELECT {DRUG_COLUMNS} FROM adjusted
+"""
+SQL_PURGE_ADJUSTMENTS = "DELETE FROM stock_adjustments WHERE created_at < now() - %s * interval '1 hour'"
+SQL_CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS drugs (
+        id SERIAL PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        quantity INTEGER NOT NULL DEFAULT 0,
+        price FLOAT NOT NULL DEFAULT 0.0,
+        expiry_date DATE,
+        category VARCHAR(100)
+    );
+    CREATE TABLE IF NOT EXISTS stock_adjustments (
+        idempotency_key VARCHAR(128) PRIMARY KEY,
+        drug_id INTEGER NOT NULL,
+        delta INTEGER NOT NULL,
+        quantity INTEGER,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+# Batch inserts reserve their ids up front so results map back to items
+# without relying on the order of INSERT ... RETURNING.
+SQL_ALLOCATE_IDS = "SELECT nextval(pg_get_serial_sequence('drugs', 'id')) FROM generate_series(1, %s)"
+# Locking in id order keeps concurrent batch updates from deadlocking
+SQL_LOCK_DRUGS = "SELECT id FROM drugs WHERE id = ANY(%s) ORDER BY id FOR UPDATE"
+# FORCE_NOT_NULL keeps empty strings as '' (like AddDrug) instead of NULL;
+# an empty expiry_date is NULL, as everywhere else
+SQL_COPY_DRUGS = ("COPY drugs (name, quantity, price, expiry_date, category) FROM STDIN "
+                  "WITH (FORMAT csv, FORCE_NOT_NULL (name, category))")
+SQL_NOTIFY_INVALIDATION = f"SELECT pg_notify('{DRUG_INVALIDATION_CHANNEL}', %s)"
+SQL_CURRENT_LSN = "SELECT pg_current_wal_lsn()::text"
+SQL_REPLAYED_LSN = "SELECT pg_last_wal_replay_lsn() >= %s::pg_lsn"
+# Lag is 0 when everything received has been replayed, otherwise the age of
+# the last replayed transaction (NULL if nothing has been replayed yet).
+SQL_REPLICA_STATUS = """
+    SELECT pg_is_in_recovery(),
+           EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming'),
+           pg_last_wal_replay_lsn()::text,
+           CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) * 1000
+           END
+"""
+# expiry_date used to be VARCHAR(50). Convert it in place on older databases;
+# anything that isn't a valid date becomes NULL.
+SQL_MIGRATE_EXPIRY_DATE = """
+    DO $$
+    BEGIN
+        IF (SELECT data_type FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = 'drugs'
+              AND column_name = 'expiry_date') <> 'date' THEN
+            CREATE OR REPLACE FUNCTION pg_temp.to_expiry_date(value text) RETURNS date AS $f$
+            BEGIN
+                RETURN NULLIF(trim(value), '')::date;
+            EXCEPTION WHEN others THEN
+                RETURN NULL;
+            END
+            $f$ LANGUAGE plpgsql;
+            ALTER TABLE drugs ALTER COLUMN expiry_date TYPE DATE USING pg_temp.to_expiry_date(expiry_date);
+        END IF;
+    END
+    $$
+"""
+# Keyset pagination walks these in index order (see build_*_query below);
+# SearchDrugs uses the two name indexes. (expiry_date, id) replaces the old
+# expiry_date-only index.
+SQL_CREATE_INDEXES = """
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    CREATE INDEX IF NOT EXISTS idx_drugs_quantity_id ON drugs (quantity, id);
+    CREATE INDEX IF NOT EXISTS idx_drugs_category_id ON drugs (category, id);
+    CREATE INDEX IF NOT EXISTS idx_drugs_expiry_date_id ON drugs (expiry_date, id);
+    DROP INDEX IF EXISTS idx_drugs_expiry_date;
+    CREATE INDEX IF NOT EXISTS idx_drugs_name_prefix ON drugs ((lower(name) COLLATE "C"), id);
+    CREATE INDEX IF NOT EXISTS idx_drugs_name_trgm ON drugs USING gist (lower(name) gist_trgm_ops);
+    CREATE INDEX IF NOT EXISTS idx_stock_adjustments_created_at ON stock_adjustments (created_at)
+"""
+
+EPOCH = date(1970, 1, 1)
+
+def date_text(value):
+    return value.isoformat() if value else ""
+
+def row_to_drug(row):
+    return pharmacy_pb2.Drug(id=row[0], name=row[1], quantity=row[2], price=row[3],
+                             expiry_date=date_text(row[4]), category=row[5])
+
+def is_iso_date(value):
+    try:
+        date.fromisoformat(value)
+    except ValueError:
+        return False
+    # fromisoformat also takes forms like 20261231 and 2026-W52-4
+    return len(value) == 10 and value[4] == "-"
+
+def expiry_param(value):
+    """expiry_date as stored: '' (no date) is NULL."""
+    return value or None
+
+def new_drug(drug_id, request):
+    return pharmacy_pb2.Drug(
+        id=drug_id, name=request.name, quantity=request.quantity,
+        price=request.price, expiry_date=request.expiry_date, category=request.category
+    )
+
+def stream_batch_size(requested):
+    if requested <= 0:
+        return STREAM_BATCH_SIZE
+    return min(requested, STREAM_MAX_BATCH_SIZE)
+
+# ─── Stock adjustments ───────────────────────────────────────────────────────
+
+def adjust_stock_params(request):
+    """Returns the params for SQL_ADJUST_STOCK[_RECORDED]; raises ValueError."""
+    if len(request.idempotency_key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+        raise ValueError(f"idempotency_key is longer than {MAX_IDEMPOTENCY_KEY_LENGTH} characters")
+    params = (request.delta, request.id, request.delta)
+    if request.idempotency_key:
+        params += (request.idempotency_key,)
+    return params
+
+def replayed_adjustment(request, adjustment, row):
+    """Response for a key that was already used; adjustment is its recorded row."""
+    drug_id, delta, quantity = adjustment
+    if (drug_id, delta) != (request.id, request.delta):
+        return pharmacy_pb2.DrugResponse(
+            success=False, message="idempotency_key was already used for a different adjustment"
+        )
+    if not row:
+        return pharmacy_pb2.DrugResponse(success=False, message="Drug not found")
+    return pharmacy_pb2.DrugResponse(
+        success=True, message=f"Adjustment already applied (quantity was {quantity})", drug=row_to_drug(row)
+    )
+
+def rejected_adjustment(exists):
+    return pharmacy_pb2.DrugResponse(success=False, message="Insufficient stock" if exists else "Drug not found")
+
+def purge_idempotency_keys():
+    while True:
+        time.sleep(IDEMPOTENCY_PURGE_INTERVAL)
+        try:
+            with db_pool.connection() as conn:
+                cur = conn.cursor()
+                cur.execute(SQL_PURGE_ADJUSTMENTS, (IDEMPOTENCY_KEY_TTL_HOURS,))
+                if cur.rowcount:
+                    print(f"Purged {cur.rowcount} expired idempotency keys")
+                conn.commit()
+                cur.close()
+        except Exception as e:
+            print(f"Idempotency key purge failed: {e}")
+
+# ─── Batch writes ─────────────────────────────────────────────────────────────
+
+def multirow_values(rows, template):
+    return ",".join([template] * len(rows)), [v for row in rows for v in row]
+
+def validate_new_drug(request):
+    # Mirrors the column limits so one bad item can't abort the whole batch
+    if len(request.name) > 255:
+        return "name is longer than 255 characters"
+    if request.expiry_date and not is_iso_date(request.expiry_date):
+        return "expiry_date must be YYYY-MM-DD"
+    if len(request.category) > 100:
+        return "category is longer than 100 characters"
+    return None
+
+def build_batch_insert(ids, requests):
+    values, params = multirow_values(
+        [(i, r.name, r.quantity, r.price, expiry_param(r.expiry_date), r.category) for i, r in zip(ids, requests)],
+        "(%s,%s,%s,%s,%s,%s)"
+    )
+    return f"INSERT INTO drugs ({DRUG_COLUMNS}) VALUES {values}", params
+
+def build_batch_update(quantities):
+    values, params = multirow_values(list(quantities.items()), "(%s::int,%s::int)")
+    sql = (f"UPDATE drugs AS d SET quantity = v.quantity FROM (VALUES {values}) AS v(id, quantity) "
+           f"WHERE d.id = v.id RETURNING d.id, d.name, d.quantity, d.price, d.expiry_date, d.category")
+    return sql, params
+
+def prepare_batch_add(request):
+    """Returns (results, valid): per-item results pre-filled for invalid items."""
+    results = [None] * len(request.drugs)
+    valid = []
+    for i, item in enumerate(request.drugs):
+        error = validate_new_drug(item)
+        if error:
+            results[i] = pharmacy_pb2.DrugResponse(success=False, message=error)
+        else:
+            valid.append(i)
+    return results, valid
+
+def finish_batch_add(request, results, valid, ids=None, error=None):
+    for n, i in enumerate(valid):
+        if error is not None:
+            results[i] = pharmacy_pb2.DrugResponse(success=False, message=error)
+        else:
+            results[i] = pharmacy_pb2.DrugResponse(success=True, message="Drug added", drug=new_drug(ids[n], request.drugs[i]))
+    added = sum(1 for r in results if r.success)
+    return pharmacy_pb2.BatchDrugResponse(
+        success=added == len(results), message=f"{added}/{len(results)} drugs added", results=results
+    )
+
+def batch_update_quantities(request):
+    # Last update for an id wins, as if the items had been applied in order
+    return {u.id: u.quantity for u in request.updates}
+
+def finish_batch_update(request, rows=None, error=None):
+    by_id = {r[0]: r for r in rows or ()}
+    results = []
+    for u in request.updates:
+        if error is not None:
+            results.append(pharmacy_pb2.DrugResponse(success=False, message=error))
+        elif u.id in by_id:
+            results.append(pharmacy_pb2.DrugResponse(success=True, message="Stock updated", drug=row_to_drug(by_id[u.id])))
+        else:
+            results.append(pharmacy_pb2.DrugResponse(success=False, message="Drug not found"))
+    updated = sum(1 for r in results if r.success)
+    return pharmacy_pb2.BatchDrugResponse(
+        success=updated == len(results), message=f"{updated}/{len(results)} stock updates applied", results=results
+    )
+
+def check_batch_size(size):
+    if size > MAX_BATCH_SIZE:
+        raise ValueError(f"Batch of {size} items exceeds MAX_BATCH_SIZE={MAX_BATCH_SIZE}")
+
+# ─── Bulk import ──────────────────────────────────────────────────────────────
+
+class ImportTally:
+    """Counts and buffers one ImportDrugs stream, IMPORT_COPY_ROWS rows at a time."""
+
+    def __init__(self):
+        self.received = 0
+        self.imported = 0
+        self.rejected = 0
+        self.errors = []
+        self.pending = []
+
+    def add(self, item):
+        """Validate one row; returns True once a full COPY chunk is pending."""
+        self.received += 1
+        error = validate_new_drug(item)
+        if error:
+            self.rejected += 1
+            if len(self.errors) < IMPORT_MAX_ERRORS:
+                self.errors.append(pharmacy_pb2.ImportError(row=self.received, message=error))
+            return False
+        self.pending.append((item.name, item.quantity, item.price, expiry_param(item.expiry_date), item.category))
+        return len(self.pending) >= IMPORT_COPY_ROWS
+
+    def take(self):
+        rows, self.pending = self.pending, []
+        return rows
+
+    def response(self, error=None):
+        if error is not None:
+            # The whole import is one transaction, so nothing was kept
+            return pharmacy_pb2.ImportDrugsResponse(
+                success=False, message=error, rows_received=self.received,
+                rows_imported=0, rows_rejected=self.rejected, errors=self.errors
+            )
+        return pharmacy_pb2.ImportDrugsResponse(
+            success=self.rejected == 0,
+            message=f"Imported {self.imported} of {self.received} rows ({self.rejected} rejected)",
+            rows_received=self.received, rows_imported=self.imported,
+            rows_rejected=self.rejected, errors=self.errors
+        )
+
+def copy_chunk(cur, rows):
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator="\n").writerows(rows)
+    buf.seek(0)
+    cur.copy_expert(SQL_COPY_DRUGS, buf)
+
+# ─── Keyset pagination ────────────────────────────────────────────────────────
+
+# limit is None for unpaged requests; projection says which columns are
+# selected and how rows become the response.
+PageQuery = namedtuple("PageQuery", "sql params limit projection")
+
+def page_key_text(value):
+    # Dates go into tokens as days since the epoch, so tokens stay all-integer
+    return str((value - EPOCH).days) if isinstance(value, date) else str(value)
+
+def encode_page_token(*key):
+    return base64.urlsafe_b64encode(",".join(page_key_text(k) for k in key).encode()).decode()
+
+def decode_page_token(token, size):
+    try:
+        key = [int(k) for k in base64.urlsafe_b64decode(token.encode()).decode().split(",")]
+    except (ValueError, binascii.Error):
+        raise ValueError("Invalid page_token")
+    if len(key) != size:
+        raise ValueError("Invalid page_token")
+    return key
+
+def page_key_date(days):
+    try:
+        return EPOCH + timedelta(days=days)
+    except OverflowError:
+        raise ValueError("Invalid page_token")
+
+def drug_filters(request):
+    clauses, params = [], []
+    if request.category:
+        clauses.append("category = %s")
+        params.append(request.category)
+    for field, op in (("expiry_from", ">="), ("expiry_to", "<=")):
+        value = getattr(request, field)
+        if value:
+            try:
+                date.fromisoformat(value)
+            except ValueError:
+                raise ValueError(f"{field} must be YYYY-MM-DD")
+            clauses.append(f"expiry_date {op} %s")
+            params.append(value)
+    return clauses, params
+
+def paged_query(clauses, params, order_by, page_size, projection):
+    sql = f"SELECT {projection.column_list} FROM drugs"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += f" ORDER BY {order_by}"
+    limit = min(page_size, MAX_PAGE_SIZE) if page_size > 0 else None
+    if limit:
+        # One extra row tells us whether another page exists
+        sql += " LIMIT %s"
+        params.append(limit + 1)
+    return PageQuery(sql, params, limit, projection)
+
+def build_list_drugs_query(request):
+    projection = request_projection(request, ("id",))
+    clauses, params = drug_filters(request)
+    if request.page_token:
+        (last_id,) = decode_page_token(request.page_token, 1)
+        clauses.append("id > %s")
+        params.append(last_id)
+    return paged_query(clauses, params, "id", request.page_size, projection)
+
+def build_low_stock_query(request):
+    projection = request_projection(request, ("quantity", "id"))
+    clauses, params = drug_filters(request)
+    clauses.insert(0, "quantity <= %s")
+    params.insert(0, request.threshold)
+    if request.page_token:
+        last_quantity, last_id = decode_page_token(request.page_token, 2)
+        clauses.append("(quantity, id) > (%s, %s)")
+        params.extend([last_quantity, last_id])
+    return paged_query(clauses, params, "quantity, id", request.page_size, projection)
+
+def build_expiring_query(request, today=None):
+    """Drugs expiring within request.within_days of today, soonest first."""
+    if request.within_days < 0:
+        raise ValueError("within_days must not be negative")
+    if request.within_days > MAX_EXPIRING_DAYS:
+        raise ValueError(f"within_days must be at most {MAX_EXPIRING_DAYS}")
+    projection = request_projection(request, ("expiry_date", "id"))
+    today = today or date.today()
+    clauses = ["expiry_date <= %s"]
+    params = [today + timedelta(days=request.within_days)]
+    if not request.include_expired:
+        clauses.append("expiry_date >= %s")
+        params.append(today)
+    if request.category:
+        clauses.append("category = %s")
+        params.append(request.category)
+    if request.page_token:
+        last_days, last_id = decode_page_token(request.page_token, 2)
+        clauses.append("(expiry_date, id) > (%s, %s)")
+        params.extend([page_key_date(last_days), last_id])
+    return paged_query(clauses, params, "expiry_date, id", request.page_size, projection)
+
+def page_response(rows, query):
+    next_token = ""
+    if query.limit is not None and len(rows) > query.limit:
+        rows = rows[:query.limit]
+        next_token = encode_page_token(*query.projection.key(rows[-1]))
+    return query.projection.response(rows, next_page_token=next_token)
+
+# ─── Field masks and compact drugs ────────────────────────────────────────────
+
+DRUG_FIELDS = ("id", "name", "quantity", "price", "expiry_date", "category")
+
+def price_cents(price):
+    return round(price * 100)
+
+def expiry_days(value):
+    return (value - EPOCH).days if value else 0
+
+class CategoryIds:
+    """Category name -> id for compact responses. new() returns the entries
+    handed out since it was last called, so a stream sends each one once."""
+
+    def __init__(self):
+        self.ids = {}
+        self.added = {}
+
+    def get(self, name):
+        if not name:
+            return 0
+        category_id = self.ids.get(name)
+        if category_id is None:
+            category_id = self.ids[name] = len(self.ids) + 1
+            self.added[category_id] = name
+        return category_id
+
+    def new(self):
+        added, self.added = self.added, {}
+        return added
+
+class Projection:
+    """The drug fields a list request asked for. Selected columns are those
+    fields (in DRUG_FIELDS order) followed by any keyset columns the mask
+    left out, so rows line up with fields and key() still works."""
+
+    def __init__(self, fields, key_fields=(), compact=False):
+        self.fields = fields
+        self.columns = fields + tuple(f for f in key_fields if f not in fields)
+        self.column_list = ", ".join(self.columns)
+        self.key_indexes = [self.columns.index(f) for f in key_fields]
+        self.compact = compact
+        self.full = fields == DRUG_FIELDS
+
+    def key(self, row):
+        return tuple(row[i] for i in self.key_indexes)
+
+    def drug(self, row):
+        if self.full:
+            return row_to_drug(row)
+        values = dict(zip(self.fields, row))
+        if "expiry_date" in values:
+            values["expiry_date"] = date_text(values["expiry_date"])
+        return pharmacy_pb2.Drug(**values)
+
+    def compact_drug(self, row, converters):
+        return pharmacy_pb2.CompactDrug(**{name: convert(value) if convert else value
+                                           for (name, convert), value in zip(converters, row)})
+
+    def response(self, rows, categories=None, next_page_token=""):
+        if not self.compact:
+            return pharmacy_pb2.ListDrugsResponse(drugs=[self.drug(r) for r in rows],
+                                                  next_page_token=next_page_token)
+        if categories is None:
+            categories = CategoryIds()
+        compact_fields = {"price": ("price_cents", price_cents), "expiry_date": ("expiry_days", expiry_days),
+                          "category": ("category_id", categories.get)}
+        converters = [compact_fields.get(f, (f, None)) for f in self.fields]
+        drugs = [self.compact_drug(r, converters) for r in rows]
+        return pharmacy_pb2.ListDrugsResponse(compact_drugs=drugs, categories=categories.new(),
+                                              next_page_token=next_page_token)
+
+def request_projection(request, key_fields=()):
+    paths = request.field_mask.paths
+    unknown = sorted(set(paths) - set(DRUG_FIELDS))
+    if unknown:
+        raise ValueError(f"Unknown field_mask path(s): {', '.join(unknown)}")
+    fields = tuple(f for f in DRUG_FIELDS if not paths or f in paths)
+    return Projection(fields, key_fields, request.compact)
+
+def stream_drugs_sql(projection):
+    return f"SELECT {projection.column_list} FROM drugs ORDER BY id"
+
+# ─── Name search ──────────────────────────────────────────────────────────────
+
+def like_prefix(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+def search_params(query, limit):
+    """Parameters for SQL_SEARCH_DRUGS; ValueError for a bad query or limit."""
+    query = query.strip().lower()
+    if not query:
+        raise ValueError("query is required")
+    if len(query) > MAX_SEARCH_QUERY_LENGTH:
+        raise ValueError(f"query is longer than {MAX_SEARCH_QUERY_LENGTH} characters")
+    if limit < 0:
+        raise ValueError("limit must not be negative")
+    limit = min(limit or SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT)
+    return (like_prefix(query), limit, query, query, limit, query, limit)
+
+def search_response(rows):
+    return pharmacy_pb2.SearchDrugsResponse(hits=[
+        pharmacy_pb2.SearchHit(drug=row_to_drug(r), prefix=r[6], score=r[7]) for r in rows
+    ])
+
+# ─── Prepared statements ──────────────────────────────────────────────────────
+# The six statements behind the single-drug RPCs are PREPAREd the first time a
+# connection runs them and EXECUTEd by name afterwards, so Postgres parses and
+# plans each once per connection instead of once per call. Pools built with
+# connection_factory=PreparingConnection track what each connection holds; a
+# new connection (including one replacing a discarded one) starts empty.
+
+class PreparedStatement:
+    """``sql`` in psycopg2 paramstyle: each %s becomes $1, $2, ... for PREPARE
+    and %% a literal %, since PREPARE is sent without parameters."""
+
+    def __init__(self, name, sql):
+        self.name = name
+        self.sql = sql
+        count = 0
+        def placeholder(match):
+            nonlocal count
+            if match.group(1) == "%":
+                return "%"
+            count += 1
+            return f"${count}"
+        self.prepare_sql = f"PREPARE {name} AS " + re.sub(r"%([%s])", placeholder, sql)
+        self.execute_sql = f"EXECUTE {name} ({', '.join(['%s'] * count)})" if count else f"EXECUTE {name}"
+
+PREPARED_ADD_DRUG = PreparedStatement("add_drug", SQL_ADD_DRUG)
+PREPARED_GET_DRUG = PreparedStatement("get_drug", SQL_GET_DRUG)
+PREPARED_UPDATE_STOCK = PreparedStatement("update_stock", SQL_UPDATE_STOCK)
+PREPARED_ADJUST_STOCK = PreparedStatement("adjust_stock", SQL_ADJUST_STOCK)
+PREPARED_DELETE_DRUG = PreparedStatement("delete_drug", SQL_DELETE_DRUG)
+PREPARED_DRUG_EXISTS = PreparedStatement("drug_exists", SQL_DRUG_EXISTS)
+
+class PreparingConnection(psycopg2.extensions.connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+def execute_prepared(cur, statement, params):
+    conn = cur.connection
+    prepared = getattr(conn, "prepared", None)
+    if prepared is None:
+        cur.execute(statement.sql, params)
+        return
+    idle = conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    try:
+        if statement.name not in prepared:
+            cur.execute(statement.prepare_sql)
+            prepared.add(statement.name)
+        cur.execute(statement.execute_sql, params)
+    except (psycopg2.errors.InvalidSqlStatementName, psycopg2.errors.DuplicatePreparedStatement):
+        # The session no longer matches what we tracked (a pooler handed us a
+        # recycled backend, or someone ran DISCARD ALL): start it over. Only
+        # safe to retry if this statement began the transaction.
+        prepared.clear()
+        if not idle:
+            raise
+        conn.rollback()
+        cur.execute("DEALLOCATE ALL")
+        cur.execute(statement.prepare_sql)
+        prepared.add(statement.name)
+        cur.execute(statement.execute_sql, params)
+
+# ─── Replica routing ──────────────────────────────────────────────────────────
+
+def parse_lsn(text):
+    hi, lo = text.split("/")
+    return (int(hi, 16) << 32) | int(lo, 16)
+
+def format_lsn(lsn):
+    return f"{lsn >> 32:X}/{lsn & 0xFFFFFFFF:X}"
+
+def request_min_lsn(context):
+    for key, value in context.invocation_metadata():
+        if key == MIN_LSN_METADATA_KEY:
+            try:
+                return parse_lsn(value)
+            except ValueError:
+                return 0
+    return 0
+
+class ReplicaState:
+    """Last observed replication status of the read replica.
+
+    Refreshed by a monitor loop (monitor_replica here, or its asyncio twin in
+    aio_server.py) and consulted on every read to pick a pool.
+    """
+
+    def __init__(self, max_lag_ms):
+        self.max_lag_ms = max_lag_ms
+        self.healthy = False
+        self.lag_ms = None
+        self.replay_lsn = 0
+        self._lock = threading.Lock()
+        self._reads = {"replica": 0, "primary": 0}
+
+    def update(self, row):
+        in_recovery, streaming, replay_lsn, lag_ms = row
+        self.replay_lsn = parse_lsn(replay_lsn) if replay_lsn else 0
+        self.lag_ms = float(lag_ms) if lag_ms is not None else None
+        self.healthy = bool(in_recovery and streaming)
+
+    def mark_down(self):
+        self.healthy = False
+
+    def routable(self):
+        return self.healthy and self.lag_ms is not None and self.lag_ms <= self.max_lag_ms
+
+    def caught_up(self, min_lsn):
+        return self.replay_lsn >= min_lsn
+
+    def record(self, target):
+        with self._lock:
+            self._reads[target] += 1
+
+    def stats(self):
+        with self._lock:
+            reads = dict(self._reads)
+        return {"healthy": self.healthy, "routable": self.routable(), "lag_ms": self.lag_ms,
+                "replay_lsn": format_lsn(self.replay_lsn), "reads": reads}
+
+# ─── GetDrug cache ────────────────────────────────────────────────────────────
+
+class DrugCache:
+    """Bounded LRU + TTL cache of Drug messages keyed by id.
+
+    Readers call begin() before querying and pass the token to put(), which
+    refuses the fill if the id was invalidated after the query started (or
+    within ``quarantine`` seconds, the window in which a lagging replica may
+    still return the pre-write row). ``clock`` is for tests.
+    """
+
+    def __init__(self, max_entries, ttl, quarantine=0.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.clock = clock
+        self.ttl = ttl
+        self.quarantine = quarantine
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._tombstones = OrderedDict()
+        self._seq = 0
+        self._cleared_at = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, drug_id):
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(drug_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            drug, expires = entry
+            if expires <= now:
+                del self._entries[drug_id]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(drug_id)
+            self.hits += 1
+            return drug
+
+    def begin(self):
+        with self._lock:
+            return self._seq
+
+    def put(self, drug_id, drug, token):
+        now = self.clock()
+        with self._lock:
+            if token < self._cleared_at:
+                return
+            tombstone = self._tombstones.get(drug_id)
+            if tombstone is not None and (tombstone[0] > token or now - tombstone[1] < self.quarantine):
+                return
+            self._entries[drug_id] = (drug, now + self.ttl)
+            self._entries.move_to_end(drug_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, drug_ids):
+        now = self.clock()
+        with self._lock:
+            self._seq += 1
+            for drug_id in drug_ids:
+                if self._entries.pop(drug_id, None) is not None:
+                    self.invalidations += 1
+                self._tombstones[drug_id] = (self._seq, now)
+                self._tombstones.move_to_end(drug_id)
+            while len(self._tombstones) > self.max_entries:
+                self._tombstones.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._seq += 1
+            self._cleared_at = self._seq
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self._entries), "max": self.max_entries, "hits": self.hits,
+                    "misses": self.misses, "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                    "evictions": self.evictions, "expirations": self.expirations,
+                    "invalidations": self.invalidations}
+
+def parse_invalidation(payload):
+    return [int(i) for i in payload.split(",") if i]
+
+def invalidation_payloads(drug_ids):
+    # NOTIFY payloads must stay under 8000 bytes
+    chunk = []
+    for drug_id in drug_ids:
+        chunk.append(str(drug_id))
+        if len(chunk) >= 500:
+            yield ",".join(chunk)
+            chunk = []
+    if chunk:
+        yield ",".join(chunk)
+
+def publish_invalidation(cur, drug_ids):
+    # pg_notify is transactional: listeners only hear about it after COMMIT
+    for payload in invalidation_payloads(drug_ids):
+        cur.execute(SQL_NOTIFY_INVALIDATION, (payload,))
+
 def get_connection():
     return psycopg2.connect(
         host=DB_HOST, port=DB_PORT, dbname=DB_NAME,
         user=DB_USER, password=DB_PASS
     )
 
+class PoolTimeout(Exception):
+    pass
+
+class ConnectionPool:
+    """Thread-safe pool of up to ``maxconn`` psycopg2 connections.
+
+    Returned connections are kept idle and handed out again (most recently
+    used first); one is only closed when it turns out to be broken, so a
+    steady load never reconnects. ``minconn`` connections are opened up front.
+    Checkout blocks for up to ``timeout`` seconds instead of raising as soon
+    as the pool is exhausted, connections idle for longer than ``check_idle``
+    seconds are validated with ``SELECT 1`` before being handed out, and broken
+    connections are discarded and replaced transparently.
+    """
+
+    def __init__(self, minconn, maxconn, timeout, check_idle, name="primary", **dsn):
+        self.name = name
+        self._dsn = dsn
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        # (connection, monotonic time it was returned), most recent last
+        self._idle = []
+        self._open = 0
+        self._closed = False
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self._waiting = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._opened = 0
+        self._discarded = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        now = time.monotonic()
+        for _ in range(min(minconn, maxconn)):
+            self._idle.append((self._connect(), now))
+
+    def _connect(self):
+        start = time.perf_counter()
+        conn = psycopg2.connect(**self._dsn)
+        metrics.record_connect(time.perf_counter() - start)
+        with self._lock:
+            self._open += 1
+            self._opened += 1
+        return conn
+
+    def _healthy(self, conn, returned):
+        if conn.closed:
+            return False
+        if time.monotonic() - returned < self.check_idle:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        with self._lock:
+            self._open -= 1
+            self._discarded += 1
+
+    def _checkout(self):
+        # After a database restart every idle connection may be dead: keep
+        # discarding until one passes the check, else open a new one.
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn, returned = self._idle.pop()
+            if self._healthy(conn, returned):
+                return conn
+            self._discard(conn)
+        return self._connect()
+
+    def getconn(self):
+        start = time.monotonic()
+        with self._lock:
+            self._waiting += 1
+        acquired = self._slots.acquire(timeout=self.timeout)
+        waited = time.monotonic() - start
+        metrics.record_pool_wait(self.name, waited)
+        with self._lock:
+            self._waiting -= 1
+            if not acquired:
+                self._timeouts += 1
+        if not acquired:
+            raise PoolTimeout(f"Timed out after {self.timeout}s waiting for a database connection")
+        try:
+            conn = self._checkout()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return conn
+
+    def putconn(self, conn, close=False):
+        try:
+            if not close and not conn.closed:
+                status = conn.info.transaction_status
+                if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                    close = True
+                elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        close = True
+            if close or conn.closed or self._closed:
+                self._discard(conn)
+            else:
+                with self._lock:
+                    self._idle.append((conn, time.monotonic()))
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, close=broken)
+
+    def stats(self):
+        with self._lock:
+            checkouts = self._checkouts
+            return {
+                "max": self.maxconn,
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "waiting": self._waiting,
+                "checkouts": checkouts,
+                "timeouts": self._timeouts,
+                "opened": self._opened,
+                "discarded": self._discarded,
+                "avg_wait_ms": round(self._wait_total * 1000 / checkouts, 3) if checkouts else 0.0,
+                "max_wait_ms": round(self._wait_max * 1000, 3),
+            }
+
+    def closeall(self):
+        """Closes the idle connections; ones still checked out close when returned."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+
+db_pool = None
+replica_pool = None
+replica_state = None
+drug_cache = None
+
+def cache_quarantine():
+    # How far behind a replica read can be and still be routed to the replica
+    return REPLICA_MAX_LAG_MS / 1000 + REPLICA_CHECK_INTERVAL if DB_REPLICA_HOST else 0.0
+
+def init_cache():
+    global drug_cache
+    if DRUG_CACHE_SIZE > 0:
+        drug_cache = DrugCache(DRUG_CACHE_SIZE, DRUG_CACHE_TTL, cache_quarantine())
+        print(f"GetDrug cache enabled (max={DRUG_CACHE_SIZE}, ttl={DRUG_CACHE_TTL}s)")
+    return drug_cache
+
+def invalidate_local(drug_ids):
+    if drug_cache is not None:
+        drug_cache.invalidate(drug_ids)
+
+def listen_for_invalidations():
+    # Dedicated connection outside the pool: LISTEN needs autocommit and must
+    # stay open. Anything missed while disconnected is covered by clear().
+    while True:
+        conn = None
+        try:
+            conn = get_connection()
+            conn.autocommit = True
+            cur = conn.cursor()
+            cur.execute(f"LISTEN {DRUG_INVALIDATION_CHANNEL}")
+            drug_cache.clear()
+            print(f"Listening for cache invalidations on '{DRUG_INVALIDATION_CHANNEL}'")
+            while True:
+                if select.select([conn], [], [], 5) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    drug_cache.invalidate(parse_invalidation(notify.payload))
+        except Exception as e:
+            print(f"Invalidation listener error, clearing cache: {e}")
+            drug_cache.clear()
+            if conn is not None:
+                conn.close()
+            time.sleep(1)
+
+def connection_options():
+    return {"connection_factory": PreparingConnection} if PREPARED_STATEMENTS else {}
+
+def init_pool():
+    global db_pool, replica_pool, replica_state
+    db_pool = ConnectionPool(
+        DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT, DB_POOL_CHECK_IDLE, name="primary",
+        host=DB_HOST, port=DB_PORT, dbname=DB_NAME,
+        user=DB_USER, password=DB_PASS, cursor_factory=metrics.TimedCursor, **connection_options()
+    )
+    print(f"DB pool ready (min={DB_POOL_MIN}, max={DB_POOL_MAX}, timeout={DB_POOL_TIMEOUT}s)")
+    if DB_REPLICA_HOST:
+        # minconn=0 so a replica that is still bootstrapping doesn't block startup;
+        # connections opened on demand are then kept idle and reused like the
+        # primary's, so replica reads don't reconnect (or re-PREPARE) each time
+        replica_pool = ConnectionPool(
+            0, DB_POOL_MAX, DB_POOL_TIMEOUT, DB_POOL_CHECK_IDLE, name="replica",
+            host=DB_REPLICA_HOST, port=DB_REPLICA_PORT, dbname=DB_NAME,
+            user=DB_USER, password=DB_PASS, cursor_factory=metrics.TimedCursor, **connection_options()
+        )
+        replica_state = ReplicaState(REPLICA_MAX_LAG_MS)
+        print(f"Read replica pool ready ({DB_REPLICA_HOST}, max lag {REPLICA_MAX_LAG_MS}ms)")
+    return db_pool
+
+def monitor_replica():
+    while True:
+        try:
+            with replica_pool.connection() as conn:
+                cur = conn.cursor()
+                cur.execute(SQL_REPLICA_STATUS)
+                replica_state.update(cur.fetchone())
+                cur.close()
+        except Exception as e:
+            if replica_state.healthy:
+                print(f"Replica unavailable, routing reads to primary: {e}")
+            replica_state.mark_down()
+        time.sleep(REPLICA_CHECK_INTERVAL)
+
+@contextmanager
+def read_connection(min_lsn=0):
+    pool, conn = db_pool, None
+    if replica_state is not None and replica_state.routable():
+        try:
+            conn = replica_pool.getconn()
+            if not replica_state.caught_up(min_lsn):
+                # The monitor's view may be up to a second old; ask directly.
+                cur = conn.cursor()
+                cur.execute(SQL_REPLAYED_LSN, (format_lsn(min_lsn),))
+                replayed = cur.fetchone()[0]
+                cur.close()
+                if not replayed:
+                    replica_pool.putconn(conn)
+                    conn = None
+            if conn is not None:
+                pool = replica_pool
+        except PoolTimeout:
+            conn = None
+        except psycopg2.Error:
+            if conn is not None:
+                replica_pool.putconn(conn, close=True)
+                conn = None
+            replica_state.mark_down()
+    if conn is None:
+        conn = db_pool.getconn()
+    if replica_state is not None:
+        replica_state.record("replica" if pool is replica_pool else "primary")
+    broken = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        pool.putconn(conn, close=broken)
+
+def commit_lsn(cur):
+    # Only worth the extra round trip when reads can be served by a replica.
+    # Runs after commit, so a failure here must not fail the write itself.
+    if replica_state is None:
+        return None
+    try:
+        cur.execute(SQL_CURRENT_LSN)
+        return cur.fetchone()[0]
+    except psycopg2.Error as e:
+        print(f"Could not read commit LSN: {e}")
+        return None
+
+def set_lsn_token(context, lsn):
+    if lsn:
+        context.set_trailing_metadata(((LSN_METADATA_KEY, lsn),))
+
+def send_lsn_token(context, cur):
+    set_lsn_token(context, commit_lsn(cur))
+
+def report_pool_stats():
+    while True:
+        time.sleep(POOL_STATS_INTERVAL)
+        print(f"DB pool stats: {db_pool.stats()}")
+        if replica_state is not None:
+            print(f"Replica pool stats: {replica_pool.stats()} routing: {replica_state.stats()}")
+        if drug_cache is not None:
+            print(f"GetDrug cache stats: {drug_cache.stats()}")
+
+def state_metrics(pools, replica_state, cache):
+    """Scrape-time gauges for pools (name -> stats dict), replica routing and the cache."""
+    samples = [("pharmacy_prepared_statements_enabled", "gauge",
+                "1 if the hot statements run as server-side prepared statements.", {}, int(PREPARED_STATEMENTS))]
+    for name, stats in pools.items():
+        for state, value in stats.items():
+            samples.append(("pharmacy_db_pool", "gauge", "Connection pool state (from pool stats).",
+                            {"pool": name, "stat": state}, value))
+    if replica_state is not None:
+        samples.append(("pharmacy_replica_routable", "gauge", "1 if reads may go to the replica.",
+                        {}, int(replica_state.routable())))
+        if replica_state.lag_ms is not None:
+            samples.append(("pharmacy_replica_lag_ms", "gauge", "Last observed replica lag.",
+                            {}, replica_state.lag_ms))
+    if cache is not None:
+        for stat, value in cache.stats().items():
+            samples.append(("pharmacy_drug_cache", "gauge", "GetDrug cache stats.", {"stat": stat}, value))
+    return samples
+
+def collect_metrics():
+    pools = {"primary": db_pool.stats()}
+    if replica_pool is not None:
+        pools["replica"] = replica_pool.stats()
+    return state_metrics(pools, replica_state, drug_cache)
+
 def init_db():
     for i in range(10):
         try:
             conn = get_connection()
             cur = conn.cursor()
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS drugs (
-                    id SERIAL PRIMARY KEY,
-                    name VARCHAR(255) NOT NULL,
-                    quantity INTEGER NOT NULL DEFAULT 0,
-                    price FLOAT NOT NULL DEFAULT 0.0,
-                    expiry_date VARCHAR(50),
-                    category VARCHAR(100)
-                )
-            """)
+            cur.execute(SQL_CREATE_TABLE)
+            cur.execute(SQL_MIGRATE_EXPIRY_DATE)
+            cur.execute(SQL_CREATE_INDEXES)
             conn.commit()
             cur.close()
             conn.close()
@@ -47,108 +1205,605 @@ def init_db():
             time.sleep(3)
     raise Exception("Could not connect to database after 10 attempts")
 
+# ─── Group commit ─────────────────────────────────────────────────────────────
+# With GROUP_COMMIT_WINDOW_MS set, AddDrug and UpdateStock hand their write to
+# a committer thread instead of running a transaction each. The committer
+# takes the oldest queued write, collects whatever else arrives within the
+# window of it (up to GROUP_COMMIT_MAX_BATCH) and applies them all with the
+# batch statements and a single COMMIT, so a burst pays for one WAL flush
+# rather than one per call. A write waits at most the window plus the batch
+# ahead of it. If a batch fails, its writes are retried one transaction each,
+# so a bad row only fails its own caller.
+
+def add_drug(request):
+    """(DrugResponse, commit LSN or None) for one AddDrug in its own transaction."""
+    with db_pool.connection() as conn:
+        cur = conn.cursor()
+        execute_prepared(
+            cur, PREPARED_ADD_DRUG,
+            (request.name, request.quantity, request.price, expiry_param(request.expiry_date), request.category)
+        )
+        drug_id = cur.fetchone()[0]
+        conn.commit()
+        lsn = commit_lsn(cur)
+        cur.close()
+    return pharmacy_pb2.DrugResponse(success=True, message="Drug added", drug=new_drug(drug_id, request)), lsn
+
+def update_stock(request):
+    """(DrugResponse, commit LSN or None) for one UpdateStock in its own transaction."""
+    with db_pool.connection() as conn:
+        cur = conn.cursor()
+        execute_prepared(cur, PREPARED_UPDATE_STOCK, (request.quantity, request.id))
+        row = cur.fetchone()
+        if row:
+            publish_invalidation(cur, [request.id])
+        conn.commit()
+        invalidate_local([request.id])
+        lsn = commit_lsn(cur)
+        cur.close()
+    if not row:
+        return pharmacy_pb2.DrugResponse(success=False, message="Drug not found"), lsn
+    return pharmacy_pb2.DrugResponse(success=True, message="Stock updated", drug=row_to_drug(row)), lsn
+
+def add_drugs(requests):
+    """AddDrug responses for ``requests`` inserted with one statement and one COMMIT, and the LSN."""
+    with db_pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute(SQL_ALLOCATE_IDS, (len(requests),))
+        ids = [r[0] for r in cur.fetchall()]
+        sql, params = build_batch_insert(ids, requests)
+        cur.execute(sql, params)
+        conn.commit()
+        lsn = commit_lsn(cur)
+        cur.close()
+    return [pharmacy_pb2.DrugResponse(success=True, message="Drug added", drug=new_drug(drug_id, r))
+            for drug_id, r in zip(ids, requests)], lsn
+
+def update_stocks(requests):
+    """UpdateStock responses for ``requests`` (distinct ids) applied with one COMMIT, and the LSN."""
+    quantities = {r.id: r.quantity for r in requests}
+    with db_pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute(SQL_LOCK_DRUGS, (list(quantities),))
+        sql, params = build_batch_update(quantities)
+        cur.execute(sql, params)
+        rows = {r[0]: r for r in cur.fetchall()}
+        publish_invalidation(cur, list(rows))
+        conn.commit()
+        invalidate_local(list(rows))
+        lsn = commit_lsn(cur)
+        cur.close()
+    return [pharmacy_pb2.DrugResponse(success=True, message="Stock updated", drug=row_to_drug(rows[r.id]))
+            if r.id in rows else pharmacy_pb2.DrugResponse(success=False, message="Drug not found")
+            for r in requests], lsn
+
+class PendingWrite:
+    __slots__ = ("request", "queued", "done", "response", "lsn", "db_seconds")
+
+    def __init__(self, request, queued):
+        self.request = request
+        self.queued = queued
+        self.done = threading.Event()
+        self.response = None
+        self.lsn = None
+        self.db_seconds = 0.0
+
+class GroupCommitter:
+    """Coalesces one kind of single-row write (see the section comment).
+
+    ``write_one(request)`` and ``write_batch(requests)`` return what
+    add_drug/add_drugs do; ``key`` maps a request to something that may only
+    appear once per batch (None: no restriction). A write whose key is
+    already in the batch closes it and opens the next one, so each caller
+    sees the result of its own write. ``clock`` is for tests.
+    """
+
+    def __init__(self, op, write_one, write_batch, window, max_batch, key=None, clock=time.monotonic):
+        self.op = op
+        self.write_one = write_one
+        self.write_batch = write_batch
+        self.window = window
+        self.max_batch = max_batch
+        self.key = key
+        self.clock = clock
+        self._queue = queue.Queue()
+        self._next = None
+
+    def start(self):
+        threading.Thread(target=self._run, name=f"group-commit-{self.op}", daemon=True).start()
+        return self
+
+    def submit(self, request):
+        """Blocks until the write has committed (or failed); (response, LSN)."""
+        pending = PendingWrite(request, self.clock())
+        self._queue.put(pending)
+        pending.done.wait()
+        metrics.credit_db_seconds(pending.db_seconds)
+        return pending.response, pending.lsn
+
+    def _collect(self):
+        first, self._next = self._next or self._queue.get(), None
+        batch = [first]
+        keys = {self.key(first.request)} if self.key else None
+        # The window runs from the oldest write's arrival: when the previous
+        # batch took longer than that, whatever queued meanwhile goes at once.
+        deadline = first.queued + self.window
+        while len(batch) < self.max_batch:
+            try:
+                pending = self._queue.get(timeout=max(deadline - self.clock(), 0))
+            except queue.Empty:
+                break
+            if keys is not None:
+                key = self.key(pending.request)
+                if key in keys:
+                    self._next = pending
+                    break
+                keys.add(key)
+            batch.append(pending)
+        return batch
+
+    def _flush(self, batch):
+        requests = [p.request for p in batch]
+        if len(batch) == 1:
+            return [self.write_one(requests[0])]
+        try:
+            responses, lsn = self.write_batch(requests)
+            return [(response, lsn) for response in responses]
+        except Exception as e:
+            print(f"Group commit of {len(batch)} {self.op} writes failed, retrying one by one: {e}")
+            metrics.record_group_commit_fallback(self.op)
+        results = []
+        for request in requests:
+            try:
+                results.append(self.write_one(request))
+            except Exception as e:
+                results.append((pharmacy_pb2.DrugResponse(success=False, message=str(e)), None))
+        return results
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = self.clock()
+            metrics.record_group_commit(self.op, [started - p.queued for p in batch])
+            # The batch's statements are timed under the op's endpoint, and
+            # every caller is credited the batch's DB time, since it waited
+            # for all of it.
+            stats = metrics.RequestStats(self.op)
+            metrics.current_request.set(stats)
+            try:
+                results = self._flush(batch)
+            except Exception as e:
+                results = [(pharmacy_pb2.DrugResponse(success=False, message=str(e)), None)] * len(batch)
+            for pending, (response, lsn) in zip(batch, results):
+                pending.response, pending.lsn = response, lsn
+                pending.db_seconds = stats.db_seconds
+                pending.done.set()
+
+add_committer = None
+stock_committer = None
+
+def init_group_commit():
+    global add_committer, stock_committer
+    if GROUP_COMMIT_WINDOW_MS <= 0:
+        return
+    window = GROUP_COMMIT_WINDOW_MS / 1000
+    max_batch = max(1, min(GROUP_COMMIT_MAX_BATCH, MAX_BATCH_SIZE))
+    add_committer = GroupCommitter("AddDrug", add_drug, add_drugs, window, max_batch).start()
+    stock_committer = GroupCommitter("UpdateStock", update_stock, update_stocks, window, max_batch,
+                                     key=lambda r: r.id).start()
+    print(f"Group commit enabled (window={GROUP_COMMIT_WINDOW_MS}ms, max batch={max_batch})")
+
 class PharmacyServicer(pharmacy_pb2_grpc.PharmacyServiceServicer):
 
     def AddDrug(self, request, context):
+        error = validate_new_drug(request)
+        if error:
+            return pharmacy_pb2.DrugResponse(success=False, message=error)
         try:
-            conn = get_connection()
-            cur = conn.cursor()
-            cur.execute(
-                "INSERT INTO drugs (name, quantity, price, expiry_date, category) VALUES (%s,%s,%s,%s,%s) RETURNING id",
-                (request.name, request.quantity, request.price, request.expiry_date, request.category)
-            )
-            drug_id = cur.fetchone()[0]
-            conn.commit()
-            cur.close()
-            conn.close()
-            drug = pharmacy_pb2.Drug(
-                id=drug_id, name=request.name, quantity=request.quantity,
-                price=request.price, expiry_date=request.expiry_date, category=request.category
-            )
-            return pharmacy_pb2.DrugResponse(success=True, message="Drug added", drug=drug)
+            if add_committer is not None:
+                response, lsn = add_committer.submit(request)
+            else:
+                response, lsn = add_drug(request)
+            set_lsn_token(context, lsn)
+            return response
         except Exception as e:
             return pharmacy_pb2.DrugResponse(success=False, message=str(e))
 
     def GetDrug(self, request, context):
         try:
-            conn = get_connection()
-            cur = conn.cursor()
-            cur.execute("SELECT id, name, quantity, price, expiry_date, category FROM drugs WHERE id=%s", (request.id,))
-            row = cur.fetchone()
-            cur.close()
-            conn.close()
+            min_lsn = request_min_lsn(context)
+            token = None
+            if drug_cache is not None:
+                # Read-your-writes callers skip the lookup: another server's
+                # invalidation for their write may still be in flight.
+                drug = drug_cache.get(request.id) if not min_lsn else None
+                if drug is not None:
+                    return pharmacy_pb2.DrugResponse(success=True, message="Found", drug=drug)
+                token = drug_cache.begin()
+            with read_connection(min_lsn) as conn:
+                cur = conn.cursor()
+                execute_prepared(cur, PREPARED_GET_DRUG, (request.id,))
+                row = cur.fetchone()
+                cur.close()
             if not row:
                 return pharmacy_pb2.DrugResponse(success=False, message="Drug not found")
-            drug = pharmacy_pb2.Drug(id=row[0], name=row[1], quantity=row[2], price=row[3], expiry_date=row[4], category=row[5])
+            drug = row_to_drug(row)
+            if drug_cache is not None:
+                drug_cache.put(request.id, drug, token)
             return pharmacy_pb2.DrugResponse(success=True, message="Found", drug=drug)
         except Exception as e:
             return pharmacy_pb2.DrugResponse(success=False, message=str(e))
 
     def UpdateStock(self, request, context):
         try:
-            conn = get_connection()
-            cur = conn.cursor()
-            cur.execute("UPDATE drugs SET quantity=%s WHERE id=%s RETURNING id, name, quantity, price, expiry_date, category", (request.quantity, request.id))
-            row = cur.fetchone()
-            conn.commit()
-            cur.close()
-            conn.close()
-            if not row:
-                return pharmacy_pb2.DrugResponse(success=False, message="Drug not found")
-            drug = pharmacy_pb2.Drug(id=row[0], name=row[1], quantity=row[2], price=row[3], expiry_date=row[4], category=row[5])
-            return pharmacy_pb2.DrugResponse(success=True, message="Stock updated", drug=drug)
+            if stock_committer is not None:
+                response, lsn = stock_committer.submit(request)
+            else:
+                response, lsn = update_stock(request)
+            set_lsn_token(context, lsn)
+            return response
+        except Exception as e:
+            return pharmacy_pb2.DrugResponse(success=False, message=str(e))
+
+    def AdjustStock(self, request, context):
+        try:
+            params = adjust_stock_params(request)
+        except ValueError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        try:
+            with db_pool.connection() as conn:
+                cur = conn.cursor()
+                if request.idempotency_key:
+                    cur.execute(SQL_CLAIM_ADJUSTMENT, (request.idempotency_key, request.id, request.delta))
+                    if cur.fetchone() is None:
+                        cur.execute(SQL_GET_ADJUSTMENT, (request.idempotency_key,))
+                        adjustment = cur.fetchone()
+                        execute_prepared(cur, PREPARED_GET_DRUG, (request.id,))
+                        row = cur.fetchone()
+                        conn.rollback()
+                        cur.close()
+                        return replayed_adjustment(request, adjustment, row)
+                    cur.execute(SQL_ADJUST_STOCK_RECORDED, params)
+                else:
+                    execute_prepared(cur, PREPARED_ADJUST_STOCK, params)
+                row = cur.fetchone()
+                if not row:
+                    # Roll back so the key is released for a retry once stock arrives
+                    conn.rollback()
+                    execute_prepared(cur, PREPARED_DRUG_EXISTS, (request.id,))
+                    exists = cur.fetchone() is not None
+                    conn.rollback()
+                    cur.close()
+                    return rejected_adjustment(exists)
+                publish_invalidation(cur, [request.id])
+                conn.commit()
+                invalidate_local([request.id])
+                send_lsn_token(context, cur)
+                cur.close()
+            return pharmacy_pb2.DrugResponse(success=True, message="Stock adjusted", drug=row_to_drug(row))
         except Exception as e:
             return pharmacy_pb2.DrugResponse(success=False, message=str(e))
 
     def DeleteDrug(self, request, context):
         try:
-            conn = get_connection()
-            cur = conn.cursor()
-            cur.execute("DELETE FROM drugs WHERE id=%s RETURNING id", (request.id,))
-            row = cur.fetchone()
-            conn.commit()
-            cur.close()
-            conn.close()
+            with db_pool.connection() as conn:
+                cur = conn.cursor()
+                execute_prepared(cur, PREPARED_DELETE_DRUG, (request.id,))
+                row = cur.fetchone()
+                if row:
+                    publish_invalidation(cur, [request.id])
+                conn.commit()
+                invalidate_local([request.id])
+                send_lsn_token(context, cur)
+                cur.close()
             if not row:
                 return pharmacy_pb2.DeleteResponse(success=False, message="Drug not found")
             return pharmacy_pb2.DeleteResponse(success=True, message=f"Drug {request.id} deleted")
         except Exception as e:
             return pharmacy_pb2.DeleteResponse(success=False, message=str(e))
 
+    def BatchAddDrugs(self, request, context):
+        try:
+            check_batch_size(len(request.drugs))
+        except ValueError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        results, valid = prepare_batch_add(request)
+        if not valid:
+            return finish_batch_add(request, results, valid)
+        try:
+            with db_pool.connection() as conn:
+                cur = conn.cursor()
+                cur.execute(SQL_ALLOCATE_IDS, (len(valid),))
+                ids = [r[0] for r in cur.fetchall()]
+                sql, params = build_batch_insert(ids, [request.drugs[i] for i in valid])
+                cur.execute(sql, params)
+                conn.commit()
+                send_lsn_token(context, cur)
+                cur.close()
+            return finish_batch_add(request, results, valid, ids=ids)
+        except Exception as e:
+            return finish_batch_add(request, results, valid, error=str(e))
+
+    def BatchUpdateStock(self, request, context):
+        try:
+            check_batch_size(len(request.updates))
+        except ValueError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        quantities = batch_update_quantities(request)
+        if not quantities:
+            return finish_batch_update(request)
+        try:
+            with db_pool.connection() as conn:
+                cur = conn.cursor()
+                cur.execute(SQL_LOCK_DRUGS, (list(quantities),))
+                sql, params = build_batch_update(quantities)
+                cur.execute(sql, params)
+                rows = cur.fetchall()
+                updated = [r[0] for r in rows]
+                publish_invalidation(cur, updated)
+                conn.commit()
+                invalidate_local(updated)
+                send_lsn_token(context, cur)
+                cur.close()
+            return finish_batch_update(request, rows=rows)
+        except Exception as e:
+            return finish_batch_update(request, error=str(e))
+
+    def ImportDrugs(self, request_iterator, context):
+        tally = ImportTally()
+        try:
+            with db_pool.connection() as conn:
+                cur = conn.cursor()
+                for chunk in request_iterator:
+                    for item in chunk.drugs:
+                        if tally.add(item):
+                            rows = tally.take()
+                            copy_chunk(cur, rows)
+                            tally.imported += len(rows)
+                            print(f"ImportDrugs: {tally.imported} rows copied, {tally.rejected} rejected")
+                rows = tally.take()
+                if rows:
+                    copy_chunk(cur, rows)
+                    tally.imported += len(rows)
+                conn.commit()
+                send_lsn_token(context, cur)
+                cur.close()
+            print(f"ImportDrugs: committed {tally.imported} rows")
+            return tally.response()
+        except Exception as e:
+            return tally.response(error=str(e))
+
     def ListDrugs(self, request, context):
         try:
-            conn = get_connection()
-            cur = conn.cursor()
-            cur.execute("SELECT id, name, quantity, price, expiry_date, category FROM drugs ORDER BY id")
-            rows = cur.fetchall()
-            cur.close()
-            conn.close()
-            drugs = [pharmacy_pb2.Drug(id=r[0], name=r[1], quantity=r[2], price=r[3], expiry_date=r[4], category=r[5]) for r in rows]
-            return pharmacy_pb2.ListDrugsResponse(drugs=drugs)
+            query = build_list_drugs_query(request)
+        except ValueError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        try:
+            with read_connection(request_min_lsn(context)) as conn:
+                cur = conn.cursor()
+                cur.execute(query.sql, query.params)
+                rows = cur.fetchall()
+                cur.close()
+            return page_response(rows, query)
         except Exception as e:
             return pharmacy_pb2.ListDrugsResponse(drugs=[])
 
+    def StreamDrugs(self, request, context):
+        batch_size = stream_batch_size(request.batch_size)
+        try:
+            projection = request_projection(request)
+        except ValueError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        categories = CategoryIds()
+        try:
+            with read_connection(request_min_lsn(context)) as conn:
+                # A named cursor keeps the result set on the server; each
+                # fetchmany() is one FETCH FORWARD, so memory stays bounded.
+                cur = conn.cursor(name="stream_drugs")
+                cur.execute(stream_drugs_sql(projection))
+                while context.is_active():
+                    rows = cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield projection.response(rows, categories)
+                cur.close()
+                conn.rollback()
+        except Exception as e:
+            context.abort(grpc.StatusCode.INTERNAL, str(e))
+
     def GetLowStock(self, request, context):
         try:
-            conn = get_connection()
-            cur = conn.cursor()
-            cur.execute("SELECT id, name, quantity, price, expiry_date, category FROM drugs WHERE quantity <= %s ORDER BY quantity", (request.threshold,))
-            rows = cur.fetchall()
-            cur.close()
-            conn.close()
-            drugs = [pharmacy_pb2.Drug(id=r[0], name=r[1], quantity=r[2], price=r[3], expiry_date=r[4], category=r[5]) for r in rows]
-            return pharmacy_pb2.ListDrugsResponse(drugs=drugs)
+            query = build_low_stock_query(request)
+        except ValueError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        try:
+            with read_connection(request_min_lsn(context)) as conn:
+                cur = conn.cursor()
+                cur.execute(query.sql, query.params)
+                rows = cur.fetchall()
+                cur.close()
+            return page_response(rows, query)
         except Exception as e:
             return pharmacy_pb2.ListDrugsResponse(drugs=[])
 
-def serve():
-    init_db()
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=50))
+    def GetExpiringDrugs(self, request, context):
+        try:
+            query = build_expiring_query(request)
+        except ValueError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        try:
+            with read_connection(request_min_lsn(context)) as conn:
+                cur = conn.cursor()
+                cur.execute(query.sql, query.params)
+                rows = cur.fetchall()
+                cur.close()
+            return page_response(rows, query)
+        except Exception as e:
+            return pharmacy_pb2.ListDrugsResponse(drugs=[])
+
+    def SearchDrugs(self, request, context):
+        try:
+            params = search_params(request.query, request.limit)
+        except ValueError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        try:
+            with read_connection(request_min_lsn(context)) as conn:
+                cur = conn.cursor()
+                cur.execute(SQL_SEARCH_DRUGS, params)
+                rows = cur.fetchall()
+                cur.close()
+            return search_response(rows)
+        except Exception as e:
+            context.abort(grpc.StatusCode.INTERNAL, str(e))
+
+    def Profile(self, request, context):
+        error = profile_error(request, context)
+        if error:
+            context.abort(*error)
+        try:
+            return run_profile(request)
+        except profiler.ProfilerBusy as e:
+            context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, str(e))
+
+# ─── Profiling ────────────────────────────────────────────────────────────────
+
+def profile_error(request, context):
+    """(status code, message) if this Profile call must be refused, else None."""
+    token = ""
+    for key, value in context.invocation_metadata():
+        if key == ADMIN_TOKEN_METADATA_KEY:
+            token = value
+    if not profiler.admin_allowed(token):
+        return grpc.StatusCode.PERMISSION_DENIED, "Profile requires a valid x-admin-token"
+    try:
+        profiler.profile_params(request.seconds, request.interval_ms)
+    except ValueError as e:
+        return grpc.StatusCode.INVALID_ARGUMENT, str(e)
+    return None
+
+def run_profile(request):
+    stacks, samples = profiler.profile(request.seconds, request.interval_ms)
+    return pharmacy_pb2.ProfileResponse(
+        success=True, message=f"{samples} stack samples over {request.seconds:g}s",
+        samples=samples, collapsed_stacks=stacks
+    )
+
+def stop_event():
+    """An Event set on SIGTERM or SIGINT; call from the main thread."""
+    stopping = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stopping.set())
+    return stopping
+
+def serve(worker=None):
+    """Run the gRPC server until SIGTERM/SIGINT. ``worker`` is the index of a
+    pre-forked worker process, None for a standalone server."""
+    if worker is None:
+        init_db()
+    init_pool()
+    if POOL_STATS_INTERVAL > 0:
+        threading.Thread(target=report_pool_stats, daemon=True).start()
+    if replica_state is not None:
+        threading.Thread(target=monitor_replica, daemon=True).start()
+    if init_cache() is not None:
+        threading.Thread(target=listen_for_invalidations, daemon=True).start()
+    # One purger per node is enough
+    if IDEMPOTENCY_PURGE_INTERVAL > 0 and not worker:
+        threading.Thread(target=purge_idempotency_keys, daemon=True).start()
+    init_group_commit()
+    if METRICS_PORT:
+        metrics.REGISTRY.register_collector(collect_metrics)
+        if worker is None:
+            metrics.start_http_server(METRICS_PORT)
+        else:
+            metrics.start_http_server(worker_metrics_port(worker), host="127.0.0.1")
+    stopping = stop_event()
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=MAX_WORKERS),
+                         interceptors=[MetricsInterceptor()],
+                         options=[("grpc.so_reuseport", 1)] if worker is not None else None)
     pharmacy_pb2_grpc.add_PharmacyServiceServicer_to_server(PharmacyServicer(), server)
     server.add_insecure_port('[::]:50051')
     server.start()
-    print("gRPC server started on port 50051")
-    server.wait_for_termination()
+    if worker is None:
+        print("gRPC server started on port 50051")
+    else:
+        print(f"gRPC worker {worker} (pid {os.getpid()}) started on port 50051")
+    stopping.wait()
+    # New calls are refused at once; those in flight get SHUTDOWN_GRACE seconds
+    print(f"Stopping gRPC server (grace {SHUTDOWN_GRACE:g}s)")
+    server.stop(SHUTDOWN_GRACE).wait()
+    db_pool.closeall()
+    if replica_pool is not None:
+        replica_pool.closeall()
+
+# ─── Pre-fork ─────────────────────────────────────────────────────────────────
+# A single grpc.server runs every handler, protobuf building included, under
+# one GIL. With SERVER_WORKERS > 1 this process instead supervises that many
+# spawned serve() workers, all bound to port 50051 with SO_REUSEPORT so the
+# kernel spreads incoming connections across them. Each worker has its own
+# executor, pool, cache and committers; MAX_WORKERS and the pool sizes are
+# divided between them so the node keeps the configured totals. The
+# supervisor restarts workers that die, serves their summed metrics on
+# METRICS_PORT, and on SIGTERM/SIGINT stops them and waits while they drain.
+
+def worker_count():
+    return SERVER_WORKERS if SERVER_WORKERS > 0 else os.cpu_count() or 1
+
+def worker_metrics_port(worker):
+    return METRICS_PORT + 1 + worker
+
+def worker_share(total, workers):
+    return -(-total // workers)
+
+def worker_environment(workers):
+    """Settings the spawned workers read at import: their share of the node's totals."""
+    return {
+        "SERVER_WORKERS": "1",
+        "MAX_WORKERS": str(max(1, worker_share(MAX_WORKERS, workers))),
+        "DB_POOL_MIN": str(worker_share(DB_POOL_MIN, workers)),
+        "DB_POOL_MAX": str(max(1, worker_share(DB_POOL_MAX, workers))),
+    }
+
+def start_worker(ctx, worker):
+    process = ctx.Process(target=serve, args=(worker,), name=f"grpc-worker-{worker}")
+    process.start()
+    return process
+
+def prefork(workers):
+    init_db()
+    os.environ.update(worker_environment(workers))
+    # spawn: a forked child would inherit the parent's gRPC and libpq state
+    ctx = multiprocessing.get_context("spawn")
+    stopping = stop_event()
+    processes = {i: start_worker(ctx, i) for i in range(workers)}
+    if METRICS_PORT:
+        urls = {i: f"http://127.0.0.1:{worker_metrics_port(i)}/metrics/snapshot" for i in range(workers)}
+        metrics.start_http_server(METRICS_PORT, metrics.aggregating_handler(urls))
+    print(f"Pre-fork supervisor started {workers} workers "
+          f"(MAX_WORKERS={os.environ['MAX_WORKERS']}, DB_POOL_MAX={os.environ['DB_POOL_MAX']} each)")
+    while not stopping.wait(1):
+        for i, process in processes.items():
+            if not process.is_alive():
+                print(f"Worker {i} (pid {process.pid}) exited with code {process.exitcode}, restarting")
+                processes[i] = start_worker(ctx, i)
+    print(f"Stopping {workers} workers")
+    for process in processes.values():
+        if process.is_alive():
+            process.terminate()
+    deadline = time.monotonic() + SHUTDOWN_GRACE + 2
+    for i, process in processes.items():
+        process.join(max(0, deadline - time.monotonic()))
+        if process.is_alive():
+            print(f"Worker {i} (pid {process.pid}) did not stop in time, killing it")
+            process.kill()
+            process.join()
+    print("All workers stopped")
 
 if __name__ == '__main__':
-    serve()
+    if SERVER_MODE == "aio":
+        import aio_server
+        aio_server.main()
+    elif worker_count() > 1:
+        prefork(worker_count())
+    else:
+        serve()
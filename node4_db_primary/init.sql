@@ -4,10 +4,31 @@ CREATE TABLE IF NOT EXISTS drugs (
     name VARCHAR(255) NOT NULL,
     quantity INTEGER NOT NULL DEFAULT 0,
     price FLOAT NOT NULL DEFAULT 0.0,
-    expiry_date VARCHAR(50),
+    expiry_date DATE,
     category VARCHAR(100)
 );
 
+-- Idempotency keys for AdjustStock (purged after IDEMPOTENCY_KEY_TTL_HOURS)
+CREATE TABLE IF NOT EXISTS stock_adjustments (
+    idempotency_key VARCHAR(128) PRIMARY KEY,
+    drug_id INTEGER NOT NULL,
+    delta INTEGER NOT NULL,
+    quantity INTEGER,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_stock_adjustments_created_at ON stock_adjustments (created_at);
+
+-- Keyset pagination / filter indexes
+CREATE INDEX IF NOT EXISTS idx_drugs_quantity_id ON drugs (quantity, id);
+CREATE INDEX IF NOT EXISTS idx_drugs_category_id ON drugs (category, id);
+-- (expiry_date, id) also serves GetExpiringDrugs in index order
+CREATE INDEX IF NOT EXISTS idx_drugs_expiry_date_id ON drugs (expiry_date, id);
+
+-- SearchDrugs: name prefix (btree) and typo-tolerant trigram (GiST) lookups
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_drugs_name_prefix ON drugs ((lower(name) COLLATE "C"), id);
+CREATE INDEX IF NOT EXISTS idx_drugs_name_trgm ON drugs USING gist (lower(name) gist_trgm_ops);
+
 -- Seed sample data
 INSERT INTO drugs (name, quantity, price, expiry_date, category) VALUES
 ('Aspirin', 500, 2.99, '2026-12-31', 'Pain Relief'),
@@ -0,0 +1,3 @@
+#!/bin/bash
+# Allow the db-replica node to stream WAL from this primary
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
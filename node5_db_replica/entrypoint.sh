@@ -0,0 +1,21 @@
+#!/bin/bash
+# Bootstraps a streaming-replication standby of db-primary on first start,
+# then hands over to the stock postgres entrypoint.
+set -e
+
+if [ ! -s "$PGDATA/PG_VERSION" ]; then
+    echo "Waiting for primary at $PRIMARY_HOST:$PRIMARY_PORT..."
+    until pg_isready -h "$PRIMARY_HOST" -p "$PRIMARY_PORT" -U "$POSTGRES_USER" >/dev/null 2>&1; do
+        sleep 1
+    done
+    mkdir -p "$PGDATA"
+    chown postgres:postgres "$PGDATA"
+    chmod 0700 "$PGDATA"
+    # -R writes standby.signal and primary_conninfo for us
+    PGPASSWORD="$POSTGRES_PASSWORD" gosu postgres pg_basebackup \
+        -h "$PRIMARY_HOST" -p "$PRIMARY_PORT" -U "$POSTGRES_USER" \
+        -D "$PGDATA" -X stream -R -P
+    echo "Base backup complete, starting standby"
+fi
+
+exec docker-entrypoint.sh "$@"
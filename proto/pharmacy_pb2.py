@@ -12,35 +12,70 @@ from google.protobuf.internal import builder as _builder
 _sym_db = _symbol_database.Default()
 
 
+from google.protobuf import field_mask_pb2 as google_dot_protobuf_dot_field__mask__pb2
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0epharmacy.proto\x12\x08pharmacy\"h\n\x04\x44rug\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x0c\n\x04name\x18\x02 \x01(\t\x12\x10\n\x08quantity\x18\x03 \x01(\x05\x12\r\n\x05price\x18\x04 \x01(\x02\x12\x13\n\x0b\x65xpiry_date\x18\x05 \x01(\t\x12\x10\n\x08\x63\x61tegory\x18\x06 \x01(\t\"f\n\x0e\x41\x64\x64\x44rugRequest\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x10\n\x08quantity\x18\x02 \x01(\x05\x12\r\n\x05price\x18\x03 \x01(\x02\x12\x13\n\x0b\x65xpiry_date\x18\x04 \x01(\t\x12\x10\n\x08\x63\x61tegory\x18\x05 \x01(\t\"\x1c\n\x0eGetDrugRequest\x12\n\n\x02id\x18\x01 \x01(\x05\"2\n\x12UpdateStockRequest\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x10\n\x08quantity\x18\x02 \x01(\x05\"\x1f\n\x11\x44\x65leteDrugRequest\x12\n\n\x02id\x18\x01 \x01(\x05\"2\n\x0e\x44\x65leteResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\"\x12\n\x10ListDrugsRequest\"$\n\x0fLowStockRequest\x12\x11\n\tthreshold\x18\x01 \x01(\x05\"2\n\x11ListDrugsResponse\x12\x1d\n\x05\x64rugs\x18\x01 \x03(\x0b\x32\x0e.pharmacy.Drug\"N\n\x0c\x44rugResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x1c\n\x04\x64rug\x18\x03 \x01(\x0b\x32\x0e.pharmacy.Drug2\xa2\x03\n\x0fPharmacyService\x12;\n\x07\x41\x64\x64\x44rug\x12\x18.pharmacy.AddDrugRequest\x1a\x16.pharmacy.DrugResponse\x12;\n\x07GetDrug\x12\x18.pharmacy.GetDrugRequest\x1a\x16.pharmacy.DrugResponse\x12\x43\n\x0bUpdateStock\x12\x1c.pharmacy.UpdateStockRequest\x1a\x16.pharmacy.DrugResponse\x12\x43\n\nDeleteDrug\x12\x1b.pharmacy.DeleteDrugRequest\x1a\x18.pharmacy.DeleteResponse\x12\x44\n\tListDrugs\x12\x1a.pharmacy.ListDrugsRequest\x1a\x1b.pharmacy.ListDrugsResponse\x12\x45\n\x0bGetLowStock\x12\x19.pharmacy.LowStockRequest\x1a\x1b.pharmacy.ListDrugsResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0epharmacy.proto\x12\x08pharmacy\x1a google/protobuf/field_mask.proto\"h\n\x04\x44rug\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x0c\n\x04name\x18\x02 \x01(\t\x12\x10\n\x08quantity\x18\x03 \x01(\x05\x12\r\n\x05price\x18\x04 \x01(\x02\x12\x13\n\x0b\x65xpiry_date\x18\x05 \x01(\t\x12\x10\n\x08\x63\x61tegory\x18\x06 \x01(\t\"f\n\x0e\x41\x64\x64\x44rugRequest\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x10\n\x08quantity\x18\x02 \x01(\x05\x12\r\n\x05price\x18\x03 \x01(\x02\x12\x13\n\x0b\x65xpiry_date\x18\x04 \x01(\t\x12\x10\n\x08\x63\x61tegory\x18\x05 \x01(\t\"\x1c\n\x0eGetDrugRequest\x12\n\n\x02id\x18\x01 \x01(\x05\"2\n\x12UpdateStockRequest\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x10\n\x08quantity\x18\x02 \x01(\x05\"H\n\x12\x41\x64justStockRequest\x12\n\n\x02id\x18\x01 \x01(\x05\x12\r\n\x05\x64\x65lta\x18\x02 \x01(\x05\x12\x17\n\x0fidempotency_key\x18\x03 \x01(\t\"\x1f\n\x11\x44\x65leteDrugRequest\x12\n\n\x02id\x18\x01 \x01(\x05\"2\n\x0e\x44\x65leteResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\"\xb4\x01\n\x10ListDrugsRequest\x12\x11\n\tpage_size\x18\x01 \x01(\x05\x12\x12\n\npage_token\x18\x02 \x01(\t\x12\x10\n\x08\x63\x61tegory\x18\x03 \x01(\t\x12\x13\n\x0b\x65xpiry_from\x18\x04 \x01(\t\x12\x11\n\texpiry_to\x18\x05 \x01(\t\x12.\n\nfield_mask\x18\x06 \x01(\x0b\x32\x1a.google.protobuf.FieldMask\x12\x0f\n\x07\x63ompact\x18\x07 \x01(\x08\"i\n\x12StreamDrugsRequest\x12\x12\n\nbatch_size\x18\x01 \x01(\x05\x12.\n\nfield_mask\x18\x02 \x01(\x0b\x32\x1a.google.protobuf.FieldMask\x12\x0f\n\x07\x63ompact\x18\x03 \x01(\x08\"\xc6\x01\n\x0fLowStockRequest\x12\x11\n\tthreshold\x18\x01 \x01(\x05\x12\x11\n\tpage_size\x18\x02 \x01(\x05\x12\x12\n\npage_token\x18\x03 \x01(\t\x12\x10\n\x08\x63\x61tegory\x18\x04 \x01(\t\x12\x13\n\x0b\x65xpiry_from\x18\x05 \x01(\t\x12\x11\n\texpiry_to\x18\x06 \x01(\t\x12.\n\nfield_mask\x18\x07 \x01(\x0b\x32\x1a.google.protobuf.FieldMask\x12\x0f\n\x07\x63ompact\x18\x08 \x01(\x08\"\xbe\x01\n\x14\x45xpiringDrugsRequest\x12\x13\n\x0bwithin_days\x18\x01 \x01(\x05\x12\x11\n\tpage_size\x18\x02 \x01(\x05\x12\x12\n\npage_token\x18\x03 \x01(\t\x12\x10\n\x08\x63\x61tegory\x18\x04 \x01(\t\x12\x17\n\x0finclude_expired\x18\x05 \x01(\x08\x12.\n\nfield_mask\x18\x06 \x01(\x0b\x32\x1a.google.protobuf.FieldMask\x12\x0f\n\x07\x63ompact\x18\x07 \x01(\x08\"x\n\x0b\x43ompactDrug\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x0c\n\x04name\x18\x02 \x01(\t\x12\x10\n\x08quantity\x18\x03 \x01(\x05\x12\x13\n\x0bprice_cents\x18\x04 \x01(\x03\x12\x13\n\x0b\x65xpiry_days\x18\x05 \x01(\x05\x12\x13\n\x0b\x63\x61tegory_id\x18\x06 \x01(\x05\"\xed\x01\n\x11ListDrugsResponse\x12\x1d\n\x05\x64rugs\x18\x01 \x03(\x0b\x32\x0e.pharmacy.Drug\x12\x17\n\x0fnext_page_token\x18\x02 \x01(\t\x12,\n\rcompact_drugs\x18\x03 \x03(\x0b\x32\x15.pharmacy.CompactDrug\x12?\n\ncategories\x18\x04 \x03(\x0b\x32+.pharmacy.ListDrugsResponse.CategoriesEntry\x1a\x31\n\x0f\x43\x61tegoriesEntry\x12\x0b\n\x03key\x18\x01 \x01(\x05\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\"2\n\x12SearchDrugsRequest\x12\r\n\x05query\x18\x01 \x01(\t\x12\r\n\x05limit\x18\x02 \x01(\x05\"H\n\tSearchHit\x12\x1c\n\x04\x64rug\x18\x01 \x01(\x0b\x32\x0e.pharmacy.Drug\x12\x0e\n\x06prefix\x18\x02 \x01(\x08\x12\r\n\x05score\x18\x03 \x01(\x02\"8\n\x13SearchDrugsResponse\x12!\n\x04hits\x18\x01 \x03(\x0b\x32\x13.pharmacy.SearchHit\"N\n\x0c\x44rugResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x1c\n\x04\x64rug\x18\x03 \x01(\x0b\x32\x0e.pharmacy.Drug\"?\n\x14\x42\x61tchAddDrugsRequest\x12\'\n\x05\x64rugs\x18\x01 \x03(\x0b\x32\x18.pharmacy.AddDrugRequest\"H\n\x17\x42\x61tchUpdateStockRequest\x12-\n\x07updates\x18\x01 \x03(\x0b\x32\x1c.pharmacy.UpdateStockRequest\"^\n\x11\x42\x61tchDrugResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\'\n\x07results\x18\x03 \x03(\x0b\x32\x16.pharmacy.DrugResponse\";\n\x10ImportDrugsChunk\x12\'\n\x05\x64rugs\x18\x01 \x03(\x0b\x32\x18.pharmacy.AddDrugRequest\"+\n\x0bImportError\x12\x0b\n\x03row\x18\x01 \x01(\x03\x12\x0f\n\x07message\x18\x02 \x01(\t\"\xa3\x01\n\x13ImportDrugsResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x15\n\rrows_received\x18\x03 \x01(\x03\x12\x15\n\rrows_imported\x18\x04 \x01(\x03\x12\x15\n\rrows_rejected\x18\x05 \x01(\x03\x12%\n\x06\x65rrors\x18\x06 \x03(\x0b\x32\x15.pharmacy.ImportError\"6\n\x0eProfileRequest\x12\x0f\n\x07seconds\x18\x01 \x01(\x01\x12\x13\n\x0binterval_ms\x18\x02 \x01(\x05\"^\n\x0fProfileResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x0f\n\x07samples\x18\x03 \x01(\x03\x12\x18\n\x10\x63ollapsed_stacks\x18\x04 \x01(\t2\xfe\x07\n\x0fPharmacyService\x12;\n\x07\x41\x64\x64\x44rug\x12\x18.pharmacy.AddDrugRequest\x1a\x16.pharmacy.DrugResponse\x12;\n\x07GetDrug\x12\x18.pharmacy.GetDrugRequest\x1a\x16.pharmacy.DrugResponse\x12\x43\n\x0bUpdateStock\x12\x1c.pharmacy.UpdateStockRequest\x1a\x16.pharmacy.DrugResponse\x12\x43\n\x0b\x41\x64justStock\x12\x1c.pharmacy.AdjustStockRequest\x1a\x16.pharmacy.DrugResponse\x12\x43\n\nDeleteDrug\x12\x1b.pharmacy.DeleteDrugRequest\x1a\x18.pharmacy.DeleteResponse\x12\x44\n\tListDrugs\x12\x1a.pharmacy.ListDrugsRequest\x1a\x1b.pharmacy.ListDrugsResponse\x12\x45\n\x0bGetLowStock\x12\x19.pharmacy.LowStockRequest\x1a\x1b.pharmacy.ListDrugsResponse\x12O\n\x10GetExpiringDrugs\x12\x1e.pharmacy.ExpiringDrugsRequest\x1a\x1b.pharmacy.ListDrugsResponse\x12J\n\x0bStreamDrugs\x12\x1c.pharmacy.StreamDrugsRequest\x1a\x1b.pharmacy.ListDrugsResponse0\x01\x12J\n\x0bSearchDrugs\x12\x1c.pharmacy.SearchDrugsRequest\x1a\x1d.pharmacy.SearchDrugsResponse\x12L\n\rBatchAddDrugs\x12\x1e.pharmacy.BatchAddDrugsRequest\x1a\x1b.pharmacy.BatchDrugResponse\x12R\n\x10\x42\x61tchUpdateStock\x12!.pharmacy.BatchUpdateStockRequest\x1a\x1b.pharmacy.BatchDrugResponse\x12J\n\x0bImportDrugs\x12\x1a.pharmacy.ImportDrugsChunk\x1a\x1d.pharmacy.ImportDrugsResponse(\x01\x12>\n\x07Profile\x12\x18.pharmacy.ProfileRequest\x1a\x19.pharmacy.ProfileResponseb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'pharmacy_pb2', _globals)
 if _descriptor._USE_C_DESCRIPTORS == False:
   DESCRIPTOR._options = None
-  _globals['_DRUG']._serialized_start=28
-  _globals['_DRUG']._serialized_end=132
-  _globals['_ADDDRUGREQUEST']._serialized_start=134
-  _globals['_ADDDRUGREQUEST']._serialized_end=236
-  _globals['_GETDRUGREQUEST']._serialized_start=238
-  _globals['_GETDRUGREQUEST']._serialized_end=266
-  _globals['_UPDATESTOCKREQUEST']._serialized_start=268
-  _globals['_UPDATESTOCKREQUEST']._serialized_end=318
-  _globals['_DELETEDRUGREQUEST']._serialized_start=320
-  _globals['_DELETEDRUGREQUEST']._serialized_end=351
-  _globals['_DELETERESPONSE']._serialized_start=353
-  _globals['_DELETERESPONSE']._serialized_end=403
-  _globals['_LISTDRUGSREQUEST']._serialized_start=405
-  _globals['_LISTDRUGSREQUEST']._serialized_end=423
-  _globals['_LOWSTOCKREQUEST']._serialized_start=425
-  _globals['_LOWSTOCKREQUEST']._serialized_end=461
-  _globals['_LISTDRUGSRESPONSE']._serialized_start=463
-  _globals['_LISTDRUGSRESPONSE']._serialized_end=513
-  _globals['_DRUGRESPONSE']._serialized_start=515
-  _globals['_DRUGRESPONSE']._serialized_end=593
-  _globals['_PHARMACYSERVICE']._serialized_start=596
-  _globals['_PHARMACYSERVICE']._serialized_end=1014
+  _globals['_LISTDRUGSRESPONSE_CATEGORIESENTRY']._options = None
+  _globals['_LISTDRUGSRESPONSE_CATEGORIESENTRY']._serialized_options = b'8\001'
+  _globals['_DRUG']._serialized_start=62
+  _globals['_DRUG']._serialized_end=166
+  _globals['_ADDDRUGREQUEST']._serialized_start=168
+  _globals['_ADDDRUGREQUEST']._serialized_end=270
+  _globals['_GETDRUGREQUEST']._serialized_start=272
+  _globals['_GETDRUGREQUEST']._serialized_end=300
+  _globals['_UPDATESTOCKREQUEST']._serialized_start=302
+  _globals['_UPDATESTOCKREQUEST']._serialized_end=352
+  _globals['_ADJUSTSTOCKREQUEST']._serialized_start=354
+  _globals['_ADJUSTSTOCKREQUEST']._serialized_end=426
+  _globals['_DELETEDRUGREQUEST']._serialized_start=428
+  _globals['_DELETEDRUGREQUEST']._serialized_end=459
+  _globals['_DELETERESPONSE']._serialized_start=461
+  _globals['_DELETERESPONSE']._serialized_end=511
+  _globals['_LISTDRUGSREQUEST']._serialized_start=514
+  _globals['_LISTDRUGSREQUEST']._serialized_end=694
+  _globals['_STREAMDRUGSREQUEST']._serialized_start=696
+  _globals['_STREAMDRUGSREQUEST']._serialized_end=801
+  _globals['_LOWSTOCKREQUEST']._serialized_start=804
+  _globals['_LOWSTOCKREQUEST']._serialized_end=1002
+  _globals['_EXPIRINGDRUGSREQUEST']._serialized_start=1005
+  _globals['_EXPIRINGDRUGSREQUEST']._serialized_end=1195
+  _globals['_COMPACTDRUG']._serialized_start=1197
+  _globals['_COMPACTDRUG']._serialized_end=1317
+  _globals['_LISTDRUGSRESPONSE']._serialized_start=1320
+  _globals['_LISTDRUGSRESPONSE']._serialized_end=1557
+  _globals['_LISTDRUGSRESPONSE_CATEGORIESENTRY']._serialized_start=1508
+  _globals['_LISTDRUGSRESPONSE_CATEGORIESENTRY']._serialized_end=1557
+  _globals['_SEARCHDRUGSREQUEST']._serialized_start=1559
+  _globals['_SEARCHDRUGSREQUEST']._serialized_end=1609
+  _globals['_SEARCHHIT']._serialized_start=1611
+  _globals['_SEARCHHIT']._serialized_end=1683
+  _globals['_SEARCHDRUGSRESPONSE']._serialized_start=1685
+  _globals['_SEARCHDRUGSRESPONSE']._serialized_end=1741
+  _globals['_DRUGRESPONSE']._serialized_start=1743
+  _globals['_DRUGRESPONSE']._serialized_end=1821
+  _globals['_BATCHADDDRUGSREQUEST']._serialized_start=1823
+  _globals['_BATCHADDDRUGSREQUEST']._serialized_end=1886
+  _globals['_BATCHUPDATESTOCKREQUEST']._serialized_start=1888
+  _globals['_BATCHUPDATESTOCKREQUEST']._serialized_end=1960
+  _globals['_BATCHDRUGRESPONSE']._serialized_start=1962
+  _globals['_BATCHDRUGRESPONSE']._serialized_end=2056
+  _globals['_IMPORTDRUGSCHUNK']._serialized_start=2058
+  _globals['_IMPORTDRUGSCHUNK']._serialized_end=2117
+  _globals['_IMPORTERROR']._serialized_start=2119
+  _globals['_IMPORTERROR']._serialized_end=2162
+  _globals['_IMPORTDRUGSRESPONSE']._serialized_start=2165
+  _globals['_IMPORTDRUGSRESPONSE']._serialized_end=2328
+  _globals['_PROFILEREQUEST']._serialized_start=2330
+  _globals['_PROFILEREQUEST']._serialized_end=2384
+  _globals['_PROFILERESPONSE']._serialized_start=2386
+  _globals['_PROFILERESPONSE']._serialized_end=2480
+  _globals['_PHARMACYSERVICE']._serialized_start=2483
+  _globals['_PHARMACYSERVICE']._serialized_end=3505
 # @@protoc_insertion_point(module_scope)
@@ -29,6 +29,11 @@ class PharmacyServiceStub(object):
                 request_serializer=pharmacy__pb2.UpdateStockRequest.SerializeToString,
                 response_deserializer=pharmacy__pb2.DrugResponse.FromString,
                 )
+        self.AdjustStock = channel.unary_unary(
+                '/pharmacy.PharmacyService/AdjustStock',
+                request_serializer=pharmacy__pb2.AdjustStockRequest.SerializeToString,
+                response_deserializer=pharmacy__pb2.DrugResponse.FromString,
+                )
         self.DeleteDrug = channel.unary_unary(
                 '/pharmacy.PharmacyService/DeleteDrug',
                 request_serializer=pharmacy__pb2.DeleteDrugRequest.SerializeToString,
@@ -44,6 +49,41 @@ class PharmacyServiceStub(object):
                 request_serializer=pharmacy__pb2.LowStockRequest.SerializeToString,
                 response_deserializer=pharmacy__pb2.ListDrugsResponse.FromString,
                 )
+        self.GetExpiringDrugs = channel.unary_unary(
+                '/pharmacy.PharmacyService/GetExpiringDrugs',
+                request_serializer=pharmacy__pb2.ExpiringDrugsRequest.SerializeToString,
+                response_deserializer=pharmacy__pb2.ListDrugsResponse.FromString,
+                )
+        self.StreamDrugs = channel.unary_stream(
+                '/pharmacy.PharmacyService/StreamDrugs',
+                request_serializer=pharmacy__pb2.StreamDrugsRequest.SerializeToString,
+                response_deserializer=pharmacy__pb2.ListDrugsResponse.FromString,
+                )
+        self.SearchDrugs = channel.unary_unary(
+                '/pharmacy.PharmacyService/SearchDrugs',
+                request_serializer=pharmacy__pb2.SearchDrugsRequest.SerializeToString,
+                response_deserializer=pharmacy__pb2.SearchDrugsResponse.FromString,
+                )
+        self.BatchAddDrugs = channel.unary_unary(
+                '/pharmacy.PharmacyService/BatchAddDrugs',
+                request_serializer=pharmacy__pb2.BatchAddDrugsRequest.SerializeToString,
+                response_deserializer=pharmacy__pb2.BatchDrugResponse.FromString,
+                )
+        self.BatchUpdateStock = channel.unary_unary(
+                '/pharmacy.PharmacyService/BatchUpdateStock',
+                request_serializer=pharmacy__pb2.BatchUpdateStockRequest.SerializeToString,
+                response_deserializer=pharmacy__pb2.BatchDrugResponse.FromString,
+                )
+        self.ImportDrugs = channel.stream_unary(
+                '/pharmacy.PharmacyService/ImportDrugs',
+                request_serializer=pharmacy__pb2.ImportDrugsChunk.SerializeToString,
+                response_deserializer=pharmacy__pb2.ImportDrugsResponse.FromString,
+                )
+        self.Profile = channel.unary_unary(
+                '/pharmacy.PharmacyService/Profile',
+                request_serializer=pharmacy__pb2.ProfileRequest.SerializeToString,
+                response_deserializer=pharmacy__pb2.ProfileResponse.FromString,
+                )
 
 
 class PharmacyServiceServicer(object):
@@ -67,6 +107,13 @@ class PharmacyServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def AdjustStock(self, request, context):
+        """Applies a signed delta atomically; fails rather than going below zero.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def DeleteDrug(self, request, context):
         """Missing associated documentation comment in .proto file."""
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
@@ -74,7 +121,10 @@ class PharmacyServiceServicer(object):
         raise NotImplementedError('Method not implemented!')
 
     def ListDrugs(self, request, context):
-        """Missing associated documentation comment in .proto file."""
+        """ListDrugs, GetLowStock, GetExpiringDrugs and StreamDrugs accept a
+        field_mask (Drug field names; empty = all fields) and compact=true,
+        which returns compact_drugs instead of drugs.
+        """
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
@@ -85,6 +135,59 @@ class PharmacyServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def GetExpiringDrugs(self, request, context):
+        """Drugs whose expiry_date falls within the next within_days days (today
+        included), soonest first, paged like ListDrugs.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def StreamDrugs(self, request, context):
+        """Same rows as ListDrugs, read through a server-side cursor and sent in
+        batches of at most batch_size drugs.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def SearchDrugs(self, request, context):
+        """Name lookup: prefix matches first, then typo-tolerant (trigram) matches,
+        best first, at most limit hits.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def BatchAddDrugs(self, request, context):
+        """Apply many items in one transaction; results[i] is the outcome of item i.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def BatchUpdateStock(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def ImportDrugs(self, request_iterator, context):
+        """Bulk catalog load: rows are streamed in and written with COPY FROM STDIN
+        in bounded chunks, all inside one transaction.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def Profile(self, request, context):
+        """Admin: samples the server's Python stacks for `seconds` and returns them
+        collapsed (flamegraph input). Needs x-admin-token metadata = ADMIN_TOKEN.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_PharmacyServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -103,6 +206,11 @@ def add_PharmacyServiceServicer_to_server(servicer, server):
                     request_deserializer=pharmacy__pb2.UpdateStockRequest.FromString,
                     response_serializer=pharmacy__pb2.DrugResponse.SerializeToString,
             ),
+            'AdjustStock': grpc.unary_unary_rpc_method_handler(
+                    servicer.AdjustStock,
+                    request_deserializer=pharmacy__pb2.AdjustStockRequest.FromString,
+                    response_serializer=pharmacy__pb2.DrugResponse.SerializeToString,
+            ),
             'DeleteDrug': grpc.unary_unary_rpc_method_handler(
                     servicer.DeleteDrug,
                     request_deserializer=pharmacy__pb2.DeleteDrugRequest.FromString,
@@ -118,6 +226,41 @@ def add_PharmacyServiceServicer_to_server(servicer, server):
                     request_deserializer=pharmacy__pb2.LowStockRequest.FromString,
                     response_serializer=pharmacy__pb2.ListDrugsResponse.SerializeToString,
             ),
+            'GetExpiringDrugs': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetExpiringDrugs,
+                    request_deserializer=pharmacy__pb2.ExpiringDrugsRequest.FromString,
+                    response_serializer=pharmacy__pb2.ListDrugsResponse.SerializeToString,
+            ),
+            'StreamDrugs': grpc.unary_stream_rpc_method_handler(
+                    servicer.StreamDrugs,
+                    request_deserializer=pharmacy__pb2.StreamDrugsRequest.FromString,
+                    response_serializer=pharmacy__pb2.ListDrugsResponse.SerializeToString,
+            ),
+            'SearchDrugs': grpc.unary_unary_rpc_method_handler(
+                    servicer.SearchDrugs,
+                    request_deserializer=pharmacy__pb2.SearchDrugsRequest.FromString,
+                    response_serializer=pharmacy__pb2.SearchDrugsResponse.SerializeToString,
+            ),
+            'BatchAddDrugs': grpc.unary_unary_rpc_method_handler(
+                    servicer.BatchAddDrugs,
+                    request_deserializer=pharmacy__pb2.BatchAddDrugsRequest.FromString,
+                    response_serializer=pharmacy__pb2.BatchDrugResponse.SerializeToString,
+            ),
+            'BatchUpdateStock': grpc.unary_unary_rpc_method_handler(
+                    servicer.BatchUpdateStock,
+                    request_deserializer=pharmacy__pb2.BatchUpdateStockRequest.FromString,
+                    response_serializer=pharmacy__pb2.BatchDrugResponse.SerializeToString,
+            ),
+            'ImportDrugs': grpc.stream_unary_rpc_method_handler(
+                    servicer.ImportDrugs,
+                    request_deserializer=pharmacy__pb2.ImportDrugsChunk.FromString,
+                    response_serializer=pharmacy__pb2.ImportDrugsResponse.SerializeToString,
+            ),
+            'Profile': grpc.unary_unary_rpc_method_handler(
+                    servicer.Profile,
+                    request_deserializer=pharmacy__pb2.ProfileRequest.FromString,
+                    response_serializer=pharmacy__pb2.ProfileResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'pharmacy.PharmacyService', rpc_method_handlers)
@@ -179,6 +322,23 @@ class PharmacyService(object):
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
 
+    @staticmethod
+    def AdjustStock(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/pharmacy.PharmacyService/AdjustStock',
+            pharmacy__pb2.AdjustStockRequest.SerializeToString,
+            pharmacy__pb2.DrugResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
     @staticmethod
     def DeleteDrug(request,
             target,
@@ -229,3 +389,122 @@ class PharmacyService(object):
             pharmacy__pb2.ListDrugsResponse.FromString,
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def GetExpiringDrugs(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/pharmacy.PharmacyService/GetExpiringDrugs',
+            pharmacy__pb2.ExpiringDrugsRequest.SerializeToString,
+            pharmacy__pb2.ListDrugsResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def StreamDrugs(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(request, target, '/pharmacy.PharmacyService/StreamDrugs',
+            pharmacy__pb2.StreamDrugsRequest.SerializeToString,
+            pharmacy__pb2.ListDrugsResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def SearchDrugs(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/pharmacy.PharmacyService/SearchDrugs',
+            pharmacy__pb2.SearchDrugsRequest.SerializeToString,
+            pharmacy__pb2.SearchDrugsResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def BatchAddDrugs(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/pharmacy.PharmacyService/BatchAddDrugs',
+            pharmacy__pb2.BatchAddDrugsRequest.SerializeToString,
+            pharmacy__pb2.BatchDrugResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def BatchUpdateStock(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/pharmacy.PharmacyService/BatchUpdateStock',
+            pharmacy__pb2.BatchUpdateStockRequest.SerializeToString,
+            pharmacy__pb2.BatchDrugResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def ImportDrugs(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_unary(request_iterator, target, '/pharmacy.PharmacyService/ImportDrugs',
+            pharmacy__pb2.ImportDrugsChunk.SerializeToString,
+            pharmacy__pb2.ImportDrugsResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def Profile(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/pharmacy.PharmacyService/Profile',
+            pharmacy__pb2.ProfileRequest.SerializeToString,
+            pharmacy__pb2.ProfileResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
@@ -0,0 +1,6 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in ("proto", "common", "node2_api_server"):
+    sys.path.insert(0, os.path.join(ROOT, path))
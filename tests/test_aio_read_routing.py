@@ -0,0 +1,98 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from psycopg_pool import PoolTimeout
+
+import aio_server
+import server
+
+class FakeCursor:
+    def __init__(self, value):
+        self.value = value
+
+    async def fetchone(self):
+        return (self.value,)
+
+class FakeConnection:
+    def __init__(self, name, replayed=True):
+        self.name = name
+        self.replayed = replayed
+        self.queries = []
+
+    async def execute(self, sql, params=None):
+        self.queries.append(sql)
+        return FakeCursor(self.replayed)
+
+    async def rollback(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+class FakePool:
+    def __init__(self, conn, fail=False):
+        self.conn = conn
+        self.fail = fail
+        self.returned = 0
+
+    async def getconn(self):
+        if self.fail:
+            raise PoolTimeout("couldn't get a connection after 5.00 sec")
+        return self.conn
+
+    async def putconn(self, conn):
+        self.returned += 1
+
+    @asynccontextmanager
+    async def connection(self):
+        yield self.conn
+
+class Context:
+    def __init__(self, min_lsn=None):
+        self.metadata = ((server.MIN_LSN_METADATA_KEY, min_lsn),) if min_lsn else ()
+
+    def invocation_metadata(self):
+        return self.metadata
+
+def replica_state(replay_lsn="0/10"):
+    state = server.ReplicaState(500)
+    state.update((True, True, replay_lsn, 1.0))
+    return state
+
+def route(replica, context, state):
+    primary = FakePool(FakeConnection("primary"))
+    servicer = aio_server.AsyncPharmacyServicer(primary, replica, state)
+
+    async def read():
+        async with servicer._read_connection(context) as conn:
+            return conn.name
+
+    return asyncio.run(read())
+
+def test_caught_up_replica_serves_without_asking():
+    replica = FakePool(FakeConnection("replica"))
+    assert route(replica, Context("0/10"), replica_state()) == "replica"
+    assert replica.conn.queries == []
+    assert replica.returned == 1
+
+def test_replica_is_asked_when_monitor_view_is_behind():
+    replica = FakePool(FakeConnection("replica", replayed=True))
+    assert route(replica, Context("0/20"), replica_state("0/10")) == "replica"
+    assert replica.conn.queries == [server.SQL_REPLAYED_LSN]
+
+def test_read_goes_to_primary_when_replica_has_not_replayed():
+    replica = FakePool(FakeConnection("replica", replayed=False))
+    state = replica_state("0/10")
+    assert route(replica, Context("0/20"), state) == "primary"
+    assert replica.returned == 1
+    assert state.healthy
+
+def test_checkout_failure_falls_back_and_marks_replica_down():
+    replica = FakePool(FakeConnection("replica"), fail=True)
+    state = replica_state()
+    assert route(replica, Context(), state) == "primary"
+    assert not state.healthy
+    assert state.stats()["reads"] == {"replica": 0, "primary": 1}
@@ -0,0 +1,125 @@
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+import pytest
+
+import server
+
+class FakeConnection:
+    """Enough of a psycopg2 connection for ConnectionPool."""
+
+    def __init__(self, alive=True):
+        self.closed = 0
+        self.alive = alive
+        self.info = self
+
+    @property
+    def transaction_status(self):
+        return psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql):
+        if not self.alive:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+@pytest.fixture
+def connects(monkeypatch):
+    opened = []
+    def connect(**dsn):
+        conn = FakeConnection()
+        opened.append(conn)
+        return conn
+    monkeypatch.setattr(psycopg2, "connect", connect)
+    return opened
+
+def test_steady_load_reuses_connections(connects):
+    pool = server.ConnectionPool(5, 50, timeout=5, check_idle=30)
+
+    def worker():
+        for _ in range(200):
+            with pool.connection():
+                time.sleep(0.001)
+            time.sleep(0.003)
+
+    threads = [threading.Thread(target=worker) for _ in range(50)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats = pool.stats()
+    assert stats["checkouts"] == 10000
+    assert len(connects) <= 50
+    assert stats["open"] == stats["idle"] == len(connects)
+    assert stats["discarded"] == 0
+
+def test_minconn_zero_keeps_returned_connections(connects):
+    pool = server.ConnectionPool(0, 10, timeout=5, check_idle=30)
+    for _ in range(100):
+        with pool.connection():
+            pass
+    assert len(connects) == 1
+    assert pool.stats()["idle"] == 1
+
+def test_dead_idle_connections_are_all_replaced(connects):
+    pool = server.ConnectionPool(3, 3, timeout=5, check_idle=0)
+    for conn in connects:
+        conn.alive = False
+    conn = pool.getconn()
+    assert conn.alive and len(connects) == 4
+    stats = pool.stats()
+    assert stats["discarded"] == 3 and stats["open"] == 1
+    pool.putconn(conn)
+
+def test_broken_connection_is_discarded(connects):
+    pool = server.ConnectionPool(1, 2, timeout=5, check_idle=30)
+    with pytest.raises(psycopg2.OperationalError):
+        with pool.connection():
+            raise psycopg2.OperationalError("lost")
+    assert connects[0].closed
+    assert pool.stats()["open"] == 0
+    with pool.connection() as conn:
+        assert conn is connects[1]
+
+def test_checkout_times_out_when_exhausted(connects):
+    pool = server.ConnectionPool(0, 1, timeout=0.05, check_idle=30)
+    conn = pool.getconn()
+    with pytest.raises(server.PoolTimeout):
+        pool.getconn()
+    pool.putconn(conn)
+    assert pool.stats()["timeouts"] == 1
+    pool.putconn(pool.getconn())
+
+def test_closeall_closes_idle_and_returned(connects):
+    pool = server.ConnectionPool(2, 2, timeout=5, check_idle=30)
+    conn = pool.getconn()
+    pool.closeall()
+    pool.putconn(conn)
+    assert all(c.closed for c in connects)
+    assert pool.stats()["open"] == 0
+
+def test_replica_pool_reuses_on_demand_connections(connects):
+    # init_pool builds the replica pool with minconn=0
+    pool = server.ConnectionPool(0, 50, timeout=5, check_idle=30, name="replica")
+
+    def worker():
+        for _ in range(100):
+            with pool.connection():
+                time.sleep(0.001)
+
+    threads = [threading.Thread(target=worker) for _ in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert pool.stats()["checkouts"] == 2000
+    assert len(connects) <= 20
@@ -0,0 +1,94 @@
+import pharmacy_pb2
+import server
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def drug(drug_id, quantity=10):
+    return pharmacy_pb2.Drug(id=drug_id, name=f"drug {drug_id}", quantity=quantity)
+
+def cache(max_entries=100, ttl=30.0, quarantine=0.0, clock=None):
+    return server.DrugCache(max_entries, ttl, quarantine, clock=clock or Clock())
+
+def test_fill_then_hit():
+    c = cache()
+    c.put(1, drug(1), c.begin())
+    assert c.get(1).name == "drug 1"
+    assert c.get(2) is None
+    assert (c.hits, c.misses) == (1, 1)
+
+def test_entry_expires_after_ttl():
+    clock = Clock()
+    c = cache(ttl=30.0, clock=clock)
+    c.put(1, drug(1), c.begin())
+    clock.now += 29.9
+    assert c.get(1) is not None
+    clock.now += 0.1
+    assert c.get(1) is None
+    assert c.expirations == 1
+
+def test_least_recently_used_is_evicted():
+    c = cache(max_entries=2)
+    for i in (1, 2):
+        c.put(i, drug(i), c.begin())
+    c.get(1)
+    c.put(3, drug(3), c.begin())
+    assert c.get(2) is None
+    assert c.get(1) is not None and c.get(3) is not None
+    assert c.evictions == 1
+
+def test_fill_from_read_that_started_before_invalidation_is_refused():
+    c = cache()
+    token = c.begin()
+    # A write commits and invalidates while the read is in flight
+    c.invalidate([1])
+    c.put(1, drug(1, quantity=10), token)
+    assert c.get(1) is None
+    c.put(1, drug(1, quantity=9), c.begin())
+    assert c.get(1).quantity == 9
+
+def test_invalidation_of_other_ids_does_not_block_fill():
+    c = cache()
+    token = c.begin()
+    c.invalidate([2])
+    c.put(1, drug(1), token)
+    assert c.get(1) is not None
+
+def test_invalidate_drops_entry():
+    c = cache()
+    c.put(1, drug(1), c.begin())
+    c.invalidate([1])
+    assert c.get(1) is None
+    assert c.invalidations == 1
+
+def test_quarantine_refuses_fills_shortly_after_write():
+    # A lagging replica may still return the pre-write row for a while
+    clock = Clock()
+    c = cache(quarantine=1.5, clock=clock)
+    c.invalidate([1])
+    clock.now += 1.0
+    c.put(1, drug(1), c.begin())
+    assert c.get(1) is None
+    clock.now += 0.5
+    c.put(1, drug(1), c.begin())
+    assert c.get(1) is not None
+
+def test_clear_refuses_fills_from_earlier_reads():
+    c = cache()
+    c.put(1, drug(1), c.begin())
+    token = c.begin()
+    c.clear()
+    assert c.get(1) is None
+    c.put(2, drug(2), token)
+    assert c.get(2) is None
+    c.put(2, drug(2), c.begin())
+    assert c.get(2) is not None
+
+def test_tombstones_are_bounded():
+    c = cache(max_entries=2)
+    c.invalidate([1, 2, 3])
+    assert list(c._tombstones) == [2, 3]
@@ -0,0 +1,121 @@
+import threading
+import time
+
+import pharmacy_pb2
+import server
+
+class Clock:
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def ok(message):
+    return pharmacy_pb2.DrugResponse(success=True, message=message)
+
+def stock(drug_id, quantity=1):
+    return pharmacy_pb2.UpdateStockRequest(id=drug_id, quantity=quantity)
+
+def committer(write_one=None, write_batch=None, window=60.0, max_batch=8, key=lambda r: r.id, clock=None):
+    return server.GroupCommitter(
+        "UpdateStock",
+        write_one or (lambda r: (ok(f"one {r.id}"), "0/1")),
+        write_batch or (lambda rs: ([ok(f"batch {r.id}") for r in rs], "0/2")),
+        window, max_batch, key=key, clock=clock or Clock())
+
+def enqueue(gc, *requests, queued=100.0):
+    pending = [server.PendingWrite(r, queued) for r in requests]
+    for p in pending:
+        gc._queue.put(p)
+    return pending
+
+def ids(batch):
+    return [p.request.id for p in batch]
+
+def test_duplicate_key_closes_batch_and_opens_next():
+    gc = committer(clock=Clock(now=200.0))
+    enqueue(gc, stock(1), stock(2), stock(1), stock(3))
+    assert ids(gc._collect()) == [1, 2]
+    # The carried-over write leads the next batch, ahead of what queued after it
+    assert ids(gc._collect()) == [1, 3]
+
+def test_no_key_allows_repeats():
+    gc = committer(key=None, clock=Clock(now=200.0))
+    enqueue(gc, stock(1), stock(1), stock(1))
+    assert ids(gc._collect()) == [1, 1, 1]
+
+def test_window_runs_from_oldest_write():
+    # Window already over: take what has queued and don't wait for more,
+    # even though the window is a minute long.
+    gc = committer(window=60.0, clock=Clock(now=160.0))
+    enqueue(gc, stock(1), stock(2), queued=100.0)
+    start = time.monotonic()
+    assert ids(gc._collect()) == [1, 2]
+    assert time.monotonic() - start < 1.0
+
+def test_batch_stops_at_max_batch():
+    gc = committer(max_batch=3, clock=Clock(now=200.0))
+    enqueue(gc, *(stock(i) for i in range(5)))
+    assert ids(gc._collect()) == [0, 1, 2]
+    assert ids(gc._collect()) == [3, 4]
+
+def test_waits_within_window_for_more_writes():
+    clock = Clock()
+    gc = committer(window=60.0, max_batch=2, clock=clock)
+    enqueue(gc, stock(1))
+    later = threading.Timer(0.05, lambda: enqueue(gc, stock(2)))
+    later.start()
+    assert ids(gc._collect()) == [1, 2]
+    later.join()
+
+def test_single_write_uses_write_one():
+    gc = committer()
+    batch = enqueue(gc, stock(7))
+    assert [r.message for r, _ in gc._flush(batch)] == ["one 7"]
+
+def test_batch_result_per_caller():
+    gc = committer()
+    results = gc._flush(enqueue(gc, stock(1), stock(2)))
+    assert [(r.message, lsn) for r, lsn in results] == [("batch 1", "0/2"), ("batch 2", "0/2")]
+
+def test_failed_batch_falls_back_to_one_write_each():
+    def write_batch(requests):
+        raise RuntimeError("check constraint violated")
+
+    def write_one(request):
+        if request.quantity < 0:
+            raise ValueError("negative quantity")
+        return ok(f"one {request.id}"), f"0/{request.id}"
+
+    gc = committer(write_one=write_one, write_batch=write_batch)
+    results = gc._flush(enqueue(gc, stock(1), stock(2, -1), stock(3)))
+    assert [(r.success, r.message, lsn) for r, lsn in results] == [
+        (True, "one 1", "0/1"),
+        (False, "negative quantity", None),
+        (True, "one 3", "0/3"),
+    ]
+
+def test_submit_end_to_end():
+    batches = []
+
+    def write_batch(requests):
+        batches.append([r.id for r in requests])
+        return [ok(f"batch {r.id}") for r in requests], "0/9"
+
+    gc = committer(write_batch=write_batch, window=0.05, clock=time.monotonic).start()
+    results = {}
+
+    def call(i):
+        results[i] = gc.submit(stock(i % 3))
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(results) == 6
+    for i, (response, lsn) in results.items():
+        assert response.success and response.message.endswith(str(i % 3))
+    # No batch ever holds the same drug twice
+    assert all(len(b) == len(set(b)) for b in batches)
@@ -0,0 +1,42 @@
+import base64
+
+import pytest
+
+import server
+
+def token(text):
+    return base64.urlsafe_b64encode(text.encode()).decode()
+
+def test_round_trip():
+    assert server.decode_page_token(server.encode_page_token(5, 42), 2) == [5, 42]
+
+@pytest.mark.parametrize("bad", ["not base64!", token("1,x"), token(""), token("1.5")])
+def test_garbage_is_invalid(bad):
+    with pytest.raises(ValueError, match="Invalid page_token"):
+        server.decode_page_token(bad, 1)
+
+def test_wrong_key_length_is_invalid():
+    with pytest.raises(ValueError, match="Invalid page_token"):
+        server.decode_page_token(server.encode_page_token(1, 2, 3), 2)
+
+def test_dates_encode_as_days_since_epoch():
+    day = server.date(2026, 10, 18)
+    (days,) = server.decode_page_token(server.encode_page_token(day), 1)
+    assert server.page_key_date(days) == day
+
+@pytest.mark.parametrize("days", [2 ** 31 - 1, -(2 ** 31)])
+def test_out_of_range_date_is_invalid(days):
+    with pytest.raises(ValueError, match="Invalid page_token"):
+        server.page_key_date(days)
+
+def test_expiring_query_rejects_crafted_token():
+    request = server.pharmacy_pb2.ExpiringDrugsRequest(within_days=30, page_token=token("999999999,1"))
+    with pytest.raises(ValueError, match="Invalid page_token"):
+        server.build_expiring_query(request)
+
+def test_expiring_query_bounds_within_days():
+    today = server.date(2026, 10, 18)
+    request = server.pharmacy_pb2.ExpiringDrugsRequest(within_days=server.MAX_EXPIRING_DAYS)
+    assert server.build_expiring_query(request, today).params[0] == today + server.timedelta(days=36500)
+    with pytest.raises(ValueError, match="at most"):
+        server.build_expiring_query(server.pharmacy_pb2.ExpiringDrugsRequest(within_days=2 ** 31 - 1), today)
@@ -0,0 +1,82 @@
+import psycopg2.errors
+import psycopg2.extensions
+import pytest
+
+import server
+
+def test_placeholders_are_numbered_in_order():
+    statement = server.PreparedStatement("adjust", "UPDATE t SET q = q + %s WHERE id=%s AND q + %s >= 0")
+    assert statement.prepare_sql == "PREPARE adjust AS UPDATE t SET q = q + $1 WHERE id=$2 AND q + $3 >= 0"
+    assert statement.execute_sql == "EXECUTE adjust (%s, %s, %s)"
+
+def test_escaped_percent_becomes_literal():
+    statement = server.PreparedStatement("search", "SELECT 1 FROM t WHERE lower(name) %% %s AND x LIKE '%%s'")
+    assert statement.prepare_sql == "PREPARE search AS SELECT 1 FROM t WHERE lower(name) % $1 AND x LIKE '%s'"
+    assert statement.execute_sql == "EXECUTE search (%s)"
+
+def test_statement_without_parameters():
+    statement = server.PreparedStatement("count", "SELECT count(*) FROM t")
+    assert statement.prepare_sql == "PREPARE count AS SELECT count(*) FROM t"
+    assert statement.execute_sql == "EXECUTE count"
+
+@pytest.mark.parametrize("statement", [
+    server.PREPARED_ADD_DRUG, server.PREPARED_GET_DRUG, server.PREPARED_UPDATE_STOCK,
+    server.PREPARED_ADJUST_STOCK, server.PREPARED_DELETE_DRUG, server.PREPARED_DRUG_EXISTS,
+])
+def test_hot_statements_keep_their_parameter_count(statement):
+    assert "%s" not in statement.prepare_sql
+    assert statement.execute_sql.count("%s") == statement.sql.count("%s")
+
+class FakeConnection:
+    def __init__(self, status=psycopg2.extensions.TRANSACTION_STATUS_IDLE):
+        self.prepared = set()
+        self.info = self
+        self.transaction_status = status
+        self.rolled_back = False
+
+    def rollback(self):
+        self.rolled_back = True
+
+class FakeCursor:
+    def __init__(self, conn, fail_first=None):
+        self.connection = conn
+        self.fail_first = fail_first
+        self.executed = []
+
+    def execute(self, sql, params=None):
+        self.executed.append(sql)
+        if self.fail_first is not None:
+            error, self.fail_first = self.fail_first, None
+            raise error
+
+def test_prepares_once_per_connection():
+    conn = FakeConnection()
+    cur = FakeCursor(conn)
+    server.execute_prepared(cur, server.PREPARED_GET_DRUG, (1,))
+    server.execute_prepared(cur, server.PREPARED_GET_DRUG, (2,))
+    assert cur.executed == [server.PREPARED_GET_DRUG.prepare_sql] + [server.PREPARED_GET_DRUG.execute_sql] * 2
+
+def test_lost_statement_is_prepared_again():
+    conn = FakeConnection()
+    conn.prepared.add("get_drug")
+    cur = FakeCursor(conn, fail_first=psycopg2.errors.InvalidSqlStatementName())
+    server.execute_prepared(cur, server.PREPARED_GET_DRUG, (1,))
+    assert conn.rolled_back
+    assert cur.executed[1:] == ["DEALLOCATE ALL", server.PREPARED_GET_DRUG.prepare_sql,
+                                server.PREPARED_GET_DRUG.execute_sql]
+    assert conn.prepared == {"get_drug"}
+
+def test_lost_statement_mid_transaction_is_not_retried():
+    conn = FakeConnection(psycopg2.extensions.TRANSACTION_STATUS_INTRANS)
+    conn.prepared.add("get_drug")
+    cur = FakeCursor(conn, fail_first=psycopg2.errors.InvalidSqlStatementName())
+    with pytest.raises(psycopg2.errors.InvalidSqlStatementName):
+        server.execute_prepared(cur, server.PREPARED_GET_DRUG, (1,))
+    assert not conn.rolled_back and conn.prepared == set()
+
+def test_plain_connection_runs_plain_sql():
+    class Plain:
+        pass
+    cur = FakeCursor(Plain())
+    server.execute_prepared(cur, server.PREPARED_GET_DRUG, (1,))
+    assert cur.executed == [server.SQL_GET_DRUG]
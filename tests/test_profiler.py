@@ -0,0 +1,13 @@
+import profiler
+
+def test_admin_token_required(monkeypatch):
+    monkeypatch.setattr(profiler, "ADMIN_TOKEN", "s3cret")
+    assert profiler.admin_allowed("s3cret")
+    assert not profiler.admin_allowed("s3cre")
+    assert not profiler.admin_allowed("")
+    assert not profiler.admin_allowed(None)
+    assert not profiler.admin_allowed("sécret")
+
+def test_unset_token_disables_admin_calls(monkeypatch):
+    monkeypatch.setattr(profiler, "ADMIN_TOKEN", "")
+    assert not profiler.admin_allowed("")